@@ -0,0 +1,60 @@
+"""Clearing a busy month: serial deletes vs. the bulk engine.
+
+    python -m benchmarks.bulk_delete --events 300 --error-rate 0.05
+"""
+import argparse
+import asyncio
+import json
+import os
+import time
+
+from benchmarks.fake_google import FakeGoogle
+
+TOKEN = "ya29.bench-token"
+
+
+async def run(label, fake, count, **kw):
+    import bulk
+    import calendar_client
+    fake.seed(count, days=30)
+    ids = list(fake.events)
+    calls0 = fake.calls
+    t0 = time.perf_counter()
+    if label == "serial":
+        # The old delete_events_in_range loop: one DELETE round trip per event
+        ok = 0
+        for eid in ids:
+            data = await calendar_client.request("DELETE", f"{calendar_client.GOOGLE_CAL_BASE}/calendars/primary/events/{eid}", TOKEN)
+            ok += "error" not in data
+    else:
+        results = await bulk.delete_events(TOKEN, ids, **kw)
+        ok = sum(r["ok"] for r in results)
+    elapsed = time.perf_counter() - t0
+    await calendar_client.aclose()
+    return {"mode": label, "events": count, "deleted": ok, "left": len(fake.events),
+            "http_requests": fake.calls - calls0, "seconds": round(elapsed, 2)}
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--events", type=int, default=300)
+    parser.add_argument("--google-latency-ms", type=float, default=50)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--concurrency", type=int, default=8)
+    args = parser.parse_args()
+
+    fake = FakeGoogle(latency_ms=args.google_latency_ms, error_rate=args.error_rate)
+    base = fake.serve()
+    os.environ["GOOGLE_CAL_BASE"] = f"{base}/calendar/v3"
+    os.environ["GOOGLE_BATCH_URL"] = f"{base}/batch/calendar/v3"
+    # The fake has no quota; don't let the client-side limiter pace the comparison
+    os.environ["CALENDAR_USER_QPS"] = "0"
+    os.environ["CALENDAR_PROJECT_QPS"] = "0"
+
+    print(json.dumps(asyncio.run(run("serial", fake, args.events))))
+    print(json.dumps(asyncio.run(run("concurrent", fake, args.events, mode="concurrent", concurrency=args.concurrency))))
+    print(json.dumps(asyncio.run(run("batch", fake, args.events, mode="batch", concurrency=args.concurrency))))
+
+
+if __name__ == "__main__":
+    main()
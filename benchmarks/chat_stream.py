@@ -0,0 +1,92 @@
+"""Time-to-first-byte: /chat vs /chat/stream.
+
+Serves server.app on a real socket (in-process ASGI transports buffer the
+body, which would hide streaming) with the stub LLM backend, which streams
+word by word after a fixed first-token delay.
+
+    python -m benchmarks.chat_stream --requests 10
+"""
+import argparse
+import asyncio
+import json
+import os
+import statistics
+import threading
+import time
+from typing import List, Optional
+
+import httpx
+import uvicorn
+
+from benchmarks.fake_google import FakeGoogle, free_port
+
+TOKEN = "ya29.bench-token"
+# "and" keeps it off the fast path, so the agent loop (LLM -> tool -> LLM) runs
+MESSAGE = "Go through my week and tell me what needs attention"
+
+
+async def one(client: httpx.AsyncClient, path: str) -> dict:
+    body = {"messages": [{"role": "user", "content": MESSAGE}], "user_token": TOKEN, "timezone": "Asia/Kolkata"}
+    t0 = time.perf_counter()
+    first_byte: Optional[float] = None
+    first_token: Optional[float] = None
+    frames = []
+    async with client.stream("POST", path, json=body) as resp:
+        async for chunk in resp.aiter_text():
+            if first_byte is None: first_byte = time.perf_counter() - t0
+            if first_token is None and "event: token" in chunk: first_token = time.perf_counter() - t0
+            frames.append(chunk)
+    total = time.perf_counter() - t0
+    text = "".join(frames)
+    if path == "/chat":
+        answer = json.loads(text)["response"]
+        first_token = total
+    else:
+        final = [l for l in text.split("\n\n") if l.startswith("event: final")]
+        answer = json.loads(final[-1].split("data: ", 1)[1])["response"]
+    assert answer.startswith("Here is what I found"), answer[:80]
+    return {"first_byte": first_byte, "first_token": first_token, "total": total}
+
+
+async def run(base: str, n: int) -> List[dict]:
+    out = []
+    async with httpx.AsyncClient(base_url=base, timeout=None) as client:
+        for path in ("/chat", "/chat/stream"):
+            samples = [await one(client, path) for _ in range(n)]
+            out.append({"path": path, "requests": n, **{
+                f"{k}_ms": round(statistics.median(s[k] for s in samples) * 1000, 1)
+                for k in ("first_byte", "first_token", "total")}})
+    return out
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--requests", type=int, default=10)
+    parser.add_argument("--google-latency-ms", type=float, default=50)
+    parser.add_argument("--first-token-ms", type=float, default=300)
+    parser.add_argument("--token-ms", type=float, default=20)
+    args = parser.parse_args()
+
+    fake = FakeGoogle(latency_ms=args.google_latency_ms)
+    base = fake.serve()
+    os.environ["GOOGLE_CAL_BASE"] = f"{base}/calendar/v3"
+    os.environ["GOOGLE_TOKENINFO_URL"] = f"{base}/oauth2/v1/tokeninfo"
+    os.environ["LLM_BACKEND"] = "stub"
+    os.environ["LLM_STUB_LATENCY_MS"] = str(args.first_token_ms)
+    os.environ["LLM_STUB_TOKEN_MS"] = str(args.token_ms)
+    os.environ["LLM_CACHE"] = "0"
+
+    import server
+
+    port = free_port()
+    backend = uvicorn.Server(uvicorn.Config(server.app, host="127.0.0.1", port=port, log_level="warning"))
+    threading.Thread(target=backend.run, daemon=True).start()
+    while not backend.started:
+        time.sleep(0.01)
+
+    for res in asyncio.run(run(f"http://127.0.0.1:{port}", args.requests)):
+        print(json.dumps(res))
+
+
+if __name__ == "__main__":
+    main()
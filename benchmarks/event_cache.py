@@ -0,0 +1,73 @@
+"""Calendar API calls and latency per chat turn, with and without the event cache.
+
+One "turn" mirrors a typical agent conversation: list, list again, reschedule,
+list to confirm.
+
+    python -m benchmarks.event_cache --turns 20
+"""
+import argparse
+import asyncio
+import json
+import os
+import time
+from datetime import datetime, timedelta
+
+from benchmarks.fake_google import FakeGoogle
+
+TOKEN = "ya29.bench-token"
+
+
+async def run(turns: int, cached: bool, fake: FakeGoogle):
+    import calendar_client
+    import event_store
+    import tools
+    from calendar_client import DEFAULT_TZ, GOOGLE_CAL_BASE
+
+    async def list_uncached():
+        # What every list_events did before the cache: one events.list per call
+        now = datetime.now(DEFAULT_TZ)
+        params = {"timeMin": now.isoformat(), "timeMax": (now + timedelta(days=7)).isoformat(),
+                  "singleEvents": "true", "orderBy": "startTime"}
+        return await calendar_client.request("GET", f"{GOOGLE_CAL_BASE}/calendars/primary/events", TOKEN, params=params)
+
+    list_fn = (lambda: tools.list_events(TOKEN)) if cached else list_uncached
+    event_store.stores.clear()
+    await tools.validate_token(TOKEN)
+    start_calls = fake.calls
+    t0 = time.perf_counter()
+    for i in range(turns):
+        await list_fn()
+        await list_fn()
+        event_id = next(iter(fake.events))
+        await tools.reschedule_event(TOKEN, event_id, f"Moved {i}",
+                                     (datetime.now(DEFAULT_TZ) + timedelta(hours=2)).isoformat(),
+                                     (datetime.now(DEFAULT_TZ) + timedelta(hours=3)).isoformat())
+        await list_fn()
+    elapsed = time.perf_counter() - t0
+    await calendar_client.aclose()
+    return {
+        "cached": cached,
+        "turns": turns,
+        "google_calls_per_turn": round((fake.calls - start_calls) / turns, 2),
+        "ms_per_turn": round(elapsed / turns * 1000, 1),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--turns", type=int, default=20)
+    parser.add_argument("--events", type=int, default=200)
+    parser.add_argument("--google-latency-ms", type=float, default=50)
+    args = parser.parse_args()
+
+    fake = FakeGoogle(latency_ms=args.google_latency_ms, events=args.events)
+    base = fake.serve()
+    os.environ["GOOGLE_CAL_BASE"] = f"{base}/calendar/v3"
+    os.environ["GOOGLE_TOKENINFO_URL"] = f"{base}/oauth2/v1/tokeninfo"
+
+    for cached in (False, True):
+        print(json.dumps(asyncio.run(run(args.turns, cached, fake))))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,389 @@
+"""Local stand-in for the Google endpoints the backend talks to.
+
+Serves tokeninfo, calendarList, the Calendar v3 events collection (including incremental
+sync tokens), freeBusy and the batch endpoint from memory with a configurable per-request
+latency, so benchmarks never touch the network. The seeded events are the primary
+calendar; add_calendar() adds read-only team/shared calendars with their own latency
+and failure. events.watch channels get
+push notifications POSTed to their address on every write. Faults can be injected on the
+Calendar routes: a share of 503s, a hanging outage, and a per-token quota that
+answers 429 like Google's per-user rate limit.
+"""
+import asyncio
+import json
+import multiprocessing
+import random
+import re
+import socket
+import threading
+import time
+import uuid
+from datetime import datetime, timedelta, timezone
+
+import httpx
+import uvicorn
+from fastapi import FastAPI, Request, Response
+
+CALENDAR_SCOPE = "https://www.googleapis.com/auth/calendar"
+
+
+def _select(page: dict, fields: str) -> dict:
+    # Just enough of the partial-response syntax for "items(a,b),nextPageToken"
+    out = {}
+    for part in re.findall(r"(\w+)(?:\(([^)]*)\))?", fields):
+        name, sub = part
+        if name not in page:
+            continue
+        if sub and name == "items":
+            keep = sub.split(",")
+            out[name] = [{k: v for k, v in item.items() if k in keep} for item in page[name]]
+        else:
+            out[name] = page[name]
+    return out
+
+
+def _parse(ts: str) -> datetime:
+    return datetime.fromisoformat(ts.replace("Z", "+00:00"))
+
+
+class FakeGoogle:
+    def __init__(self, latency_ms: float = 50.0, events: int = 20, days: int = 7, error_rate: float = 0.0):
+        self.latency = latency_ms / 1000.0
+        self.error_rate = error_rate   # share of writes answered with 429
+        self.flaky = 0.0               # share of any Calendar call answered with 503
+        self.outage = 0.0              # > 0: Calendar calls hang this many seconds, then 503
+        self.quota_qps = 0             # > 0: per-token requests per second before 429
+        self._quota = {}               # token -> (window second, count)
+        self.rejected = 0
+        self.channels = {}             # events.watch channel id -> request body
+        self.pushes = 0
+        self._tasks = set()
+        self.events = {}
+        self.calendars = {}            # extra calendar id -> {"summary", "events", "latency", "fail", "selected"}
+        self.version = 0
+        self.changed = {}      # event id -> version of its last change (tombstones included)
+        self.calls = 0
+        self.tokeninfo_calls = 0
+        self.pages = 0
+        self.bytes_out = 0
+        self.writes = 0
+        self.app = self._build_app()
+        self.seed(events, days)
+
+    def seed(self, count: int, days: int = 7):
+        self.events.clear()
+        self.changed.clear()
+        for body in self._spread(count, days):
+            self._insert(body)
+
+    @staticmethod
+    def _spread(count: int, days: int, title: str = "Event", offset_minutes: int = 0):
+        # `count` 30-minute events evenly over the next `days` days
+        start = datetime.now(timezone.utc).replace(minute=0, second=0, microsecond=0) + timedelta(minutes=offset_minutes)
+        for i in range(count):
+            s = start + timedelta(minutes=(i * days * 24 * 60) // max(count, 1))
+            yield {
+                "summary": f"{title} {i}",
+                # The kind of payload real events carry and the tools never read
+                "description": "Agenda: review open items, walk through the roadmap, assign owners. " * 3,
+                "attendees": [{"email": f"person{j}@example.com", "responseStatus": "accepted"} for j in range(4)],
+                "creator": {"email": "owner@example.com"},
+                "start": {"dateTime": s.isoformat()},
+                "end": {"dateTime": (s + timedelta(minutes=30)).isoformat()},
+            }
+
+    def add_calendar(self, calendar_id: str, summary: str = None, events: int = 20, days: int = 7,
+                     latency_ms: float = 0.0, fail: int = None, selected: bool = True, offset_minutes: int = 0):
+        """A read-only extra calendar in calendarList: its own events, extra latency, and optionally
+        an HTTP status (403/404/503) every read of it answers with."""
+        items = {}
+        for body in self._spread(events, days, summary or calendar_id, offset_minutes):
+            event = dict(body, id=uuid.uuid4().hex, status="confirmed", etag='"1"')
+            items[event["id"]] = event
+        self.calendars[calendar_id] = {"summary": summary or calendar_id, "events": items,
+                                       "latency": latency_ms / 1000.0, "fail": fail, "selected": selected}
+
+    def _touch(self, event_id: str):
+        self.version += 1
+        self.changed[event_id] = self.version
+        if event_id in self.events:
+            self.events[event_id]["etag"] = f'"{self.version}"'
+
+    def _insert(self, body: dict) -> dict:
+        event = dict(body, id=uuid.uuid4().hex, status="confirmed", htmlLink="https://calendar.local/event")
+        self.events[event["id"]] = event
+        self._touch(event["id"])
+        return event
+
+    def _notify(self, state: str, channels=None):
+        # Like Google: fire-and-forget POSTs to each channel's webhook
+        for channel in list(channels or self.channels.values()):
+            task = asyncio.get_running_loop().create_task(self._push(channel, state))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+
+    async def _push(self, channel: dict, state: str):
+        self.pushes += 1
+        headers = {"X-Goog-Channel-ID": channel["id"], "X-Goog-Channel-Token": channel.get("token", ""),
+                   "X-Goog-Resource-State": state, "X-Goog-Resource-ID": channel["resourceId"],
+                   "X-Goog-Message-Number": str(self.pushes)}
+        try:
+            async with httpx.AsyncClient(timeout=5) as client:
+                await client.post(channel["address"], headers=headers)
+        except httpx.HTTPError:
+            pass
+
+    def write(self, method: str, event_id, body, if_match: str = None):
+        """Apply one insert/patch/delete; returns (status, payload). Shared by the REST and batch routes."""
+        self.writes += 1
+        if self.error_rate and random.random() < self.error_rate:
+            return 429, {"error": {"code": 429, "message": "Rate Limit Exceeded"}}
+        status, data = self._apply(method, event_id, body, if_match)
+        if status < 300 and self.channels:
+            self._notify("exists")
+        return status, data
+
+    def _apply(self, method: str, event_id, body, if_match: str = None):
+        if method == "POST":
+            return 200, self._insert(body)
+        if event_id not in self.events:
+            return 404, {"error": {"code": 404, "message": "Not Found"}}
+        if if_match and if_match != self.events[event_id]["etag"]:
+            return 412, {"error": {"code": 412, "message": "Precondition Failed"}}
+        if method == "PATCH":
+            self.events[event_id].update(body)
+            self._touch(event_id)
+            return 200, self.events[event_id]
+        del self.events[event_id]
+        self._touch(event_id)
+        return 204, None
+
+    def _fault(self, request):
+        """503/429 to inject for this Calendar call, or None."""
+        if self.quota_qps:
+            token, now = request.headers.get("authorization", ""), int(time.monotonic())
+            window, count = self._quota.get(token, (now, 0))
+            count = count + 1 if window == now else 1
+            self._quota[token] = (now, count)
+            if count > self.quota_qps:
+                return 429
+        if self.flaky and random.random() < self.flaky:
+            return 503
+        return None
+
+    @staticmethod
+    def _respond(status, data):
+        if data is None:
+            return Response(status_code=status)
+        return Response(status_code=status, content=json.dumps(data), media_type="application/json")
+
+    def _build_app(self) -> FastAPI:
+        app = FastAPI()
+
+        @app.middleware("http")
+        async def latency(request, call_next):
+            if request.url.path.startswith("/_bench/"):
+                return await call_next(request)
+            self.calls += 1
+            if request.url.path.startswith(("/calendar/", "/batch/")):
+                if self.outage:
+                    await asyncio.sleep(self.outage)
+                    self.rejected += 1
+                    return self._respond(503, {"error": {"code": 503, "message": "Backend Error"}})
+                status = self._fault(request)
+                if status:
+                    self.rejected += 1
+                    await asyncio.sleep(self.latency)
+                    message = "Rate Limit Exceeded" if status == 429 else "Backend Error"
+                    resp = self._respond(status, {"error": {"code": status, "message": message}})
+                    if status == 429:
+                        resp.headers["Retry-After"] = "1"
+                    return resp
+            await asyncio.sleep(self.latency)
+            return await call_next(request)
+
+        @app.post("/_bench/seed")
+        async def reseed(count: int = 20, days: int = 7):
+            # Control route for drivers that run the fake in another process (serve_forked)
+            self.seed(count, days)
+            return {"events": len(self.events)}
+
+        @app.get("/_bench/stats")
+        async def counters():
+            return {"calls": self.calls, "tokeninfo_calls": self.tokeninfo_calls, "pages": self.pages,
+                    "writes": self.writes, "rejected": self.rejected, "pushes": self.pushes}
+
+        @app.get("/oauth2/v1/tokeninfo")
+        async def tokeninfo(access_token: str = ""):
+            self.tokeninfo_calls += 1
+            if not access_token.startswith("ya29."):
+                return Response(status_code=400, content='{"error": "invalid_token"}')
+            return {"scope": CALENDAR_SCOPE, "expires_in": 3599, "user_id": access_token[-8:]}
+
+        @app.get("/calendar/v3/users/me/calendarList")
+        async def calendar_list():
+            items = [{"id": "owner@example.com", "summary": "owner@example.com", "primary": True,
+                      "selected": True, "accessRole": "owner"}]
+            items += [{"id": cal, "summary": c["summary"], "selected": c["selected"], "accessRole": "reader"}
+                      for cal, c in self.calendars.items()]
+            return {"kind": "calendar#calendarList", "items": items}
+
+        @app.get("/calendar/v3/calendars/{cal}/events")
+        async def list_events(cal: str, timeMin: str = None, timeMax: str = None, syncToken: str = None,
+                              pageToken: str = None, maxResults: int = 250, fields: str = None):
+            # Any id that isn't an extra calendar is the primary
+            extra = self.calendars.get(cal)
+            if extra:
+                await asyncio.sleep(extra["latency"])
+                if extra["fail"]:
+                    return self._respond(extra["fail"], {"error": {"code": extra["fail"], "message": "Calendar unavailable"}})
+            events, version = (extra["events"], 0) if extra else (self.events, self.version)
+            if syncToken is not None:
+                since = int(syncToken)
+                if since > version:
+                    return Response(status_code=410, content='{"error": "Sync token is no longer valid"}')
+                items = [] if extra else [self.events.get(eid, {"id": eid, "status": "cancelled"})
+                                          for eid, v in self.changed.items() if v > since]
+            else:
+                lo = _parse(timeMin) if timeMin else None
+                hi = _parse(timeMax) if timeMax else None
+                items = []
+                for e in events.values():
+                    s, en = _parse(e["start"]["dateTime"]), _parse(e["end"]["dateTime"])
+                    if (lo and en <= lo) or (hi and s >= hi):
+                        continue
+                    items.append(e)
+                items.sort(key=lambda e: _parse(e["start"]["dateTime"]))
+
+            offset = int(pageToken or 0)
+            size = min(maxResults, 2500)
+            page = {"kind": "calendar#events", "items": items[offset:offset + size]}
+            if offset + size < len(items):
+                page["nextPageToken"] = str(offset + size)
+            elif not (timeMin or timeMax):
+                page["nextSyncToken"] = str(version)
+            if fields:
+                page = _select(page, fields)
+            body = json.dumps(page)
+            self.pages += 1
+            self.bytes_out += len(body)
+            return Response(content=body, media_type="application/json")
+
+        @app.post("/calendar/v3/calendars/{cal}/events/watch")
+        async def watch_events(cal: str, request: Request):
+            body = await request.json()
+            ttl = int(body.get("params", {}).get("ttl", 604800))
+            channel = dict(body, resourceId=uuid.uuid4().hex)
+            self.channels[body["id"]] = channel
+            self._notify("sync", [channel])
+            return {"kind": "api#channel", "id": body["id"], "resourceId": channel["resourceId"],
+                    "resourceUri": f"/calendar/v3/calendars/{cal}/events", "token": body.get("token"),
+                    "expiration": str(int((time.time() + ttl) * 1000))}
+
+        @app.post("/calendar/v3/calendars/{cal}/events")
+        async def insert_event(cal: str, request: Request):
+            return self._respond(*self.write("POST", None, await request.json()))
+
+        @app.patch("/calendar/v3/calendars/{cal}/events/{event_id}")
+        async def patch_event(cal: str, event_id: str, request: Request):
+            return self._respond(*self.write("PATCH", event_id, await request.json(), request.headers.get("if-match")))
+
+        @app.get("/calendar/v3/calendars/{cal}/events/{event_id}")
+        async def get_event(cal: str, event_id: str, fields: str = None):
+            if event_id not in self.events:
+                return self._respond(404, {"error": {"code": 404, "message": "Not Found"}})
+            event = self.events[event_id]
+            if fields:
+                event = {k: v for k, v in event.items() if k in fields.split(",")}
+            return event
+
+        @app.delete("/calendar/v3/calendars/{cal}/events/{event_id}")
+        async def delete_event(cal: str, event_id: str):
+            return self._respond(*self.write("DELETE", event_id, None))
+
+        @app.post("/calendar/v3/freeBusy")
+        async def free_busy(request: Request):
+            body = await request.json()
+            lo, hi = _parse(body["timeMin"]), _parse(body["timeMax"])
+
+            def blocks(events):
+                busy = []
+                for e in events.values():
+                    s, en = _parse(e["start"]["dateTime"]), _parse(e["end"]["dateTime"])
+                    if en > lo and s < hi and e.get("transparency") != "transparent":
+                        busy.append((s, en))
+                return [{"start": s.isoformat(), "end": en.isoformat()} for s, en in sorted(busy)]
+
+            out = {}
+            for item in body.get("items", []):
+                extra = self.calendars.get(item["id"])
+                if extra and extra["fail"]:
+                    out[item["id"]] = {"errors": [{"domain": "global", "reason": "notFound"}], "busy": []}
+                else:
+                    # Unknown ids see the primary's events
+                    out[item["id"]] = {"busy": blocks(extra["events"] if extra else self.events)}
+            await asyncio.sleep(max((self.calendars[i["id"]]["latency"] for i in body.get("items", [])
+                                     if i["id"] in self.calendars), default=0))
+            return {"kind": "calendar#freeBusy", "calendars": out}
+
+        @app.post("/batch/calendar/v3")
+        async def batch(request: Request):
+            boundary = request.headers["content-type"].split("boundary=", 1)[1]
+            body = (await request.body()).decode("utf-8")
+            out_boundary = f"batch_{uuid.uuid4().hex}"
+            out = []
+            for part in body.split(f"--{boundary}"):
+                part = part.strip()
+                if not part or part == "--":
+                    continue
+                outer, _, inner = part.replace("\r\n", "\n").partition("\n\n")
+                cid = re.search(r"Content-ID: <(.*?)>", outer).group(1)
+                request_line, _, rest = inner.partition("\n")
+                method, path, _ = request_line.split(" ", 2)
+                _, _, payload = rest.partition("\n\n")
+                event_id = path.split("/events/", 1)[1] if "/events/" in path else None
+                status, data = self.write(method, event_id, json.loads(payload) if payload.strip() else None)
+                text = json.dumps(data) if data is not None else ""
+                out.append(f"--{out_boundary}\r\nContent-Type: application/http\r\nContent-ID: <response-{cid}>\r\n\r\n"
+                           f"HTTP/1.1 {status} X\r\nContent-Type: application/json\r\n\r\n{text}\r\n")
+            out.append(f"--{out_boundary}--\r\n")
+            return Response(content="".join(out), media_type=f"multipart/mixed; boundary={out_boundary}")
+
+        return app
+
+    def serve(self) -> str:
+        """Start uvicorn on a free localhost port in a daemon thread; returns the base URL."""
+        port = free_port()
+        server = uvicorn.Server(uvicorn.Config(self.app, host="127.0.0.1", port=port, log_level="warning", backlog=4096))
+        threading.Thread(target=server.run, daemon=True).start()
+        while not server.started:
+            time.sleep(0.01)
+        self.server = server
+        return f"http://127.0.0.1:{port}"
+
+    def serve_forked(self) -> str:
+        """Like serve(), but in a forked process so it doesn't share the caller's heap.
+
+        Counters (calls, pages, bytes_out) stay in the child; read them through GET /_bench/stats.
+        """
+        port = free_port()
+        proc = multiprocessing.get_context("fork").Process(
+            target=uvicorn.run, args=(self.app,), kwargs={"host": "127.0.0.1", "port": port, "log_level": "warning"},
+            daemon=True)
+        proc.start()
+        while True:
+            try:
+                socket.create_connection(("127.0.0.1", port), timeout=0.1).close()
+                break
+            except OSError:
+                time.sleep(0.05)
+        self.process = proc
+        return f"http://127.0.0.1:{port}"
+
+
+def free_port() -> int:
+    sock = socket.socket()
+    sock.bind(("127.0.0.1", 0))
+    port = sock.getsockname()[1]
+    sock.close()
+    return port
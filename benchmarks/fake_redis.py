@@ -0,0 +1,101 @@
+"""Local stand-in for a Redis server (RESP2), for exercising SHARED_STATE=redis://.
+
+Implements only what shared_state.py sends: PING, AUTH, SELECT, GET, SET
+(with EX/PX), DEL, INCR, EXPIRE, DBSIZE, FLUSHALL. Keys expire lazily on read.
+"""
+import asyncio
+import threading
+import time
+
+from benchmarks.fake_google import free_port
+
+
+class FakeRedis:
+    def __init__(self):
+        self.data = {}        # key -> (value, expires_at or None)
+        self.commands = 0
+
+    def _get(self, key):
+        entry = self.data.get(key)
+        if entry is None:
+            return None
+        if entry[1] is not None and entry[1] <= time.monotonic():
+            del self.data[key]
+            return None
+        return entry[0]
+
+    def execute(self, args):
+        self.commands += 1
+        cmd = args[0].upper()
+        if cmd == b"PING":
+            return "+PONG"
+        if cmd in (b"AUTH", b"SELECT"):
+            return "+OK"
+        if cmd == b"GET":
+            return self._get(args[1])
+        if cmd == b"SET":
+            expires = None
+            if len(args) >= 5:
+                unit = 1000.0 if args[3].upper() == b"PX" else 1.0
+                expires = time.monotonic() + int(args[4]) / unit
+            self.data[args[1]] = (args[2], expires)
+            return "+OK"
+        if cmd == b"DEL":
+            return sum(self.data.pop(k, None) is not None for k in args[1:])
+        if cmd == b"INCR":
+            value = int(self._get(args[1]) or 0) + 1
+            self.data[args[1]] = (str(value).encode(), self.data.get(args[1], (None, None))[1])
+            return value
+        if cmd == b"EXPIRE":
+            if self._get(args[1]) is None:
+                return 0
+            self.data[args[1]] = (self.data[args[1]][0], time.monotonic() + int(args[2]))
+            return 1
+        if cmd == b"DBSIZE":
+            return len(self.data)
+        if cmd == b"FLUSHALL":
+            self.data.clear()
+            return "+OK"
+        return f"-ERR unknown command '{cmd.decode()}'"
+
+    @staticmethod
+    def _encode(reply) -> bytes:
+        if reply is None:
+            return b"$-1\r\n"
+        if isinstance(reply, str):
+            return reply.encode() + b"\r\n"
+        if isinstance(reply, int):
+            return b":%d\r\n" % reply
+        return b"$%d\r\n%s\r\n" % (len(reply), reply)
+
+    async def _client(self, reader, writer):
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                args = []
+                for _ in range(int(line[1:-2])):
+                    size = int((await reader.readline())[1:-2])
+                    args.append((await reader.readexactly(size + 2))[:-2])
+                writer.write(self._encode(self.execute(args)))
+                await writer.drain()
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+    def serve(self, port: int = None) -> str:
+        """Start on localhost (a free port by default) in a daemon thread; returns a redis:// URL."""
+        port = port or free_port()
+        started = threading.Event()
+
+        async def main():
+            server = await asyncio.start_server(self._client, "127.0.0.1", port)
+            started.set()
+            async with server:
+                await server.serve_forever()
+
+        threading.Thread(target=asyncio.run, args=(main(),), daemon=True).start()
+        started.wait()
+        return f"redis://127.0.0.1:{port}/0"
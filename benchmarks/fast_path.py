@@ -0,0 +1,176 @@
+"""Fast-path intent parser: hit rate, accuracy and end-to-end latency saved.
+
+Runs a labelled corpus of chat openers through fast_path.parse(), then
+through the whole graph (LLM_BACKEND=stub, fake Google) with the fast path on and off.
+
+    python -m benchmarks.fast_path
+"""
+import argparse
+import asyncio
+import contextlib
+import io
+import json
+import os
+import statistics
+import time
+from datetime import datetime
+
+from benchmarks.fake_google import FakeGoogle
+
+TOKEN = "ya29.bench-token"
+
+# (message, tool the fast path should pick, or None if it must defer to the LLM)
+CORPUS = [
+    ("show my events this week", "list_events"),
+    ("What's on my calendar tomorrow?", "list_events"),
+    ("what do I have today", "list_events"),
+    ("list my meetings for the next 3 days", "list_events"),
+    ("Show me my schedule", "list_events"),
+    ("what's on today", "list_events"),
+    ("can you show my agenda for next week", "list_events"),
+    ("What are my appointments this week?", "list_events"),
+    ("display my calendar", "list_events"),
+    ("Show upcoming events", "list_events"),
+    ("delete everything tomorrow", "delete_events_in_range"),
+    ("delete all my events on friday", "delete_events_in_range"),
+    ("cancel all meetings today", "delete_events_in_range"),
+    ("clear my calendar this week", "delete_events_in_range"),
+    ("Please clear my schedule for tomorrow", "delete_events_in_range"),
+    ("Schedule 'Gym' for tomorrow at 6pm for 1 hour", "add_event"),
+    ("Schedule lunch with Sam tomorrow at 1pm", "add_event"),
+    ("book dentist on friday at 14:30 for 45 minutes", "add_event"),
+    ("add focus time tomorrow at 9am for 2 hours", "add_event"),
+    ("put yoga on saturday at 7am for 30 minutes", "add_event"),
+    ("schedule a meeting tomorrow at 10 AM", "add_event"),
+    ("schedule a 30 minute call tomorrow at 4pm", "add_event"),
+    ("add lunch with Sam to my calendar tomorrow at 1pm", "add_event"),
+    ("book meeting with John at 3pm friday", "add_event"),
+    ("book dentist on monday at 10", "add_event"),
+    ("book a 45-min sync with Ana tomorrow at 11am", "add_event"),
+    # Must fall through to the model
+    ("Book a client call.", None),
+    ("Clear my schedule for the rest of January", None),
+    ("Team standup every Monday at 10am for 4 weeks", None),
+    ("Move the 'Weekly Sync' to 4pm.", None),
+    ("Find me a 45-minute slot today after 2pm to review proposals.", None),
+    ("Shift my remaining schedule by 15 minutes.", None),
+    ("delete the gym session", None),
+    ("am I free on thursday afternoon?", None),
+    ("show me events and delete the gym one", None),
+    ("hello", None),
+    ("what's the weather today", None),
+    ("schedule something next week", None),
+    ("delete everything", None),
+    ("Can you rename my 3pm meeting to Planning?", None),
+    ("book a room for the offsite", None),
+    ("reschedule my dentist appointment to next tuesday", None),
+    ("delete everything next friday", None),
+    ("Book 'Design review' next monday at 11am", None),
+    ("cancel the standup tomorrow but keep the rest", None),
+    ("What did I do last week?", None),
+    ("show me the events from last week", None),
+    ("what's on my calendar yesterday", None),
+    ("what's on my calendar next month", None),
+    ("Tell me about the meetings I had", None),
+    ("show my meetings on friday", None),
+    ("what's on my calendar this weekend", None),
+    ("book 1:1 with Priya tomorrow at 5pm", None),
+    ("schedule gym at 10ish tomorrow", None),
+]
+
+# What a booking must come out as, not just which tool: (title, minutes, hour)
+EXPECTED_ADD = {
+    "Schedule 'Gym' for tomorrow at 6pm for 1 hour": ("Gym", 60, 18),
+    "Schedule lunch with Sam tomorrow at 1pm": ("Lunch with Sam", 60, 13),
+    "book dentist on friday at 14:30 for 45 minutes": ("Dentist", 45, 14),
+    "add focus time tomorrow at 9am for 2 hours": ("Focus time", 120, 9),
+    "put yoga on saturday at 7am for 30 minutes": ("Yoga", 30, 7),
+    "schedule a meeting tomorrow at 10 AM": ("Meeting", 60, 10),
+    "schedule a 30 minute call tomorrow at 4pm": ("Call", 30, 16),
+    "add lunch with Sam to my calendar tomorrow at 1pm": ("Lunch with Sam", 60, 13),
+    "book meeting with John at 3pm friday": ("Meeting with John", 60, 15),
+    "book dentist on monday at 10": ("Dentist", 60, 10),
+    "book a 45-min sync with Ana tomorrow at 11am": ("Sync with Ana", 45, 11),
+}
+
+
+def booked_as(cmd):
+    start, end = (datetime.fromisoformat(cmd["args"][k]) for k in ("start_iso", "end_iso"))
+    return cmd["args"]["summary"], int((end - start).total_seconds() // 60), start.hour
+
+
+async def run_graph(enabled):
+    import fast_path
+    import graph
+    import llm
+    from langchain_core.messages import HumanMessage
+    fast_path.ENABLED = enabled
+    llm.stats.clear()
+    latencies = []
+    for message, _ in CORPUS:
+        t0 = time.perf_counter()
+        await graph.app.ainvoke({
+            "messages": [HumanMessage(content=message)],
+            "user_token": TOKEN, "current_time": datetime.now().isoformat(), "user_timezone": "Asia/Kolkata",
+            "current_action": None, "pending_details": None, "route": None,
+        })
+        latencies.append(time.perf_counter() - t0)
+    return {
+        "fast_path": enabled,
+        "mean_ms": round(statistics.mean(latencies) * 1000, 1),
+        "p50_ms": round(statistics.median(latencies) * 1000, 1),
+        "llm_calls_per_message": round(llm.stats["calls"] / len(CORPUS), 2),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--llm-latency-ms", type=float, default=800)
+    parser.add_argument("--google-latency-ms", type=float, default=50)
+    args = parser.parse_args()
+
+    fake = FakeGoogle(latency_ms=args.google_latency_ms, events=50)
+    base = fake.serve()
+    os.environ["GOOGLE_CAL_BASE"] = f"{base}/calendar/v3"
+    os.environ["GOOGLE_TOKENINFO_URL"] = f"{base}/oauth2/v1/tokeninfo"
+    os.environ["GOOGLE_BATCH_URL"] = f"{base}/batch/calendar/v3"
+    os.environ["LLM_BACKEND"] = "stub"
+    os.environ["LLM_STUB_LATENCY_MS"] = str(args.llm_latency_ms)
+    os.environ["LLM_CACHE"] = "0"
+
+    import fast_path
+    from calendar_client import DEFAULT_TZ
+
+    now = datetime.now(DEFAULT_TZ)
+    hits = correct = false_hits = wrong_args = 0
+    t0 = time.perf_counter()
+    for message, expected in CORPUS:
+        cmd = fast_path.parse(message, now)
+        if cmd is not None:
+            hits += 1
+            if cmd["tool"] != expected:
+                if expected is None: false_hits += 1
+            elif expected != "add_event" or booked_as(cmd) == EXPECTED_ADD[message]:
+                correct += 1
+            else:
+                wrong_args += 1
+        elif expected is None:
+            correct += 1
+    parse_us = (time.perf_counter() - t0) / len(CORPUS) * 1e6
+    print(json.dumps({
+        "messages": len(CORPUS),
+        "served_without_llm_pct": round(100 * hits / len(CORPUS), 1),
+        "accuracy_pct": round(100 * correct / len(CORPUS), 1),
+        "false_hits": false_hits,
+        "wrong_booking_args": wrong_args,
+        "parse_us": round(parse_us, 1),
+    }))
+
+    for enabled in (False, True):
+        with contextlib.redirect_stdout(io.StringIO()):
+            res = asyncio.run(run_graph(enabled))
+        print(json.dumps(res))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,181 @@
+"""Resolving an event by name: find_event (local title index) vs. list_events.
+
+A fake calendar of 10k events over a year, with realistic titles: recurring
+series ("Weekly Sync", "Team Standup", ...) plus one-off meetings built from
+topic / kind / person words. Measures, on a warm event cache:
+
+1. What the agent has to read to get an ID: list_events(days=7) output vs.
+   find_event output (characters, estimated tokens), and whether the wanted
+   event is in it at all.
+2. Query latency of the index vs. scoring every title (same matching rules),
+   for exact, prefix, typo and windowed queries.
+3. Accuracy on 300 queries made from one-off titles the way people say
+   them: lowercase, a word cut to its start, a typo (two letters swapped or
+   one dropped): share where a matching title is first / in the top 5.
+4. Google calls made by those queries, and what the index costs to build
+   (time and memory for 10k titles).
+
+    python -m benchmarks.find_event --events 10000
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import statistics
+import time
+import tracemalloc
+from datetime import datetime, timedelta
+
+from benchmarks.fake_google import FakeGoogle
+
+TOKEN = "ya29.bench-token"
+
+SERIES = ["Weekly Sync", "Team Standup", "Sprint Planning", "Design Review", "1:1 with Priya", "1:1 with Marco",
+          "Product Roadmap", "Customer Check-in", "Gym", "Lunch with Sam", "Infra On-call Handover",
+          "Hiring Committee", "Board Prep", "Office Hours", "Retro", "Marketing Sync", "Budget Review",
+          "All Hands", "Security Review", "Data Platform Sync"]
+TOPICS = ["Billing", "Onboarding", "Search", "Mobile", "Payments", "Analytics", "Pricing", "Checkout", "Growth",
+          "Localization", "Accessibility", "Compliance", "Migration", "Partnerships", "Recruiting", "Support",
+          "Notifications", "Reporting", "Identity", "Storage", "Latency", "Kubernetes", "Forecast", "Renewal"]
+KINDS = ["kickoff", "review", "workshop", "deep dive", "postmortem", "demo", "interview", "planning", "brainstorm",
+         "handoff", "training", "offsite", "sync", "escalation", "walkthrough"]
+PEOPLE = ["Aisha", "Bruno", "Chen", "Dmitri", "Elena", "Farah", "Gustavo", "Hiroshi", "Ingrid", "Jamal", "Kofi",
+          "Leila", "Mateo", "Nadia", "Oskar", "Pooja", "Quentin", "Rosa", "Santiago", "Tariq", "Uma", "Viktor"]
+
+
+def retitle(fake: FakeGoogle, rng: random.Random):
+    """Give the fake's seeded events realistic titles: ~40% recurring series, the rest one-offs."""
+    for i, event in enumerate(sorted(fake.events.values(), key=lambda e: e["start"]["dateTime"])):
+        if rng.random() < 0.4:
+            event["summary"] = SERIES[i % len(SERIES)]
+        else:
+            event["summary"] = f"{rng.choice(TOPICS)} {rng.choice(KINDS)} with {rng.choice(PEOPLE)}"
+
+
+def typo(word: str, rng: random.Random) -> str:
+    i = rng.randrange(1, len(word) - 2)
+    if rng.random() < 0.5:
+        return word[:i] + word[i + 1] + word[i] + word[i + 2:]   # swapped
+    return word[:i] + word[i + 1:]                              # dropped
+
+
+def make_query(title: str, rng: random.Random) -> str:
+    words = title.lower().split()
+    long_words = [i for i, w in enumerate(words) if len(w) >= 6]
+    if long_words:
+        i, j = rng.choice(long_words), rng.choice(long_words)
+        if i == j: words[i] = typo(words[i], rng)
+        else: words[i], words[j] = words[i][:4], typo(words[j], rng)   # "onbo" for "onboarding"
+    return "the " + " ".join(words)
+
+
+def scan(store, query: str):
+    """Same scores as TitleIndex.search, by scoring every title: what a lookup costs without the index."""
+    import event_index
+    words = event_index.query_tokens(query)
+    scores = {}
+    for event_id, event in store.events.items():
+        terms = event_index.tokens(event.get("summary", ""))
+        total = 0.0
+        for word in words:
+            best, limit = 0.0, event_index.max_edits(word)
+            for term in terms:
+                if term == word: best = event_index.EXACT
+                elif len(word) >= event_index.MIN_PREFIX and term.startswith(word): best = max(best, event_index.PREFIX)
+                elif limit:
+                    d = event_index.edit_distance(word, term, limit)
+                    if d <= limit: best = max(best, event_index.FUZZY - 0.2 * (d - 1))
+            total += best
+        if total: scores[event_id] = total
+    return scores
+
+
+def timed_us(fn, n: int) -> float:
+    samples = []
+    for _ in range(n):
+        t0 = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - t0) * 1e6)
+    return round(statistics.median(samples), 1)
+
+
+async def run(args, fake):
+    import event_index
+    import event_store
+    import graph
+    import tools
+    from calendar_client import DEFAULT_TZ
+
+    t0 = time.perf_counter()
+    assert "error" not in await event_store.list_window(TOKEN, datetime.now(DEFAULT_TZ), datetime.now(DEFAULT_TZ))
+    first_sync_ms = (time.perf_counter() - t0) * 1000
+    store = event_store.stores.get(TOKEN)
+    rng = random.Random(11)
+    result = {"events": len(store.events), "first_sync_ms": round(first_sync_ms), "distinct_tokens": len(store.titles._vocab)}
+
+    # 1. What the agent reads to get an ID
+    one_offs = [e for e in store.events.values() if " with " in e["summary"] and e["summary"] not in SERIES]
+    targets = rng.sample(one_offs, args.queries)
+    listing = await tools.list_events(TOKEN, days=7)
+    found = await tools.find_event(TOKEN, "weekly sync")
+    result["read_to_resolve"] = {
+        "list_events_7d_chars": len(listing), "list_events_7d_tokens": graph.estimate_tokens(listing),
+        "find_event_chars": len(found), "find_event_tokens": graph.estimate_tokens(found),
+        "targets_in_7d_listing": sum(t["id"] in listing for t in targets) / len(targets),
+    }
+
+    # 2. Lookup latency: index vs. scoring every title
+    friday = datetime.now(DEFAULT_TZ) + timedelta(days=(4 - datetime.now(DEFAULT_TZ).weekday()) % 7)
+    day = datetime(friday.year, friday.month, friday.day, tzinfo=DEFAULT_TZ).timestamp()
+    queries = {"exact": ("the Weekly Sync", None, None), "windowed": ("weekly sync", day, day + 86400),
+               "prefix": ("stand", None, None), "typo": ("weekyl snyc", None, None),
+               "one_off": (make_query(targets[0]["summary"], rng), None, None)}
+    latency = {}
+    for name, (query, lo, hi) in queries.items():
+        latency[name] = {"query": query, "index_us": timed_us(lambda: store.find(query, lo, hi), 200),
+                         "scan_us": timed_us(lambda: scan(store, query), 5),
+                         "top": (store.find(query, lo, hi)[:1] or [{}])[0].get("summary")}
+    result["latency"] = latency
+
+    # 3. Accuracy on noisy queries, and 4. Google calls made while answering them
+    calls0 = fake.calls
+    top1 = top5 = 0
+    for target in targets:
+        hits = [e["summary"] for e in store.find(make_query(target["summary"], rng))]
+        top1 += bool(hits) and hits[0] == target["summary"]
+        top5 += target["summary"] in hits
+    await tools.find_event(TOKEN, "weekly sync", friday.date().isoformat() + "T00:00:00", friday.date().isoformat() + "T23:59:59")
+    result["accuracy"] = {"queries": len(targets), "top1": round(top1 / len(targets), 3), "top5": round(top5 / len(targets), 3),
+                          "google_calls": fake.calls - calls0}
+
+    # Index build cost for these titles
+    titles = [(e["id"], e["summary"]) for e in store.events.values()]
+    tracemalloc.start()
+    t0 = time.perf_counter()
+    index = event_index.TitleIndex()
+    for event_id, title in titles: index.add(event_id, title)
+    build_ms = (time.perf_counter() - t0) * 1000
+    size = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    result["index_build"] = {"ms": round(build_ms, 1), "kib": round(size / 1024),
+                             "per_event_us": round(build_ms * 1000 / len(titles), 1)}
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--events", type=int, default=10000)
+    parser.add_argument("--queries", type=int, default=300)
+    args = parser.parse_args()
+
+    fake = FakeGoogle(latency_ms=20, events=args.events, days=365)
+    retitle(fake, random.Random(7))
+    base = fake.serve()
+    os.environ["GOOGLE_CAL_BASE"] = f"{base}/calendar/v3"
+    os.environ["EVENT_CACHE_SYNC_TTL"] = "3600"
+    print(json.dumps(asyncio.run(run(args, fake)), indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,106 @@
+"""Offline graph overhead and the LLM response cache.
+
+1. Graph overhead: LLM_BACKEND=stub with zero latency and a zero-latency fake
+   Google, so the time per turn is LangGraph + tools + our own code.
+2. Response cache: a skewed stream of repeated questions (guardrail + agent
+   turn each) with the stub at a fixed latency, cache off vs on.
+
+    python -m benchmarks.llm_cache --requests 300
+"""
+import argparse
+import asyncio
+import contextlib
+import io
+import json
+import os
+import random
+import statistics
+import time
+from datetime import datetime
+
+from benchmarks.fake_google import FakeGoogle
+
+TOKEN = "ya29.bench-token"
+QUESTIONS = [f"Go through my week and tell me what needs attention for project {n}" for n in range(20)]
+
+
+def state(message):
+    from langchain_core.messages import HumanMessage
+    return {"messages": [HumanMessage(content=message)], "user_token": TOKEN,
+            "current_time": datetime.now().isoformat(), "user_timezone": "Asia/Kolkata",
+            "current_action": None, "pending_details": None, "route": None}
+
+
+async def overhead(turns):
+    import graph
+    samples = []
+    for _ in range(turns):
+        t0 = time.perf_counter()
+        await graph.app.ainvoke(state(QUESTIONS[0]))
+        samples.append(time.perf_counter() - t0)
+    return {"scenario": "graph_overhead", "turns": turns, "llm_calls_per_turn": 2,
+            "mean_ms": round(statistics.mean(samples) * 1000, 2), "p50_ms": round(statistics.median(samples) * 1000, 2)}
+
+
+async def workload(messages, concurrency):
+    import graph
+    from guardrail import validate_intent
+    sem = asyncio.Semaphore(concurrency)
+    latencies = []
+
+    async def one(message):
+        async with sem:
+            t0 = time.perf_counter()
+            if await validate_intent(message):
+                await graph.app.ainvoke(state(message))
+            latencies.append(time.perf_counter() - t0)
+
+    t0 = time.perf_counter()
+    await asyncio.gather(*(one(m) for m in messages))
+    return time.perf_counter() - t0, latencies
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--requests", type=int, default=300)
+    parser.add_argument("--concurrency", type=int, default=20)
+    parser.add_argument("--llm-latency-ms", type=float, default=500)
+    args = parser.parse_args()
+
+    base = FakeGoogle(latency_ms=0, events=50).serve()
+    os.environ["GOOGLE_CAL_BASE"] = f"{base}/calendar/v3"
+    os.environ["GOOGLE_TOKENINFO_URL"] = f"{base}/oauth2/v1/tokeninfo"
+    os.environ["LLM_BACKEND"] = "stub"
+
+    import llm
+
+    # 1. graph overhead, no model or network latency
+    llm.STUB_LATENCY_MS, llm.CACHE_ENABLED = 0, False
+    with contextlib.redirect_stdout(io.StringIO()):
+        asyncio.run(overhead(20))  # warm imports, event cache
+        res = asyncio.run(overhead(200))
+    print(json.dumps(res))
+
+    # 2. repeated questions, Zipf-like popularity
+    rng = random.Random(7)
+    weights = [1 / (rank + 1) for rank in range(len(QUESTIONS))]
+    messages = rng.choices(QUESTIONS, weights=weights, k=args.requests)
+    llm.STUB_LATENCY_MS = args.llm_latency_ms
+    for enabled in (False, True):
+        llm.CACHE_ENABLED = enabled
+        llm._models.clear()
+        llm.response_cache.clear()
+        llm.stats.clear()
+        with contextlib.redirect_stdout(io.StringIO()):
+            elapsed, latencies = asyncio.run(workload(messages, args.concurrency))
+        stats = llm.cache_stats()
+        print(json.dumps({
+            "scenario": "repeated_questions", "cache": enabled, "requests": args.requests,
+            "distinct": len(set(messages)), "llm_calls": stats["calls"], "generations": stats["generations"],
+            "cache_hits": stats["cache_hits"], "mean_ms": round(statistics.mean(latencies) * 1000, 1),
+            "rps": round(args.requests / elapsed, 1),
+        }))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,106 @@
+"""Load benchmark for /chat and /events/upcoming.
+
+Runs server.app in-process against benchmarks.fake_google and the stub LLM
+backend (LLM_BACKEND=stub) with fixed latency, then reports requests/sec and latency percentiles.
+
+    python -m benchmarks.load --requests 200 --concurrency 50
+"""
+import argparse
+import asyncio
+import contextlib
+import io
+import json
+import os
+import statistics
+import time
+
+import httpx
+
+from benchmarks.fake_google import FakeGoogle
+
+TOKEN = "ya29.bench-token"
+USERS = 10
+
+
+def percentile(samples, pct):
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(round(pct / 100.0 * (len(ordered) - 1))))]
+
+
+async def drive(app, n_requests: int, concurrency: int, path: str):
+    sem = asyncio.Semaphore(concurrency)
+    latencies, errors = [], 0
+
+    async def one(client, i):
+        nonlocal errors
+        async with sem:
+            t0 = time.perf_counter()
+            if path == "/chat":
+                resp = await client.post("/chat", json={
+                    "messages": [{"role": "user", "content": "What's on my calendar this week?"}],
+                    "user_token": f"{TOKEN}-{i % USERS}",
+                    "timezone": "Asia/Kolkata",
+                })
+            else:
+                resp = await client.get("/events/upcoming", params={"user_token": TOKEN})
+            latencies.append(time.perf_counter() - t0)
+            if resp.status_code != 200:
+                errors += 1
+
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=None) as client:
+        t0 = time.perf_counter()
+        await asyncio.gather(*(one(client, i) for i in range(n_requests)))
+        elapsed = time.perf_counter() - t0
+
+    return {
+        "path": path,
+        "requests": n_requests,
+        "concurrency": concurrency,
+        "errors": errors,
+        "rps": round(n_requests / elapsed, 1),
+        "p50_ms": round(statistics.median(latencies) * 1000, 1),
+        "p95_ms": round(percentile(latencies, 95) * 1000, 1),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=50)
+    parser.add_argument("--google-latency-ms", type=float, default=50)
+    parser.add_argument("--llm-latency-ms", type=float, default=200)
+    args = parser.parse_args()
+
+    fake = FakeGoogle(latency_ms=args.google_latency_ms)
+    base = fake.serve()
+    # Must be set before the backend modules read their config
+    os.environ["GOOGLE_CAL_BASE"] = f"{base}/calendar/v3"
+    os.environ["GOOGLE_TOKENINFO_URL"] = f"{base}/oauth2/v1/tokeninfo"
+    os.environ["LLM_BACKEND"] = "stub"
+    os.environ["LLM_STUB_LATENCY_MS"] = str(args.llm_latency_ms)
+    # Measure the serving path, not repeated identical prompts
+    os.environ["LLM_CACHE"] = "0"
+
+    import event_store
+    import server
+    import token_cache
+
+    results = []
+    for path in ("/chat", "/events/upcoming"):
+        # server.py logs every hit with print(); keep the report readable
+        # Caches hold loop-bound locks; each asyncio.run gets a clean slate
+        event_store.stores.clear()
+        with contextlib.redirect_stdout(io.StringIO()):
+            res = asyncio.run(drive(server.app, args.requests, args.concurrency, path))
+        results.append(res)
+        print(json.dumps(res))
+    print(json.dumps({
+        "token_cache": token_cache.cache.stats(),
+        "event_cache": event_store.stores.stats(),
+        "google_calls": fake.calls,
+    }))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,177 @@
+"""Reading several calendars: one at a time vs. the concurrent fan-out (multi_calendar.py).
+
+The fake Google gets N extra calendars next to the primary, each with its
+own latency (spread between --min-ms and --max-ms), so the slowest one is
+known. For each N:
+
+    sequential   refresh each calendar's event cache in turn, then concatenate and sort
+    fan-out      multi_calendar.list_window(): bounded concurrent refresh + heap merge
+
+timed cold (full sync of every calendar) and warm-but-stale (one incremental
+sync each; EVENT_CACHE_SYNC_TTL=0), next to the slowest calendar alone.
+Also: the CPU cost of merging N sorted windows (heapq.merge vs. concat + sort,
+all items and the first 20), and a request where one calendar answers 503 /
+403 while the rest are fine. The per-user rate limit is raised so the
+runs measure fan-out rather than quota.
+
+    python -m benchmarks.multi_calendar --calendars 1 2 4 8 16
+"""
+import argparse
+import asyncio
+import itertools
+import json
+import os
+import statistics
+import time
+import timeit
+
+from benchmarks.fake_google import FakeGoogle
+
+TOKEN = "ya29.bench-token"
+
+
+def calendar_ids(n: int):
+    return [f"team{i}@group.calendar.google.com" for i in range(n)]
+
+
+async def timed(fn, repeat: int) -> float:
+    samples = []
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        await fn()
+        samples.append((time.perf_counter() - t0) * 1000)
+    return round(statistics.median(samples), 1)
+
+
+async def scale(n: int, fake: FakeGoogle, repeat: int) -> dict:
+    import event_store
+    import multi_calendar
+    from calendar_client import DEFAULT_TZ
+    from datetime import datetime, timedelta
+
+    cals = ["primary"] + calendar_ids(n - 1)
+    slowest = max(cals, key=lambda c: fake.calendars[c]["latency"] if c in fake.calendars else fake.latency)
+    lo = datetime.now(DEFAULT_TZ)
+    hi = lo + timedelta(days=7)
+
+    async def sequential():
+        items = []
+        for cal in cals:
+            store = event_store.stores.get(TOKEN, cal)
+            assert await store.refresh(TOKEN) is None
+            items += store.window(lo.timestamp(), hi.timestamp())
+        return sorted(items, key=lambda e: e["start"]["dateTime"])
+
+    async def fan_out():
+        data = await multi_calendar.list_window(TOKEN, lo, hi, cals)
+        assert not data["errors"]
+        return list(data["items"])
+
+    async def slowest_alone():
+        return await event_store.list_window(TOKEN, lo, hi, slowest)
+
+    def cold(fn):
+        async def run():
+            event_store.stores.clear()
+            return await fn()
+        return run
+
+    await fan_out()  # calendarList, pool warm-up
+    assert len(await fan_out()) == len(await sequential())
+    out = {"calendars": n, "events_in_window": len(await fan_out())}
+    for label, fn in (("sequential", sequential), ("fan_out", fan_out), ("slowest_alone", slowest_alone)):
+        out[f"cold_{label}_ms"] = await timed(cold(fn), repeat)
+    event_store.SYNC_TTL = 0   # every read re-syncs (incrementally)
+    for label, fn in (("sequential", sequential), ("fan_out", fan_out), ("slowest_alone", slowest_alone)):
+        out[f"stale_{label}_ms"] = await timed(fn, repeat)
+    event_store.SYNC_TTL = 3600
+    return out
+
+
+def merge_cost(n: int, per_calendar: int) -> dict:
+    import multi_calendar
+
+    class Store:   # just enough of EventStore for merge()
+        def __init__(self, events): self.bounds = {e["id"]: (e["ts"], e["ts"] + 1800) for e in events}
+        def bounds_of(self, event_id): return self.bounds[event_id]
+
+    windows = {}
+    for c in range(n):
+        events = [{"id": f"{c}-{i}", "ts": 1e9 + i * 3600 + c * 60, "start": {"dateTime": str(1e9 + i * 3600 + c * 60)}}
+                  for i in range(per_calendar)]
+        windows[str(c)] = (Store(events), events)
+
+    def concat_sort():
+        return sorted(itertools.chain.from_iterable(w for _, w in windows.values()), key=lambda e: e["ts"])
+
+    def heap_all():
+        return list(multi_calendar.merge(windows))
+
+    def heap_first_20():
+        return list(itertools.islice(multi_calendar.merge(windows), 20))
+
+    def concat_first_20():
+        return concat_sort()[:20]
+
+    assert [e["id"] for _, e in heap_all()] == [e["id"] for e in concat_sort()]
+    return {"calendars": n, "events": n * per_calendar,
+            **{f"{name}_us": round(min(timeit.repeat(fn, number=20, repeat=3)) / 20 * 1e6)
+               for name, fn in (("concat_sort_all", concat_sort), ("heap_merge_all", heap_all),
+                                ("concat_sort_first20", concat_first_20), ("heap_merge_first20", heap_first_20))}}
+
+
+async def failures(fake: FakeGoogle, n: int) -> dict:
+    import event_store
+    import multi_calendar
+    from calendar_client import DEFAULT_TZ
+    from datetime import datetime, timedelta
+
+    out = {}
+    cals = ["primary"] + calendar_ids(n - 1)
+    for status in (503, 403):
+        fake.calendars[cals[1]]["fail"] = status
+        event_store.stores.clear()
+        lo = datetime.now(DEFAULT_TZ)
+        t0 = time.perf_counter()
+        data = await multi_calendar.list_window(TOKEN, lo, lo + timedelta(days=7), cals)
+        items = list(data.get("items", []))
+        out[f"one_calendar_{status}"] = {"ms": round((time.perf_counter() - t0) * 1000), "events": len(items),
+                                         "calendars_read": len(cals) - len(data["errors"]),
+                                         "errors": {cal: err[:40] for cal, err in data["errors"].items()}}
+        fake.calendars[cals[1]]["fail"] = None
+    return out
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--calendars", type=int, nargs="+", default=[1, 2, 4, 8, 16])
+    parser.add_argument("--events", type=int, default=300, help="per calendar, over 30 days")
+    parser.add_argument("--min-ms", type=float, default=20)
+    parser.add_argument("--max-ms", type=float, default=120)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    top = max(args.calendars)
+    fake = FakeGoogle(latency_ms=args.min_ms, events=args.events, days=30)
+    for i, cal in enumerate(calendar_ids(top - 1)):
+        # Extra latency on top of the base: calendars get slower with i, the last ones the slowest
+        extra = (args.max_ms - args.min_ms) * (i + 1) / max(top - 1, 1)
+        fake.add_calendar(cal, f"Team {i}", events=args.events, days=30, latency_ms=extra, offset_minutes=7 * (i + 1))
+    base = fake.serve()
+    os.environ["GOOGLE_CAL_BASE"] = f"{base}/calendar/v3"
+    os.environ["GOOGLE_TOKENINFO_URL"] = f"{base}/oauth2/v1/tokeninfo"
+    os.environ["EVENT_CACHE_SYNC_TTL"] = "3600"
+    os.environ["CALENDAR_BACKOFF_BASE"] = "0.05"
+    os.environ["CALENDAR_USER_QPS"] = "1000"   # measure the fan-out, not the per-user quota (resilience.py)
+
+    import multi_calendar
+    print(json.dumps({"fanout_concurrency": multi_calendar.CONCURRENCY}))
+    for n in args.calendars:
+        print(json.dumps(asyncio.run(scale(n, fake, args.repeat))))
+    for n in args.calendars:
+        print(json.dumps(merge_cost(n, args.events // 4)))
+    print(json.dumps(asyncio.run(failures(fake, min(top, 8)))))
+
+
+if __name__ == "__main__":
+    main()
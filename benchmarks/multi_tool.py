@@ -0,0 +1,106 @@
+"""Multi-action prompts: one tool call per agent step vs. a list of calls per step.
+
+"Move Standup to 11am, rename Review and delete Lunch" with the event IDs
+already known. The stub LLM is scripted two ways:
+  sequential  one JSON call per message (the old protocol): 3 tool steps, 4 generations
+  batched     one JSON list with all three calls: 1 tool step, 2 generations
+
+    python -m benchmarks.multi_tool --runs 5
+"""
+import argparse
+import asyncio
+import contextlib
+import io
+import json
+import os
+import statistics
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+from benchmarks.fake_google import FakeGoogle
+
+TOKEN = "ya29.bench-token"
+
+
+def seed(fake):
+    from calendar_client import DEFAULT_TZ
+    fake.seed(0)
+    day = (datetime.now(DEFAULT_TZ) + timedelta(days=1)).replace(hour=9, minute=0, second=0, microsecond=0)
+    ids = {}
+    for name, hour in (("Standup", 9), ("Review", 12), ("Lunch", 13)):
+        start = day.replace(hour=hour)
+        ids[name] = fake._insert({"summary": name, "start": {"dateTime": start.isoformat()},
+                                  "end": {"dateTime": (start + timedelta(minutes=30)).isoformat()}})["id"]
+    return ids, day
+
+
+def script(ids, day, batched):
+    move = {"tool": "reschedule_event", "args": {"old_event_id": ids["Standup"], "new_start_iso": day.replace(hour=11).isoformat()}}
+    rename = {"tool": "update_event", "args": {"event_id": ids["Review"], "summary": "Design Review"}}
+    delete = {"tool": "delete_event", "args": {"event_id": ids["Lunch"]}}
+    if batched:
+        return [{"match": r"^Move Standup", "reply": json.dumps([move, rename, delete])},
+                {"match": r"\[3\] delete_event", "reply": "Done: standup moved, review renamed, lunch deleted."}]
+    return [{"match": r"^Move Standup", "reply": json.dumps(move)},
+            {"match": r"Event rescheduled", "reply": json.dumps(rename)},
+            {"match": r"Event updated", "reply": json.dumps(delete)},
+            {"match": r"Event deleted", "reply": "Done: standup moved, review renamed, lunch deleted."}]
+
+
+async def turn(message):
+    import graph
+    from langchain_core.messages import HumanMessage
+    result = await graph.app.ainvoke({
+        "messages": [HumanMessage(content=message)], "user_token": TOKEN,
+        "current_time": datetime.now().isoformat(), "user_timezone": "Asia/Kolkata",
+        "current_action": None, "pending_details": None, "route": None})
+    return result["messages"]
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--llm-latency-ms", type=float, default=800)
+    parser.add_argument("--google-latency-ms", type=float, default=100)
+    args = parser.parse_args()
+
+    fake = FakeGoogle(latency_ms=args.google_latency_ms, events=0)
+    base = fake.serve()
+    os.environ["GOOGLE_CAL_BASE"] = f"{base}/calendar/v3"
+    os.environ["GOOGLE_TOKENINFO_URL"] = f"{base}/oauth2/v1/tokeninfo"
+    os.environ["LLM_BACKEND"] = "stub"
+    os.environ["LLM_STUB_LATENCY_MS"] = str(args.llm_latency_ms)
+    os.environ["LLM_CACHE"] = "0"
+
+    import llm
+
+    for batched in (False, True):
+        samples, calls, steps = [], [], []
+        for _ in range(args.runs):
+            ids, day = seed(fake)
+            with tempfile.NamedTemporaryFile("w", suffix=".json", delete=False) as f:
+                json.dump(script(ids, day, batched), f)
+            llm.STUB_SCRIPT = f.name
+            llm._models.clear()
+            llm.stats.clear()
+            message = (f"Move Standup (ID: {ids['Standup']}) to 11am, rename Review (ID: {ids['Review']}) "
+                       f"to Design Review and delete Lunch (ID: {ids['Lunch']})")
+            t0 = time.perf_counter()
+            with contextlib.redirect_stdout(io.StringIO()):
+                messages = asyncio.run(turn(message))
+            samples.append(time.perf_counter() - t0)
+            os.unlink(f.name)
+            assert messages[-1].content.startswith("Done"), messages[-1].content
+            assert {e.get("summary") for e in fake.events.values()} == {"Standup", "Design Review"}, fake.events
+            calls.append(llm.stats["calls"])
+            steps.append(sum(m.content.startswith("Calendar Tool Output:") for m in messages))
+        print(json.dumps({
+            "protocol": "batched" if batched else "sequential", "runs": args.runs,
+            "llm_calls": statistics.mean(calls), "tool_steps": statistics.mean(steps),
+            "mean_ms": round(statistics.mean(samples) * 1000, 1),
+        }))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,95 @@
+"""Paginated, partial-response event fetch on a large synthetic calendar.
+
+Compares the old single-page read with collecting every full page, and with
+the streaming iter_events() + fields= path, on a stub calendar of 10k events
+spread over a year. The stub runs in a forked process so tracemalloc only
+sees the client side.
+
+    python -m benchmarks.pagination --events 10000
+"""
+import argparse
+import asyncio
+import json
+import os
+import time
+import tracemalloc
+from datetime import datetime, timedelta
+
+from benchmarks.fake_google import FakeGoogle
+
+TOKEN = "ya29.bench-token"
+
+
+async def measure(label, fn):
+    import calendar_client
+    calendar_client.get_client()  # open the pool outside the measurement
+    tracemalloc.start()
+    t0 = time.perf_counter()
+    stats = await fn()
+    elapsed = time.perf_counter() - t0
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    await calendar_client.aclose()
+    return dict(label=label, ms=round(elapsed * 1000, 1), peak_kib=round(peak / 1024), **stats)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--events", type=int, default=10000)
+    parser.add_argument("--google-latency-ms", type=float, default=20)
+    args = parser.parse_args()
+
+    fake = FakeGoogle(latency_ms=args.google_latency_ms, events=args.events, days=365)
+    base = fake.serve_forked()
+    os.environ["GOOGLE_CAL_BASE"] = f"{base}/calendar/v3"
+    import calendar_client
+
+    now = datetime.now(calendar_client.DEFAULT_TZ)
+    window = {"timeMin": now.isoformat(), "timeMax": (now + timedelta(days=366)).isoformat(),
+              "singleEvents": "true", "orderBy": "startTime"}
+
+    async def first_page_only():
+        # What list_events / delete_events_in_range used to do
+        resp = await calendar_client.get_client().get(calendar_client.events_url(), params=window)
+        return {"events": len(resp.json().get("items", [])), "pages": 1, "bytes": len(resp.content)}
+
+    async def collect_full_pages():
+        items, pages, size, params = [], 0, 0, dict(window, maxResults=calendar_client.PAGE_SIZE)
+        while True:
+            resp = await calendar_client.get_client().get(calendar_client.events_url(), params=params)
+            pages, size = pages + 1, size + len(resp.content)
+            data = resp.json()
+            items.extend(data["items"])
+            if not data.get("nextPageToken"):
+                return {"events": len(items), "pages": pages, "bytes": size}
+            params["pageToken"] = data["nextPageToken"]
+
+    async def stream_partial():
+        count = pages = 0
+        async for page in calendar_client.iter_event_pages(TOKEN, window):
+            pages += 1
+            count += len(page.get("items", []))
+        return {"events": count, "pages": pages, "bytes": None}
+
+    async def stream_partial_bytes():
+        # Same request shape as iter_event_pages, just to report the payload size
+        size, params = 0, dict(window, maxResults=calendar_client.PAGE_SIZE, fields=calendar_client.PAGE_FIELDS)
+        while True:
+            resp = await calendar_client.get_client().get(calendar_client.events_url(), params=params)
+            size += len(resp.content)
+            token = resp.json().get("nextPageToken")
+            if not token:
+                return size
+            params["pageToken"] = token
+
+    for label, fn in (("first_page_only", first_page_only),
+                      ("collect_full_pages", collect_full_pages),
+                      ("stream_partial", stream_partial)):
+        result = asyncio.run(measure(label, fn))
+        if label == "stream_partial":
+            result["bytes"] = asyncio.run(stream_partial_bytes())
+        print(json.dumps(result))
+
+
+if __name__ == "__main__":
+    main()
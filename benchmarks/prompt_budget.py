@@ -0,0 +1,112 @@
+"""Input tokens, prefix-cache reuse and prefill time per agent step, old vs new prompt assembly.
+
+Drives graph.agent_node through a long synthetic conversation (each turn:
+user message -> tool call -> ~4 KB list_events output -> answer). The stub
+model renders the prompt, looks it up in a block-level prefix cache (the way
+vLLM / TGI / hosted prefix caching work) and sleeps for the uncached prefill.
+
+    python -m benchmarks.prompt_budget --turns 30
+"""
+import argparse
+import asyncio
+import hashlib
+import json
+import statistics
+from datetime import datetime, timedelta
+
+from langchain_core.messages import AIMessage, HumanMessage, SystemMessage
+
+import graph
+
+BLOCK = 256  # chars per cache block (~64 tokens)
+
+
+class PrefixCachingStub:
+    def __init__(self, prefill_ms_per_token: float):
+        self.ms_per_token = prefill_ms_per_token
+        self.blocks = set()
+        self.log = []
+
+    async def ainvoke(self, messages, *args, **kwargs):
+        text = "".join(f"<|{m.type}|>{m.content}" for m in messages)
+        cached = 0
+        digest = hashlib.sha256()
+        for i in range(0, len(text) - BLOCK + 1, BLOCK):
+            digest.update(text[i:i + BLOCK].encode())
+            key = digest.hexdigest()
+            if key in self.blocks and cached == i: cached = i + BLOCK
+            self.blocks.add(key)
+        tokens, uncached = len(text) // 4, (len(text) - cached) // 4
+        self.log.append({"tokens": tokens, "uncached": uncached})
+        await asyncio.sleep(uncached * self.ms_per_token / 1000)
+        if isinstance([m for m in messages if m.type != "system"][-1], HumanMessage):
+            return AIMessage(content='{"tool": "list_events", "args": {"days": 7}}')
+        return AIMessage(content="Here is your schedule.")
+
+
+def legacy_prompt(clock):
+    # The previous layout: time (to the second) near the top of one big system prompt, full history
+    def build(state):
+        head, rest = graph.SYSTEM_PROMPT.split("\n\n", 1)
+        sys_msg = SystemMessage(content=f"{head}\n\nCurrent Date & Time: {clock().strftime('%Y-%m-%d %H:%M:%S')}\n\n{rest}")
+        return [sys_msg] + state["messages"]
+    return build
+
+
+def tool_output(turn: int) -> str:
+    lines = [f"- 2026-10-{17 + i % 10:02d}T{9 + i % 8:02d}:00:00+05:30: Meeting {turn}-{i} with the platform team "
+             f"(ID: {hashlib.md5(f'{turn}-{i}'.encode()).hexdigest()})" for i in range(40)]
+    return "Calendar Tool Output: " + "\n".join(lines)
+
+
+async def converse(turns: int):
+    history = []
+    for turn in range(turns):
+        history.append(HumanMessage(content=f"Turn {turn}: what does my week look like around the platform review?"))
+        state = {"messages": list(history), "user_timezone": "Asia/Kolkata"}
+        await graph.agent_node(state)                                   # -> tool call
+        state["messages"] += [AIMessage(content='{"tool": "list_events", "args": {"days": 7}}'),
+                              AIMessage(content=tool_output(turn))]
+        await graph.agent_node(state)                                   # -> answer
+        history.append(AIMessage(content=f"Turn {turn} answer: " + "You have a busy week with several reviews. " * 12))
+
+
+def report(name, log, prefill_ms):
+    steps = len(log)
+    return {
+        "layout": name,
+        "steps": steps,
+        "input_tokens_mean": round(statistics.mean(s["tokens"] for s in log)),
+        "input_tokens_last": log[-1]["tokens"],
+        "prefix_cache_hit_pct": round(100 * (1 - sum(s["uncached"] for s in log) / sum(s["tokens"] for s in log)), 1),
+        "prefill_ms_mean": round(statistics.mean(s["uncached"] for s in log) * prefill_ms, 1),
+        "prefill_ms_last": round(log[-1]["uncached"] * prefill_ms, 1),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--turns", type=int, default=30)
+    parser.add_argument("--prefill-ms-per-token", type=float, default=0.25)
+    args = parser.parse_args()
+
+    start = datetime(2026, 10, 16, 9, 0, 0)
+    tick = {"n": 0}
+
+    def clock():
+        tick["n"] += 1
+        return start + timedelta(seconds=7 * tick["n"])
+
+    new_build = graph.build_prompt
+    for name, build in (("old", legacy_prompt(clock)), ("new", new_build)):
+        stub = PrefixCachingStub(args.prefill_ms_per_token)
+        graph.chat_model = stub
+        graph.build_prompt = build
+        graph.llm_stats.update(calls=0, input_tokens=0, generation_ms=0.0)
+        asyncio.run(converse(args.turns))
+        print(json.dumps(report(name, stub.log, args.prefill_ms_per_token)))
+    graph.build_prompt = new_build
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,128 @@
+"""Calendar calls with and without the resilience layer (resilience.py).
+
+Three fault scenarios against the fake, each run once with the layer as
+shipped and once with it switched off (one attempt, no breaker, no limiter):
+
+1. flaky:  a share of Calendar calls answer 503. Reports what the caller
+   (i.e. the LLM) sees as errors, and p50/p99 latency.
+2. outage: every Calendar call hangs, then 503s. Reports how long callers
+   wait and how many calls still reach Google; then the outage ends and
+   reports how long until calls succeed again.
+3. burst:  one user fires a burst against a per-user quota (429 + Retry-After
+   when exceeded). The limiter queues instead of collecting 429s.
+
+    python -m benchmarks.resilience --requests 300 --flaky 0.2
+"""
+import argparse
+import asyncio
+import json
+import os
+import statistics
+import time
+
+from benchmarks.fake_google import FakeGoogle
+
+TOKEN = "ya29.bench-token"
+
+
+def configure(resilience, enabled: bool, **kw):
+    if enabled:
+        resilience.MAX_ATTEMPTS = kw.get("attempts", 4)
+        resilience.breaker = resilience.CircuitBreaker(kw.get("failures", 5), kw.get("cooldown", 1.0))
+        resilience.limiter = resilience.RateLimiter(kw.get("user_qps", 0), kw.get("user_burst", 0), 0, 0)
+    else:
+        resilience.MAX_ATTEMPTS = 1
+        resilience.breaker = resilience.CircuitBreaker(10 ** 9, 0)
+        resilience.limiter = resilience.RateLimiter(0, 0, 0, 0)
+
+
+async def fire(calendar_client, n: int, concurrency: int, token: str = TOKEN) -> dict:
+    sem = asyncio.Semaphore(concurrency)
+    url = f"{calendar_client.GOOGLE_CAL_BASE}/calendars/primary/events"
+
+    async def one(_):
+        async with sem:
+            t0 = time.perf_counter()
+            data = await calendar_client.request("GET", url, token, params={"maxResults": 10})
+            return (time.perf_counter() - t0) * 1000, "error" in data
+
+    samples = await asyncio.gather(*(one(i) for i in range(n)))
+    ms = sorted(s[0] for s in samples)
+    return {"requests": n, "errors": sum(s[1] for s in samples),
+            "p50_ms": round(statistics.median(ms), 1), "p99_ms": round(ms[int(len(ms) * 0.99) - 1], 1)}
+
+
+async def flaky(fake, calendar_client, resilience, args) -> dict:
+    out = {}
+    for enabled in (False, True):
+        configure(resilience, enabled)
+        fake.flaky, calls0 = args.flaky, fake.calls
+        res = await fire(calendar_client, args.requests, 20)
+        res["google_calls"] = fake.calls - calls0
+        out["with_layer" if enabled else "without"] = res
+    fake.flaky = 0.0
+    return out
+
+
+async def outage(fake, calendar_client, resilience, args) -> dict:
+    out = {}
+    for enabled in (False, True):
+        configure(resilience, enabled, cooldown=1.0)
+        fake.outage, calls0 = args.outage_seconds, fake.calls
+        res = await fire(calendar_client, 100, 10)
+        res["google_calls"] = fake.calls - calls0
+        # Outage over: how long until a caller gets a real answer again
+        fake.outage, t0 = 0.0, time.perf_counter()
+        while "error" in await calendar_client.request("GET", f"{calendar_client.GOOGLE_CAL_BASE}/calendars/primary/events",
+                                                       TOKEN, params={"maxResults": 10}):
+            await asyncio.sleep(0.05)
+        res["recovered_after_ms"] = round((time.perf_counter() - t0) * 1000)
+        out["with_layer" if enabled else "without"] = res
+    return out
+
+
+async def burst(fake, calendar_client, resilience, args) -> dict:
+    out = {}
+    for enabled in (False, True):
+        # Limiter sized just under the fake's quota, as it would be for Google's
+        configure(resilience, enabled, user_qps=args.quota * 0.9, user_burst=args.quota * 0.9)
+        fake.quota_qps, fake._quota, calls0, rejected0 = args.quota, {}, fake.calls, fake.rejected
+        t0 = time.perf_counter()
+        res = await fire(calendar_client, args.quota * 3, 50, token=f"{TOKEN}-burst-{enabled}")
+        res["seconds"] = round(time.perf_counter() - t0, 2)
+        res["google_calls"], res["google_429s"] = fake.calls - calls0, fake.rejected - rejected0
+        out["with_layer" if enabled else "without"] = res
+    fake.quota_qps = 0
+    return out
+
+
+async def run(fake, args) -> dict:
+    import calendar_client
+    import resilience
+    result = {"flaky": await flaky(fake, calendar_client, resilience, args),
+              "outage": await outage(fake, calendar_client, resilience, args),
+              "burst": await burst(fake, calendar_client, resilience, args)}
+    await calendar_client.aclose()
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--requests", type=int, default=300)
+    parser.add_argument("--google-latency-ms", type=float, default=50)
+    parser.add_argument("--flaky", type=float, default=0.2, help="share of calls answered 503")
+    parser.add_argument("--outage-seconds", type=float, default=2.0, help="how long each call hangs during the outage")
+    parser.add_argument("--quota", type=int, default=20, help="fake per-user requests/second")
+    args = parser.parse_args()
+
+    fake = FakeGoogle(latency_ms=args.google_latency_ms)
+    base = fake.serve()
+    os.environ["GOOGLE_CAL_BASE"] = f"{base}/calendar/v3"
+    os.environ["GOOGLE_TOKENINFO_URL"] = f"{base}/oauth2/v1/tokeninfo"
+    # Hanging calls time out after a second instead of the default ten
+    os.environ["CALENDAR_READ_TIMEOUT"] = "1"
+    print(json.dumps(asyncio.run(run(fake, args)), indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,115 @@
+"""Per-turn request size and server time: full-history resend vs session_id.
+
+Plays one long conversation against server.app (in-process ASGI, stub LLM,
+fake Google) twice: stateless, where the client resends every message each
+turn, and with a session_id, where it sends only the new one and the server
+resumes from sessions.db. Then checks that a booking half-filled in one
+process is finished by a fresh checkpointer on the same file.
+
+    python -m benchmarks.sessions --turns 200
+"""
+import argparse
+import asyncio
+import contextlib
+import io
+import json
+import os
+import statistics
+import tempfile
+import time
+import uuid
+
+import httpx
+
+from benchmarks.fake_google import FakeGoogle
+
+TOKEN = "ya29.bench-token"
+# Alternates the fast path (no LLM) and the agent loop (LLM -> tool -> LLM)
+MESSAGES = ["show my events tomorrow", "Go through my week and tell me what needs attention"]
+
+
+async def conversation(client: httpx.AsyncClient, turns: int, session: bool) -> list:
+    history, out = [], []
+    session_id = uuid.uuid4().hex if session else None
+    for turn in range(turns):
+        history.append({"role": "user", "content": MESSAGES[turn % 2]})
+        body = {"messages": history[-1:] if session else history, "user_token": TOKEN, "timezone": "Asia/Kolkata"}
+        if session: body["session_id"] = session_id
+        raw = json.dumps(body).encode()
+        t0 = time.perf_counter()
+        resp = await client.post("/chat", content=raw, headers={"content-type": "application/json"})
+        elapsed = time.perf_counter() - t0
+        resp.raise_for_status()
+        history.append({"role": "assistant", "content": resp.json()["response"]})
+        out.append({"bytes": len(raw), "ms": elapsed * 1000})
+    return out
+
+
+def at(samples: list, turn: int) -> dict:
+    # Median of the 5 turns ending at `turn`, to smooth out GC/scheduler noise
+    window = samples[max(0, turn - 5):turn]
+    return {"turn": turn, "request_bytes": window[-1]["bytes"],
+            "server_ms": round(statistics.median(s["ms"] for s in window), 2)}
+
+
+async def restart_check(server, sessions, graph, fake: FakeGoogle) -> dict:
+    # Turn 1 asks for the missing time; "restart"; turn 2 on a new checkpointer completes it
+    body = {"messages": [{"role": "user", "content": "Book a client call tomorrow"}], "user_token": TOKEN,
+            "timezone": "Asia/Kolkata", "session_id": "restart-check"}
+    transport = httpx.ASGITransport(app=server.app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://app") as client:
+        question = (await client.post("/chat", json=body)).json()["response"]
+
+    sessions.saver.close()
+    fresh = sessions.SqliteCheckpointer(sessions.DB_PATH)
+    resumed = graph.workflow.compile(checkpointer=fresh)
+    state, config = server.graph_run(server.ChatRequest(**dict(body, messages=[{"role": "user", "content": "6pm"}])))[1:]
+    before = len(fake.events)
+    result = await resumed.ainvoke(state, config, durability="exit")
+    fresh.close()
+    booked = [e for e in fake.events.values() if e["summary"] == "Client call"]
+    return {"question": question, "answer": result["messages"][-1].content,
+            "booked": len(fake.events) - before == 1 and len(booked) == 1,
+            "start": booked[0]["start"]["dateTime"] if booked else None}
+
+
+async def run(turns: int) -> dict:
+    import server, sessions
+    transport = httpx.ASGITransport(app=server.app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://app", timeout=None) as client:
+        stateless = await conversation(client, turns, session=False)
+        session = await conversation(client, turns, session=True)
+    marks = [t for t in (10, 100, 200) if t <= turns] or [turns]
+    return {
+        "turns": turns,
+        "stateless": [at(stateless, t) for t in marks],
+        "session": [at(session, t) for t in marks],
+        "sessions": sessions.saver.count(),
+        # One row per session whatever its length; this is what a turn loads and rewrites
+        "checkpoint_bytes": sessions.saver._conn().execute("SELECT MAX(LENGTH(checkpoint)) FROM checkpoints").fetchone()[0],
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--turns", type=int, default=200)
+    args = parser.parse_args()
+
+    fake = FakeGoogle(latency_ms=0)
+    base = fake.serve()
+    tmp = tempfile.mkdtemp()
+    os.environ["GOOGLE_CAL_BASE"] = f"{base}/calendar/v3"
+    os.environ["GOOGLE_TOKENINFO_URL"] = f"{base}/oauth2/v1/tokeninfo"
+    os.environ["LLM_BACKEND"] = "stub"
+    os.environ["LLM_CACHE"] = "0"
+    os.environ["SESSION_DB"] = os.path.join(tmp, "sessions.db")
+
+    import server, sessions, graph
+    with contextlib.redirect_stdout(io.StringIO()):
+        result = asyncio.run(run(args.turns))
+        result["restart"] = asyncio.run(restart_check(server, sessions, graph, fake))
+    print(json.dumps(result, indent=2))
+
+
+if __name__ == "__main__":
+    main()
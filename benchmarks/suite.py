@@ -0,0 +1,279 @@
+"""End-to-end benchmark suite: scripted conversations against server.app, fully offline.
+
+Every scenario runs against the fake Calendar API (benchmarks/fake_google.py:
+tokeninfo, events list/insert/patch/delete, freeBusy, batch; in its own
+process so it doesn't compete with the server for the GIL) and the stub LLM
+(llm.py, LLM_BACKEND=stub) with fixed latencies. Virtual users play the
+scenario's turns in order, `--concurrency` conversations at a time, each
+user with their own token. Per scenario it reports throughput,
+p50/p95/p99 latency per request, and Google / LLM calls per request (as
+counted by the server: telemetry.google_total, llm.stats).
+
+Results are written as JSON (default benchmarks/results/latest.json).
+`--baseline` compares against an earlier file. A regression is more
+outbound calls or errors per request, or p50 / throughput worse than
+--tolerance. Regressions make the exit status 1 so CI can gate on it:
+
+    python -m benchmarks.suite                         # all scenarios
+    python -m benchmarks.suite --scenario agent_week --conversations 200 --concurrency 50
+    python -m benchmarks.suite --baseline benchmarks/results/baseline.json
+"""
+import argparse
+import asyncio
+import contextlib
+import io
+import json
+import os
+import platform
+import re
+import subprocess
+import sys
+import tempfile
+import time
+import uuid
+from datetime import datetime, timezone
+from typing import Dict, List, Optional, Tuple
+
+import httpx
+
+from benchmarks.fake_google import FakeGoogle
+
+TOKEN = "ya29.bench-token"
+RESULTS_DIR = os.path.join(os.path.dirname(__file__), "results")
+
+# Stub model rules (LLM_STUB_SCRIPT): regex on the last message -> reply.
+# Anything unmatched gets llm.default_reply (list_events, then a summary).
+STUB_SCRIPT = [
+    {"match": r"^find me a 30 minute slot",
+     "reply": '{"tool": "find_best_slot", "args": {"duration_minutes": 30}}'},
+    {"match": r"^am i free .* and what else",
+     "reply": '[{"tool": "check_availability", "args": {"start_iso": "2030-01-07T10:00:00+05:30", '
+              '"end_iso": "2030-01-07T11:00:00+05:30"}}, {"tool": "list_events", "args": {"days": 3}}]'},
+]
+
+# name -> how one conversation goes. Each turn is one request; "expect" is a
+# regex the final answer must match, or the request counts as an error.
+SCENARIOS: Dict[str, dict] = {
+    "fast_list": {  # rule-based fast path: no LLM at all
+        "path": "/chat",
+        "turns": [{"say": "show my events tomorrow", "expect": r"calendar|nothing"}],
+    },
+    "fast_book": {  # fast path write: events.insert
+        "path": "/chat",
+        "turns": [{"say": "Schedule 'Bench sync' tomorrow at 7am for 30 minutes", "expect": r"booked"}],
+    },
+    "agent_week": {  # agent loop: LLM -> list_events -> LLM
+        "path": "/chat",
+        "turns": [{"say": "Go through my week and tell me what needs attention", "expect": r"^Here is what I found"}],
+    },
+    "agent_slot": {  # agent loop with freeBusy behind find_best_slot
+        "path": "/chat",
+        "turns": [{"say": "Find me a 30 minute slot for a 1:1 with Sam this week", "expect": r"."}],
+    },
+    "multi_tool": {  # one agent step asking for two independent tools
+        "path": "/chat",
+        "turns": [{"say": "Am I free on Jan 7 2030 at 10am and what else is coming up in the next 3 days?",
+                   "expect": r"\[1\] check_availability"}],
+    },
+    "session_slot_fill": {  # server-side session: question, then the answer fills it in
+        "path": "/chat",
+        "session": True,
+        "turns": [{"say": "Book a client call tomorrow", "expect": r"what time"},
+                  {"say": "6pm", "expect": r"booked"}],
+    },
+    "offtopic": {  # guardrail refuses locally
+        "path": "/chat",
+        "turns": [{"say": "Write me a poem about the ocean", "expect": r"only help with your calendar"}],
+    },
+    "stream_week": {  # same as agent_week over SSE
+        "path": "/chat/stream",
+        "turns": [{"say": "Go through my week and tell me what needs attention", "expect": r"Here is what I found"}],
+    },
+    "upcoming": {  # dashboard poll
+        "path": "/events/upcoming",
+        "turns": [{}],
+    },
+}
+
+
+def percentile(samples: List[float], pct: float) -> float:
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(round(pct / 100.0 * (len(ordered) - 1))))]
+
+
+def final_answer(path: str, resp: httpx.Response) -> str:
+    if path == "/chat/stream":
+        finals = [f for f in resp.text.split("\n\n") if f.startswith("event: final")]
+        return json.loads(finals[-1].split("data: ", 1)[1])["response"] if finals else ""
+    if path == "/events/upcoming":
+        return json.dumps(resp.json())
+    return resp.json().get("response", "")
+
+
+async def run_scenario(client: httpx.AsyncClient, name: str, spec: dict, conversations: int,
+                       concurrency: int, users: int, fake_url: str) -> dict:
+    import event_store, llm, telemetry
+    sem = asyncio.Semaphore(concurrency)
+    latencies: List[float] = []
+    errors: List[str] = []
+
+    async def conversation(i: int):
+        token = f"{TOKEN}-{i % users}"
+        session_id = uuid.uuid4().hex if spec.get("session") else None
+        history = []
+        async with sem:
+            for turn in spec["turns"]:
+                path = spec["path"]
+                t0 = time.perf_counter()
+                if path == "/events/upcoming":
+                    resp = await client.get(path, params={"user_token": token})
+                else:
+                    history.append({"role": "user", "content": turn["say"]})
+                    body = {"messages": history[-1:] if session_id else history, "user_token": token,
+                            "timezone": "Asia/Kolkata"}
+                    if session_id: body["session_id"] = session_id
+                    resp = await client.post(path, json=body)
+                latencies.append(time.perf_counter() - t0)
+                answer = final_answer(path, resp) if resp.status_code == 200 else ""
+                if resp.status_code != 200 or not re.search(turn.get("expect", ""), answer, re.IGNORECASE):
+                    errors.append(f"{resp.status_code}: {answer[:120]}")
+                    return
+                if path != "/events/upcoming": history.append({"role": "assistant", "content": answer})
+
+    # Same starting calendar for every scenario; nothing cached from the last one
+    async with httpx.AsyncClient() as control:
+        (await control.post(f"{fake_url}/_bench/seed", params={"count": 20})).raise_for_status()
+    event_store.stores.clear()
+    google0, llm0 = telemetry.google_total.total(), llm.stats["calls"]
+    t0 = time.perf_counter()
+    await asyncio.gather(*(conversation(i) for i in range(conversations)))
+    elapsed = time.perf_counter() - t0
+    requests = len(latencies)
+    return {
+        "scenario": name,
+        "path": spec["path"],
+        "conversations": conversations,
+        "concurrency": concurrency,
+        "requests": requests,
+        "errors": len(errors),
+        "first_error": errors[0] if errors else None,
+        "rps": round(requests / elapsed, 1),
+        "p50_ms": round(percentile(latencies, 50) * 1000, 1),
+        "p95_ms": round(percentile(latencies, 95) * 1000, 1),
+        "p99_ms": round(percentile(latencies, 99) * 1000, 1),
+        "google_calls_per_request": round((telemetry.google_total.total() - google0) / requests, 3),
+        "llm_calls_per_request": round((llm.stats["calls"] - llm0) / requests, 3),
+    }
+
+
+async def run_all(names: List[str], args, fake_url: str) -> List[dict]:
+    import server, tools
+    # Validate every user's token up front so per-request counts don't depend on scenario order
+    for i in range(args.users):
+        await tools.validate_token(f"{TOKEN}-{i}")
+    transport = httpx.ASGITransport(app=server.app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=None) as client:
+        return [await run_scenario(client, name, SCENARIOS[name], args.conversations, args.concurrency,
+                                   args.users, fake_url) for name in names]
+
+
+# --- regression check ---
+def compare(current: dict, baseline: dict, tolerance: float) -> Tuple[List[str], List[str]]:
+    """(regressions, warnings) of `current` against `baseline`, matched by scenario name.
+
+    Outbound calls and errors are deterministic, so any increase is a
+    regression; so is p50 / throughput past `tolerance`. Tail latency is too
+    noisy at these sample sizes to gate on and only warns.
+    """
+    old = {r["scenario"]: r for r in baseline["results"]}
+    regressions, warnings = [], []
+    for r in current["results"]:
+        b = old.get(r["scenario"])
+        if b is None: continue
+        name = r["scenario"]
+        for key in ("google_calls_per_request", "llm_calls_per_request"):
+            if r[key] > b[key] + 1e-9:
+                regressions.append(f"{name}: {key} {b[key]} -> {r[key]}")
+        if r["errors"] > b["errors"]:
+            regressions.append(f"{name}: errors {b['errors']} -> {r['errors']} ({r['first_error']})")
+        for key in ("p50_ms", "p95_ms", "p99_ms"):
+            if b[key] and r[key] > b[key] * (1 + tolerance):
+                line = f"{name}: {key} {b[key]} -> {r[key]} (+{(r[key] / b[key] - 1) * 100:.0f}%)"
+                (regressions if key == "p50_ms" else warnings).append(line)
+        if b["rps"] and r["rps"] < b["rps"] * (1 - tolerance):
+            regressions.append(f"{name}: rps {b['rps']} -> {r['rps']}")
+    return regressions, warnings
+
+
+def git_commit() -> Optional[str]:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              cwd=os.path.dirname(__file__), timeout=10).stdout.strip() or None
+    except Exception:
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--scenario", action="append", choices=sorted(SCENARIOS), help="repeatable; default: all")
+    parser.add_argument("--conversations", type=int, default=100, help="per scenario")
+    parser.add_argument("--concurrency", type=int, default=20)
+    parser.add_argument("--users", type=int, default=10, help="distinct tokens the conversations rotate through")
+    parser.add_argument("--google-latency-ms", type=float, default=20)
+    parser.add_argument("--llm-latency-ms", type=float, default=100)
+    parser.add_argument("--out", default=os.path.join(RESULTS_DIR, "latest.json"))
+    parser.add_argument("--baseline", help="results JSON to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="allowed latency/throughput drift (0.25 = 25%%)")
+    args = parser.parse_args()
+    names = args.scenario or list(SCENARIOS)
+
+    base = FakeGoogle(latency_ms=args.google_latency_ms).serve_forked()
+    tmp = tempfile.mkdtemp()
+    script = os.path.join(tmp, "stub_script.json")
+    with open(script, "w", encoding="utf-8") as f:
+        json.dump(STUB_SCRIPT, f)
+    # Must be set before the backend modules read their config
+    os.environ["GOOGLE_CAL_BASE"] = f"{base}/calendar/v3"
+    os.environ["GOOGLE_TOKENINFO_URL"] = f"{base}/oauth2/v1/tokeninfo"
+    os.environ["GOOGLE_BATCH_URL"] = f"{base}/batch/calendar/v3"
+    os.environ["LLM_BACKEND"] = "stub"
+    os.environ["LLM_STUB_SCRIPT"] = script
+    os.environ["LLM_STUB_LATENCY_MS"] = str(args.llm_latency_ms)
+    os.environ["LLM_CACHE"] = "0"  # measure the serving path, not repeated identical prompts
+    os.environ["SESSION_DB"] = os.path.join(tmp, "sessions.db")
+    os.environ.setdefault("TRACE_LOG", "off")
+
+    with contextlib.redirect_stdout(io.StringIO()):
+        results = asyncio.run(run_all(names, args, base))
+    report = {
+        "commit": git_commit(),
+        "when": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "config": {k: getattr(args, k) for k in ("conversations", "concurrency", "users",
+                                                  "google_latency_ms", "llm_latency_ms")},
+        "results": results,
+    }
+    for r in results:
+        print(json.dumps(r))
+    os.makedirs(os.path.dirname(os.path.abspath(args.out)), exist_ok=True)
+    with open(args.out, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2)
+    print(f"wrote {args.out}")
+
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            baseline = json.load(f)
+        if baseline.get("config") != report["config"]:
+            print(f"note: baseline config differs: {baseline.get('config')}")
+        regressions, warnings = compare(report, baseline, args.tolerance)
+        for line in warnings:
+            print("warning", line)
+        for line in regressions:
+            print("REGRESSION", line)
+        if regressions:
+            sys.exit(1)
+        print(f"no regressions vs {args.baseline} ({baseline.get('commit')})")
+
+
+if __name__ == "__main__":
+    main()
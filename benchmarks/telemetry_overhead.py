@@ -0,0 +1,91 @@
+"""Cost of the tracing/metrics layer (telemetry.py).
+
+1. Micro: one span() enter/exit, with and without an active request trace.
+2. End to end: /chat (agent loop: LLM -> list_events -> LLM) in-process with a
+   zero-latency stub model and fake Google, so the graph and instrumentation
+   are all that's measured. Modes run interleaved in rounds: telemetry off,
+   on, and on with the sampling profiler running.
+
+    python -m benchmarks.telemetry_overhead --requests 300
+"""
+import argparse
+import asyncio
+import contextlib
+import io
+import json
+import os
+import statistics
+import tempfile
+import time
+import timeit
+
+import httpx
+
+from benchmarks.fake_google import FakeGoogle
+
+TOKEN = "ya29.bench-token"
+MESSAGE = "Go through my week and tell me what needs attention"
+
+
+def micro(telemetry) -> dict:
+    n = 200_000
+
+    def one():
+        with telemetry.span("bench"):
+            pass
+
+    bare = min(timeit.repeat(one, number=n, repeat=5)) / n
+    trace = telemetry.Trace("POST", "/bench")
+    token = telemetry._trace.set(trace)
+    telemetry.MAX_SPANS = n * 10
+    traced = min(timeit.repeat(lambda: (one(), trace.spans.clear()), number=n, repeat=5)) / n
+    telemetry._trace.reset(token)
+    return {"span_ns": round(bare * 1e9), "span_in_trace_ns": round(traced * 1e9)}
+
+
+async def end_to_end(telemetry, server, requests: int, rounds: int = 5) -> dict:
+    modes = {"off": (False, None), "on": (True, None), "on+profiler": (True, telemetry.Sampler(0.005))}
+    samples = {m: [] for m in modes}
+    body = {"messages": [{"role": "user", "content": MESSAGE}], "user_token": TOKEN, "timezone": "Asia/Kolkata"}
+    transport = httpx.ASGITransport(app=server.app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://app") as client:
+        for _ in range(20):  # warm the token/event caches and imports
+            await client.post("/chat", json=body)
+        for _ in range(rounds):
+            for mode, (enabled, sampler) in modes.items():
+                telemetry.ENABLED, telemetry.sampler = enabled, sampler
+                telemetry.PROFILE_SLOW_MS = 1e9 if sampler else 0  # sample, but never write a file
+                for _ in range(requests // rounds):
+                    t0 = time.perf_counter()
+                    resp = await client.post("/chat", json=body)
+                    samples[mode].append((time.perf_counter() - t0) * 1000)
+                    resp.raise_for_status()
+    base = statistics.median(samples["off"])
+    return {mode: {"median_ms": round(statistics.median(s), 3),
+                   "overhead_pct": round((statistics.median(s) / base - 1) * 100, 1)} for mode, s in samples.items()}
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--requests", type=int, default=300)
+    args = parser.parse_args()
+
+    fake = FakeGoogle(latency_ms=0)
+    base = fake.serve()
+    os.environ["GOOGLE_CAL_BASE"] = f"{base}/calendar/v3"
+    os.environ["GOOGLE_TOKENINFO_URL"] = f"{base}/oauth2/v1/tokeninfo"
+    os.environ["LLM_BACKEND"] = "stub"
+    os.environ["LLM_CACHE"] = "0"
+    os.environ["TRACE_LOG"] = "off"
+    os.environ["SESSION_DB"] = os.path.join(tempfile.mkdtemp(), "sessions.db")
+
+    import server
+    import telemetry
+    result = {"micro": micro(telemetry)}
+    with contextlib.redirect_stdout(io.StringIO()):
+        result["chat"] = asyncio.run(end_to_end(telemetry, server, args.requests))
+    print(json.dumps(result, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,149 @@
+"""/events/upcoming: prepared payload + ETag/304, and watch-channel push.
+
+Runs the real server (uvicorn, in a thread) against the fake Google, which
+implements events.watch and POSTs notifications back to /webhooks/calendar.
+
+1. Cost of producing the list: formatting it from the event copy on every
+   poll (what the endpoint used to do) vs. the prepared per-revision view.
+2. HTTP poll latency: a full 200 vs. a 304 for a matching If-None-Match.
+3. Upstream calls: USERS dashboards polling every POLL_INTERVAL seconds,
+   with plain TTL re-syncs vs. a watch channel per calendar.
+4. Change latency: a long-poll (?wait=30) open while the event is edited
+   directly in "Google", with and without push.
+
+    python -m benchmarks.upcoming --users 20 --seconds 12
+"""
+import argparse
+import asyncio
+import json
+import os
+import statistics
+import time
+import timeit
+
+import httpx
+import uvicorn
+
+from benchmarks.fake_google import FakeGoogle, free_port
+
+TOKEN = "ya29.bench-token"
+TZ = "Europe/Berlin"
+
+
+def serve_app(app) -> str:
+    import threading
+    port = free_port()
+    server = uvicorn.Server(uvicorn.Config(app, host="127.0.0.1", port=port, log_level="warning"))
+    threading.Thread(target=server.run, daemon=True).start()
+    while not server.started:
+        time.sleep(0.01)
+    return f"http://127.0.0.1:{port}"
+
+
+def build_cost(event_store, upcoming) -> dict:
+    store = event_store.stores.get(TOKEN)
+    calendars = {"names": {"primary": "primary"}, "stores": {"primary": store}, "errors": {}}
+    tz = upcoming.zone(TZ)
+    today = upcoming.datetime.now(tz).date()
+    n = 2000
+    rebuild = min(timeit.repeat(lambda: upcoming.build(calendars, tz, today), number=n, repeat=3)) / n
+    prepared = min(timeit.repeat(lambda: upcoming.view(TOKEN, calendars, TZ), number=n, repeat=3)) / n
+    return {"events_in_window": len(json.loads(upcoming.view(TOKEN, calendars, TZ)[1])["upcoming"]),
+            "format_every_poll_us": round(rebuild * 1e6, 1), "prepared_us": round(prepared * 1e6, 2)}
+
+
+async def poll_latency(url: str, n: int = 300) -> dict:
+    params = {"user_token": TOKEN, "timezone": TZ}
+    async with httpx.AsyncClient(base_url=url) as client:
+        etag = (await client.get("/events/upcoming", params=params)).headers["etag"]
+        full, cached = [], []
+        for _ in range(n):
+            t0 = time.perf_counter()
+            assert (await client.get("/events/upcoming", params=params)).status_code == 200
+            full.append((time.perf_counter() - t0) * 1000)
+            t0 = time.perf_counter()
+            resp = await client.get("/events/upcoming", params=params, headers={"If-None-Match": etag})
+            cached.append((time.perf_counter() - t0) * 1000)
+            assert resp.status_code == 304
+    return {"200_p50_ms": round(statistics.median(full), 3), "304_p50_ms": round(statistics.median(cached), 3),
+            "200_bytes": len((await httpx.AsyncClient(base_url=url).get("/events/upcoming", params=params)).content)}
+
+
+async def dashboards(url: str, fake, users: int, seconds: float, interval: float) -> dict:
+    calls0, polls, not_modified = fake.calls, 0, 0
+
+    async def dashboard(client, i):
+        nonlocal polls, not_modified
+        params, etag = {"user_token": f"{TOKEN}-{i}", "timezone": TZ}, None
+        deadline = time.monotonic() + seconds
+        while time.monotonic() < deadline:
+            resp = await client.get("/events/upcoming", params=params, headers={"If-None-Match": etag} if etag else {})
+            polls += 1
+            not_modified += resp.status_code == 304
+            etag = resp.headers.get("etag", etag)
+            await asyncio.sleep(interval)
+
+    async with httpx.AsyncClient(base_url=url, timeout=60) as client:
+        await asyncio.gather(*(dashboard(client, i) for i in range(users)))
+    return {"polls": polls, "not_modified": not_modified, "google_calls": fake.calls - calls0,
+            "google_calls_per_poll": round((fake.calls - calls0) / polls, 3)}
+
+
+async def change_latency(url: str, fake, fake_url: str) -> float:
+    params = {"user_token": TOKEN, "timezone": TZ}
+    async with httpx.AsyncClient(base_url=url, timeout=60) as client:
+        etag = (await client.get("/events/upcoming", params=params)).headers["etag"]
+        # Register the watch channel (if push is on) on a conditional poll first
+        await client.get("/events/upcoming", params=params, headers={"If-None-Match": etag})
+        await asyncio.sleep(0.2)
+        waiting = asyncio.ensure_future(client.get("/events/upcoming", params=dict(params, wait=30),
+                                                   headers={"If-None-Match": etag}))
+        await asyncio.sleep(0.5)
+        event_id = next(iter(fake.events))
+        t0 = time.perf_counter()
+        async with httpx.AsyncClient() as google:
+            await google.patch(f"{fake_url}/calendar/v3/calendars/primary/events/{event_id}",
+                               json={"summary": f"Edited {time.time()}"})
+        resp = await waiting
+        assert resp.status_code == 200
+        return round((time.perf_counter() - t0) * 1000)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--users", type=int, default=20)
+    parser.add_argument("--seconds", type=float, default=12)
+    parser.add_argument("--interval", type=float, default=0.5, help="seconds between a dashboard's polls")
+    parser.add_argument("--sync-ttl", type=float, default=5)
+    args = parser.parse_args()
+
+    fake = FakeGoogle(latency_ms=50, events=60, days=7)
+    fake_url = fake.serve()
+    os.environ["GOOGLE_CAL_BASE"] = f"{fake_url}/calendar/v3"
+    os.environ["GOOGLE_TOKENINFO_URL"] = f"{fake_url}/oauth2/v1/tokeninfo"
+    os.environ["EVENT_CACHE_SYNC_TTL"] = str(args.sync_ttl)
+    os.environ["LLM_BACKEND"] = "stub"
+    os.environ["TRACE_LOG"] = "off"
+
+    import event_store
+    import server
+    import upcoming
+    import watch
+    url = serve_app(server.app)
+    webhook = f"{url}/webhooks/calendar"
+
+    result = {}
+    watch.WEBHOOK_URL = None
+    result["latency"] = asyncio.run(poll_latency(url))
+    result["build"] = build_cost(event_store, upcoming)
+    for mode in ("ttl", "push"):
+        event_store.stores.clear()
+        watch.WEBHOOK_URL = webhook if mode == "push" else None
+        result[f"dashboards_{mode}"] = asyncio.run(dashboards(url, fake, args.users, args.seconds, args.interval))
+        result[f"change_latency_ms_{mode}"] = asyncio.run(change_latency(url, fake, fake_url))
+    result["watch"] = dict(watch.stats)
+    print(json.dumps(result, indent=2))
+
+
+if __name__ == "__main__":
+    main()
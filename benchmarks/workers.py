@@ -0,0 +1,141 @@
+"""Multi-worker mode (WEB_CONCURRENCY) with and without shared state.
+
+Starts the real server under `uvicorn --workers N` against the fake Google
+(forked) and the stub LLM, for each of:
+
+    1 worker,  shared state off   (the old single-process setup)
+    N workers, shared state off   (every worker with its own caches)
+    N workers, SHARED_STATE=sqlite
+    N workers, SHARED_STATE=redis://  (benchmarks/fake_redis.py)
+
+and drives a mix of `/chat` turns and `/events/upcoming` polls from a fixed
+set of users. Reports throughput, p50/p95, and the Google traffic the fake
+saw: tokeninfo calls and Calendar calls per request. With caches per
+worker, every worker validates each token and lists each calendar itself;
+shared, that happens once.
+
+    python -m benchmarks.workers --workers 4 --requests 800
+"""
+import argparse
+import asyncio
+import json
+import multiprocessing
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+import httpx
+
+from benchmarks.fake_google import FakeGoogle, free_port
+from benchmarks.fake_redis import FakeRedis
+
+TOKEN = "ya29.bench-token"
+MESSAGE = "Go through my week and tell me what needs attention"
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def start_redis() -> str:
+    # In its own process so it doesn't compete with the load generator for the GIL
+    port = free_port()
+
+    def run():
+        FakeRedis().serve(port)
+        while True:
+            time.sleep(3600)
+
+    multiprocessing.get_context("fork").Process(target=run, daemon=True).start()
+    while True:
+        try:
+            socket.create_connection(("127.0.0.1", port), timeout=0.1).close()
+            return f"redis://127.0.0.1:{port}/0"
+        except OSError:
+            time.sleep(0.05)
+
+
+def start_server(workers: int, shared: str, google: str, tmp: str) -> subprocess.Popen:
+    port = free_port()
+    env = dict(os.environ,
+               WEB_CONCURRENCY=str(workers), SHARED_STATE=shared,
+               SHARED_STATE_DB=os.path.join(tmp, f"shared-{port}.db"),
+               SESSION_DB=os.path.join(tmp, f"sessions-{port}.db"),
+               GOOGLE_CAL_BASE=f"{google}/calendar/v3", GOOGLE_TOKENINFO_URL=f"{google}/oauth2/v1/tokeninfo",
+               LLM_BACKEND="stub", LLM_STUB_LATENCY_MS="20", TRACE_LOG="off")
+    proc = subprocess.Popen([sys.executable, "-m", "uvicorn", "server:app", "--port", str(port),
+                             "--workers", str(workers), "--log-level", "warning"],
+                            cwd=ROOT, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    proc.url = f"http://127.0.0.1:{port}"
+    deadline = time.time() + 60
+    while time.time() < deadline:
+        try:
+            if httpx.get(f"{proc.url}/metrics", timeout=1).status_code == 200:
+                return proc
+        except httpx.HTTPError:
+            time.sleep(0.2)
+    proc.kill()
+    raise RuntimeError("server did not start")
+
+
+async def drive(url: str, requests: int, concurrency: int, users: int) -> dict:
+    sem = asyncio.Semaphore(concurrency)
+    latencies, errors = [], 0
+
+    async def one(client, i):
+        nonlocal errors
+        token = f"{TOKEN}-{i % users}"
+        async with sem:
+            t0 = time.perf_counter()
+            if i % 2:
+                resp = await client.get("/events/upcoming", params={"user_token": token})
+            else:
+                resp = await client.post("/chat", json={"messages": [{"role": "user", "content": MESSAGE}],
+                                                        "user_token": token, "timezone": "Asia/Kolkata"})
+            latencies.append((time.perf_counter() - t0) * 1000)
+            errors += resp.status_code != 200
+
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=0)  # spread over workers
+    async with httpx.AsyncClient(base_url=url, timeout=60, limits=limits) as client:
+        t0 = time.perf_counter()
+        await asyncio.gather(*(one(client, i) for i in range(requests)))
+        elapsed = time.perf_counter() - t0
+    latencies.sort()
+    return {"requests": requests, "errors": errors, "rps": round(requests / elapsed, 1),
+            "p50_ms": round(statistics.median(latencies), 1),
+            "p95_ms": round(latencies[int(len(latencies) * 0.95) - 1], 1)}
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--requests", type=int, default=800)
+    parser.add_argument("--concurrency", type=int, default=40)
+    parser.add_argument("--users", type=int, default=20)
+    args = parser.parse_args()
+
+    google = FakeGoogle(latency_ms=50).serve_forked()
+    redis = start_redis()
+    tmp = tempfile.mkdtemp()
+    modes = [(1, ""), (args.workers, ""), (args.workers, "sqlite"), (args.workers, redis)]
+    print(json.dumps({"cpus": os.cpu_count()}))
+    for workers, shared in modes:
+        httpx.post(f"{google}/_bench/seed", params={"count": 20}).raise_for_status()
+        before = httpx.get(f"{google}/_bench/stats").json()
+        proc = start_server(workers, shared, google, tmp)
+        try:
+            result = asyncio.run(drive(proc.url, args.requests, args.concurrency, args.users))
+        finally:
+            proc.terminate()
+            proc.wait()
+        after = httpx.get(f"{google}/_bench/stats").json()
+        tokeninfo = after["tokeninfo_calls"] - before["tokeninfo_calls"]
+        calendar = after["calls"] - before["calls"] - tokeninfo
+        print(json.dumps({"workers": workers, "shared_state": "redis" if shared.startswith("redis") else shared or "off",
+                          **result, "tokeninfo_calls": tokeninfo,
+                          "calendar_calls_per_request": round(calendar / args.requests, 3)}))
+
+
+if __name__ == "__main__":
+    main()
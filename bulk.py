@@ -0,0 +1,168 @@
+import asyncio
+import json
+import os
+import uuid
+from typing import Any, Dict, List, Optional
+from urllib.parse import urlparse
+
+import httpx
+
+import calendar_client
+import event_store
+import resilience
+from calendar_client import BATCH_URL, GOOGLE_CAL_BASE
+
+# Bulk mutation engine for Calendar writes.
+#  - "batch": up to 50 operations per multipart/mixed request to the batch endpoint
+#  - "concurrent": one request per operation through a bounded worker pool
+# Either way every operation gets its own result. Batch items that fail with
+# 429/5xx are re-sent with backoff under the same rule as calendar_client.send
+# (which retries the concurrent ops): an insert only when Google can't have
+# applied it, so a retry never books twice.
+MODE = os.getenv("CALENDAR_BULK_MODE", "batch")
+CONCURRENCY = int(os.getenv("CALENDAR_BULK_CONCURRENCY", "8"))
+BATCH_LIMIT = 50          # Google's documented per-batch maximum
+MAX_ATTEMPTS = resilience.MAX_ATTEMPTS
+RETRYABLE = resilience.RETRYABLE
+
+def op(method: str, path: str, body: Optional[dict] = None) -> Dict[str, Any]:
+    """One write, with path relative to the Calendar base, e.g. /calendars/primary/events/ID."""
+    return {"method": method, "path": path, "body": body}
+
+def _result(index: int, status: int, data: Any) -> Dict[str, Any]:
+    ok = 200 <= status < 300
+    res = {"index": index, "ok": ok, "status": status}
+    if ok: res["data"] = data
+    else: res["error"] = data if isinstance(data, str) else json.dumps(data)
+    return res
+
+# --- multipart batch encoding ---
+def _encode_batch(ops: List[Dict[str, Any]], indexes: List[int], boundary: str) -> bytes:
+    prefix = urlparse(GOOGLE_CAL_BASE).path
+    parts = []
+    for i in indexes:
+        o = ops[i]
+        lines = [f"--{boundary}", "Content-Type: application/http", f"Content-ID: <item-{i}>", "",
+                 f"{o['method']} {prefix}{o['path']} HTTP/1.1"]
+        if o["body"] is not None:
+            payload = json.dumps(o["body"])
+            lines += ["Content-Type: application/json", f"Content-Length: {len(payload)}", "", payload]
+        else:
+            lines += [""]
+        parts.append("\r\n".join(lines))
+    return ("\r\n".join(parts) + f"\r\n--{boundary}--\r\n").encode("utf-8")
+
+def _decode_batch(content_type: str, body: str) -> Dict[int, Dict[str, Any]]:
+    """Map op index -> {"status", "data"} from a multipart/mixed batch response."""
+    boundary = content_type.split("boundary=", 1)[1].strip().strip('"')
+    out = {}
+    for part in body.split(f"--{boundary}"):
+        part = part.strip()
+        if not part or part == "--": continue
+        outer, _, inner = part.replace("\r\n", "\n").partition("\n\n")
+        cid = next((l.split(":", 1)[1].strip() for l in outer.split("\n") if l.lower().startswith("content-id")), "")
+        if "item-" not in cid: continue
+        index = int(cid.rsplit("item-", 1)[1].rstrip(">"))
+        status_line, _, rest = inner.partition("\n")
+        status = int(status_line.split()[1])
+        _, _, payload = rest.partition("\n\n")
+        payload = payload.strip()
+        try: data = json.loads(payload) if payload else {}
+        except ValueError: data = payload
+        out[index] = {"status": status, "data": data}
+    return out
+
+async def _send_batch(token: str, ops, indexes: List[int]) -> Dict[int, Dict[str, Any]]:
+    boundary = f"batch_{uuid.uuid4().hex}"
+    headers = {"Authorization": f"Bearer {token}", "Content-Type": f"multipart/mixed; boundary={boundary}"}
+    try:
+        # Rate limited and circuit-broken like any call, but item retries happen in _run_batch;
+        # each item counts against the user's quota
+        resp = await calendar_client.send("POST", BATCH_URL, token, retry=False, cost=len(indexes),
+                                          headers=headers, content=_encode_batch(ops, indexes, boundary))
+    except resilience.Unavailable as e:
+        # Refused locally: retrying now would only be refused again
+        return {i: {"status": e.status, "data": str(e), "final": True} for i in indexes}
+    except Exception as e:
+        # Only a failure to connect means nothing was sent; after that Google may have applied the batch
+        unsent = isinstance(e, calendar_client.UNSENT_ERRORS)
+        status = 504 if isinstance(e, httpx.TimeoutException) and not unsent else 503
+        return {i: {"status": status, "data": str(e) or type(e).__name__, "unsent": unsent} for i in indexes}
+    if resp.status_code != 200:
+        # The whole batch failed; every item inherits the outer status
+        return {i: {"status": resp.status_code, "data": resp.text} for i in indexes}
+    parsed = _decode_batch(resp.headers.get("content-type", ""), resp.text)
+    for i in indexes:
+        parsed.setdefault(i, {"status": 500, "data": "Missing from batch response"})
+    return parsed
+
+def _retryable(o: Dict[str, Any], reply: Dict[str, Any]) -> bool:
+    if reply.get("final") or reply["status"] not in RETRYABLE: return False
+    # Inserts aren't idempotent: re-send one only on 429 or when it never left
+    return o["method"] != "POST" or reply["status"] == 429 or reply.get("unsent", False)
+
+async def _run_batch(token: str, ops, concurrency: int) -> List[Dict[str, Any]]:
+    results: List[Optional[Dict[str, Any]]] = [None] * len(ops)
+    pending = list(range(len(ops)))
+    sem = asyncio.Semaphore(concurrency)
+
+    async def send(chunk):
+        async with sem:
+            return await _send_batch(token, ops, chunk)
+
+    for attempt in range(MAX_ATTEMPTS):
+        if attempt: await asyncio.sleep(resilience.backoff_delay(attempt))
+        chunks = [pending[i:i + BATCH_LIMIT] for i in range(0, len(pending), BATCH_LIMIT)]
+        retry = []
+        for replies in await asyncio.gather(*(send(c) for c in chunks)):
+            for i, reply in replies.items():
+                results[i] = _result(i, reply["status"], reply["data"])
+                if _retryable(ops[i], reply): retry.append(i)
+        if not retry: break
+        pending = sorted(retry)
+    return results
+
+async def _run_concurrent(token: str, ops, concurrency: int) -> List[Dict[str, Any]]:
+    sem = asyncio.Semaphore(concurrency)
+
+    async def one(i):
+        o = ops[i]
+        # Retries/backoff happen inside calendar_client.send
+        async with sem:
+            data = await calendar_client.request(o["method"], f"{GOOGLE_CAL_BASE}{o['path']}", token, json_body=o["body"])
+        # No status on an error means the request never got an answer
+        status = data.get("status", 503) if "error" in data else 200
+        return _result(i, status, data["error"] if "error" in data else data)
+
+    return list(await asyncio.gather(*(one(i) for i in range(len(ops)))))
+
+async def run(token: str, ops: List[Dict[str, Any]], mode: str = None, concurrency: int = None) -> List[Dict[str, Any]]:
+    """Execute writes in bulk. Returns one result per op, in order:
+    {"index", "ok", "status", "data" | "error"}."""
+    if not ops: return []
+    mode = mode or MODE
+    concurrency = max(1, concurrency or CONCURRENCY)
+    if mode == "concurrent":
+        return await _run_concurrent(token, ops, concurrency)
+    return await _run_batch(token, ops, concurrency)
+
+# --- event helpers (keep the event cache in step with what was written) ---
+async def delete_events(token: str, event_ids: List[str], calendar_id: str = "primary", **kw) -> List[Dict[str, Any]]:
+    results = await run(token, [op("DELETE", f"{calendar_client.events_path(calendar_id)}/{eid}") for eid in event_ids], **kw)
+    for eid, res in zip(event_ids, results):
+        # 410 Gone: already deleted, which is what the caller wanted
+        if res["ok"] or res["status"] == 410: await event_store.record_delete(token, eid, calendar_id)
+    return results
+
+async def insert_events(token: str, bodies: List[dict], calendar_id: str = "primary", **kw) -> List[Dict[str, Any]]:
+    results = await run(token, [op("POST", calendar_client.events_path(calendar_id), b) for b in bodies], **kw)
+    for res in results:
+        if res["ok"]: await event_store.record_upsert(token, res["data"], calendar_id)
+    return results
+
+async def patch_events(token: str, patches: Dict[str, dict], calendar_id: str = "primary", **kw) -> List[Dict[str, Any]]:
+    ids = list(patches)
+    results = await run(token, [op("PATCH", f"{calendar_client.events_path(calendar_id)}/{eid}", patches[eid]) for eid in ids], **kw)
+    for res in results:
+        if res["ok"]: await event_store.record_upsert(token, res["data"], calendar_id)
+    return results
@@ -0,0 +1,155 @@
+import asyncio
+import os
+import httpx
+from zoneinfo import ZoneInfo
+from typing import Any, AsyncIterator, Dict, Optional
+from urllib.parse import quote
+
+import resilience
+import telemetry
+import token_cache
+
+# CONFIG
+DEFAULT_TZ = ZoneInfo("Asia/Calcutta")
+GOOGLE_CAL_BASE = os.getenv("GOOGLE_CAL_BASE", "https://www.googleapis.com/calendar/v3")
+TOKENINFO_URL = os.getenv("GOOGLE_TOKENINFO_URL", "https://www.googleapis.com/oauth2/v1/tokeninfo")
+BATCH_URL = os.getenv("GOOGLE_BATCH_URL", "https://www.googleapis.com/batch/calendar/v3")
+
+# Shared async HTTP client for every Google call (Calendar + tokeninfo).
+# One pooled client per process keeps TCP/TLS connections alive between
+# requests instead of paying a fresh handshake on every tool call.
+MAX_CONNECTIONS = 100
+MAX_KEEPALIVE = 20
+# Strict per-attempt timeouts; resilience.DEADLINE bounds the whole call including retries
+DEFAULT_TIMEOUT = httpx.Timeout(float(os.getenv("CALENDAR_READ_TIMEOUT", "10")),
+                                connect=float(os.getenv("CALENDAR_CONNECT_TIMEOUT", "3")), pool=5.0)
+
+_client: Optional[httpx.AsyncClient] = None
+_client_loop: Optional[asyncio.AbstractEventLoop] = None
+
+def get_client() -> httpx.AsyncClient:
+    global _client, _client_loop
+    loop = asyncio.get_running_loop()
+    # Pooled connections are bound to the loop that opened them, so a new
+    # loop (tests, scripts calling asyncio.run twice) gets a fresh client.
+    if _client is None or _client.is_closed or _client_loop is not loop:
+        # Every Google call (tokeninfo, events, freeBusy, batch) gets a span via the transport
+        pool = httpx.AsyncHTTPTransport(
+            limits=httpx.Limits(max_connections=MAX_CONNECTIONS, max_keepalive_connections=MAX_KEEPALIVE))
+        _client = httpx.AsyncClient(transport=telemetry.TracingTransport(pool), timeout=DEFAULT_TIMEOUT)
+        _client_loop = loop
+    return _client
+
+async def aclose():
+    global _client, _client_loop
+    if _client is not None and not _client.is_closed:
+        await _client.aclose()
+    _client, _client_loop = None, None
+
+def _headers(token: str) -> Dict[str, str]:
+    return {"Authorization": f"Bearer {token}", "Content-Type": "application/json"}
+
+# Transport errors raised before the request left: Google can't have applied it
+UNSENT_ERRORS = (httpx.ConnectError, httpx.ConnectTimeout, httpx.PoolTimeout)
+
+async def send(method: str, url: str, token: str, *, retry: bool = True, cost: int = 1, **kwargs) -> httpx.Response:
+    """One Calendar call through the rate limiter, circuit breaker and retry policy.
+
+    Retries 429/5xx/transport errors with jittered backoff while the deadline
+    allows. Inserts (POST) are only retried when Google can't have applied
+    them (429, connection never made), so a retry never books twice. Raises
+    resilience.Unavailable when refused locally and httpx errors when the
+    last attempt failed in transport.
+    """
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + resilience.DEADLINE
+    op = telemetry.google_op(method, httpx.URL(url).path)
+    user = token_cache.user_key(token)
+    breaker = resilience.breaker
+    attempts = resilience.MAX_ATTEMPTS if retry else 1
+    for attempt in range(1, attempts + 1):
+        await resilience.limiter.acquire(user, cost, budget=deadline - loop.time())
+        breaker.before()
+        resp, error = None, None
+        try:
+            resp = await get_client().request(method, url, **kwargs)
+        except httpx.TransportError as e:
+            error = e
+        finally:
+            if resp is None and error is None: breaker.release()  # cancelled mid-call
+        breaker.record(resp is not None and resp.status_code < 500)
+
+        if error is not None:
+            safe = method != "POST" or isinstance(error, UNSENT_ERRORS)
+            if attempt == attempts or not safe: raise error
+            reason, delay = type(error).__name__, resilience.backoff_delay(attempt)
+        else:
+            status = resp.status_code
+            safe = method != "POST" or status == 429
+            if status not in resilience.RETRYABLE or attempt == attempts or not safe: return resp
+            reason, delay = str(status), resilience.backoff_delay(attempt, resilience.retry_after(resp.headers))
+        if loop.time() + delay >= deadline:
+            # No time left for another attempt: hand back what we have
+            if error is not None: raise error
+            return resp
+        resilience.retries.inc(op, reason)
+        await asyncio.sleep(delay)
+
+async def request(method: str, url: str, token: str, json_body: dict = None, params: dict = None, headers: dict = None) -> Dict[str, Any]:
+    # Same contract the tools always had: parsed JSON on success,
+    # {"error": "..."} on any failure. Never raises.
+    try:
+        all_headers = _headers(token)
+        if headers: all_headers.update(headers)
+        resp = await send(method, url, token, headers=all_headers, json=json_body, params=params)
+        if 200 <= resp.status_code < 300:
+            if resp.text: return resp.json()
+            return {"status": "success"}
+        if resp.status_code in resilience.RETRYABLE:
+            # Already retried here; a short, final message keeps the agent from looping on it
+            return {"error": f"Google Calendar is overloaded (HTTP {resp.status_code}). Do not retry; "
+                             f"tell the user to try again shortly.", "status": resp.status_code}
+        return {"error": resp.text, "status": resp.status_code}
+    except resilience.Unavailable as e: return {"error": str(e), "status": e.status}
+    except httpx.TimeoutException: return {"error": "Google Calendar timed out. Do not retry; tell the user to try again shortly.", "status": 504}
+    except Exception as e: return {"error": str(e)}
+
+# --- paginated events.list ---
+class CalendarError(Exception):
+    def __init__(self, message: str, status: Optional[int] = None):
+        super().__init__(message)
+        self.status = status
+
+# Partial response: only what the tools and caches read. Keeps each page small.
+EVENT_FIELDS = "id,etag,summary,start,end,status,transparency"
+PAGE_FIELDS = f"items({EVENT_FIELDS}),nextPageToken,nextSyncToken"
+PAGE_SIZE = 2500  # events.list maximum; fewer, larger pages
+
+def events_path(calendar_id: str = "primary") -> str:
+    # Shared calendar ids look like "en.indian#holiday@group.v.calendar.google.com"
+    return f"/calendars/{quote(calendar_id, safe='@')}/events"
+
+def events_url(calendar_id: str = "primary") -> str:
+    return GOOGLE_CAL_BASE + events_path(calendar_id)
+
+async def iter_event_pages(token: str, params: Dict[str, Any], calendar_id: str = "primary") -> AsyncIterator[Dict[str, Any]]:
+    """Yield events.list pages one at a time, following nextPageToken.
+
+    Only one page is held in memory. On failure a single {"error", "status"}
+    dict is yielded and iteration stops; the last page carries nextSyncToken.
+    """
+    params = dict(params, maxResults=PAGE_SIZE, fields=PAGE_FIELDS)
+    while True:
+        page = await request("GET", events_url(calendar_id), token, params=params)
+        yield page
+        if "error" in page or not page.get("nextPageToken"):
+            return
+        params["pageToken"] = page["nextPageToken"]
+
+async def iter_events(token: str, params: Dict[str, Any], calendar_id: str = "primary") -> AsyncIterator[Dict[str, Any]]:
+    """Stream individual events across all pages. Raises CalendarError on failure."""
+    async for page in iter_event_pages(token, params, calendar_id):
+        if "error" in page:
+            raise CalendarError(page["error"], page.get("status"))
+        for event in page.get("items", []):
+            yield event
@@ -0,0 +1,125 @@
+import bisect
+import re
+import unicodedata
+from collections import Counter
+from typing import Dict, List, Set, Tuple
+
+# Inverted index over event titles, one per EventStore, so "the Weekly Sync"
+# resolves to an event id locally instead of listing the calendar and having
+# the model read the dump. Titles are split into lowercase word tokens; a
+# query token matches a title token exactly, as a prefix ("stand" ->
+# "standup") or within a small edit distance ("weekyl" -> "weekly"). Fuzzy
+# candidates come from a bigram index over the vocabulary, so a lookup
+# never scans every title.
+EXACT, PREFIX, FUZZY = 1.0, 0.8, 0.6   # per query token; fuzzy loses 0.2 per extra edit
+MIN_PREFIX = 2                          # shorter query tokens only match exactly
+MIN_FUZZY = 4                           # ... and these don't get typo matching
+
+# Dropped from queries (titles keep them: "The Office" is still findable by "office")
+STOPWORDS = {"a", "an", "the", "my", "our", "on", "at", "in", "for", "to", "of", "with", "and",
+             "event", "meeting", "call", "this", "next", "that"}
+
+_WORD = re.compile(r"\w+")
+
+def tokens(text: str) -> List[str]:
+    # Lowercase, accents folded ("Café" == "cafe"), split on anything that isn't a word character
+    text = unicodedata.normalize("NFKD", (text or "").lower())
+    return _WORD.findall("".join(c for c in text if not unicodedata.combining(c)))
+
+def query_tokens(query: str) -> List[str]:
+    words = tokens(query)
+    kept = [w for w in words if w not in STOPWORDS]
+    return list(dict.fromkeys(kept or words))
+
+def _grams(token: str) -> Set[str]:
+    padded = f"^{token}$"
+    return {padded[i:i + 2] for i in range(len(padded) - 1)}
+
+def max_edits(token: str) -> int:
+    if len(token) < MIN_FUZZY: return 0
+    return 1 if len(token) <= 6 else 2
+
+def edit_distance(a: str, b: str, limit: int) -> int:
+    """Edits (insert, delete, substitute, swap two neighbours) from a to b, or limit + 1 once over `limit`."""
+    if abs(len(a) - len(b)) > limit: return limit + 1
+    before, prev = None, list(range(len(b) + 1))
+    for i, ca in enumerate(a, 1):
+        cur = [i]
+        for j, cb in enumerate(b, 1):
+            d = min(prev[j] + 1, cur[j - 1] + 1, prev[j - 1] + (ca != cb))
+            if before is not None and j > 1 and ca == b[j - 2] and a[i - 2] == cb:
+                d = min(d, before[j - 2] + 1)
+            cur.append(d)
+        if min(cur) > limit: return limit + 1
+        before, prev = prev, cur
+    return prev[-1]
+
+class TitleIndex:
+    """token -> event ids, plus a sorted vocabulary (prefixes) and bigrams (typos)."""
+
+    def __init__(self):
+        self._postings: Dict[str, Set[str]] = {}
+        self._docs: Dict[str, Tuple[str, ...]] = {}    # event id -> its distinct tokens
+        self._vocab: List[str] = []                    # sorted keys of _postings
+        self._grams: Dict[str, Set[str]] = {}          # bigram -> vocabulary tokens
+
+    def __len__(self) -> int:
+        return len(self._docs)
+
+    def add(self, event_id: str, title: str):
+        terms = tuple(dict.fromkeys(tokens(title)))
+        if self._docs.get(event_id) == terms: return   # re-synced, title unchanged
+        self.remove(event_id)
+        self._docs[event_id] = terms
+        for term in terms:
+            ids = self._postings.get(term)
+            if ids is None:
+                ids = self._postings[term] = set()
+                bisect.insort(self._vocab, term)
+                for gram in _grams(term): self._grams.setdefault(gram, set()).add(term)
+            ids.add(event_id)
+
+    def remove(self, event_id: str):
+        for term in self._docs.pop(event_id, ()):
+            ids = self._postings[term]
+            ids.discard(event_id)
+            if ids: continue
+            del self._postings[term]
+            del self._vocab[bisect.bisect_left(self._vocab, term)]
+            for gram in _grams(term):
+                terms = self._grams[gram]
+                terms.discard(term)
+                if not terms: del self._grams[gram]
+
+    def expand(self, word: str) -> Dict[str, float]:
+        """Vocabulary tokens a query token matches, with their score."""
+        found: Dict[str, float] = {}
+        if len(word) >= MIN_PREFIX:
+            i = bisect.bisect_left(self._vocab, word)
+            while i < len(self._vocab) and self._vocab[i].startswith(word):
+                found[self._vocab[i]] = PREFIX
+                i += 1
+        if word in self._postings: found[word] = EXACT
+        limit = max_edits(word)
+        if limit:
+            # One edit breaks at most 3 bigrams (a swap: "^sync$" vs "^snyc$"), so a match shares the rest
+            grams = _grams(word)
+            shared = Counter(t for g in grams if g in self._grams for t in self._grams[g])
+            need = max(1, len(grams) - 3 * limit)
+            for term, n in shared.items():
+                if n < need or term in found: continue
+                d = edit_distance(word, term, limit)
+                if d <= limit: found[term] = FUZZY - 0.2 * (d - 1)
+        return found
+
+    def search(self, query: str) -> Dict[str, float]:
+        """event id -> score: the best match of each query token, summed over tokens."""
+        scores: Dict[str, float] = {}
+        for word in query_tokens(query):
+            best: Dict[str, float] = {}
+            for term, score in self.expand(word).items():
+                for event_id in self._postings[term]:
+                    if score > best.get(event_id, 0.0): best[event_id] = score
+            for event_id, score in best.items():
+                scores[event_id] = scores.get(event_id, 0.0) + score
+        return scores
@@ -0,0 +1,344 @@
+import asyncio
+import bisect
+import heapq
+import itertools
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Tuple
+
+import calendar_client
+import event_index
+import shared_state
+import token_cache
+from calendar_client import DEFAULT_TZ
+
+# Per-user local copy of a calendar, kept fresh with Google's incremental
+# sync (nextSyncToken) instead of re-listing the same window on every tool call.
+SYNC_TTL = float(os.getenv("EVENT_CACHE_SYNC_TTL", "15"))      # seconds a synced copy is trusted
+PUSH_SYNC_TTL = float(os.getenv("EVENT_CACHE_PUSH_SYNC_TTL", "300"))  # ... while a watch channel (watch.py) reports changes
+MAX_USERS = int(os.getenv("EVENT_CACHE_MAX_USERS", "256"))
+IDLE_TTL = float(os.getenv("EVENT_CACHE_IDLE_TTL", "1800"))    # drop calendars unused this long
+# With shared_state on, each calendar also gets a version counter there (bumped
+# by every write, so other workers re-sync instead of serving a stale copy for
+# up to SYNC_TTL) and a snapshot (events + sync token), so a worker that has
+# never seen the user starts with one incremental sync instead of a full listing.
+SHARED_MAX_EVENTS = int(os.getenv("EVENT_CACHE_SHARED_MAX", "5000"))  # bigger calendars aren't snapshotted
+
+# hits: queries answered locally; *_syncs: round trips (sets of pages) to Google;
+# snapshot_loads: cold stores seeded from shared state
+counters = {"hits": 0, "full_syncs": 0, "incremental_syncs": 0, "snapshot_loads": 0}
+
+# Revisions are unique across all stores in the process, so (calendar, revision)
+# pairs can key derived views (upcoming.py) even after a store is evicted and rebuilt
+_revisions = itertools.count(1)
+
+def _ts(point: Dict[str, Any]) -> Optional[float]:
+    # {"dateTime": "..."} for timed events, {"date": "YYYY-MM-DD"} for all-day ones
+    raw = point.get("dateTime") or point.get("date")
+    if not raw: return None
+    try:
+        dt = datetime.fromisoformat(raw.replace("Z", "+00:00"))
+    except ValueError:
+        return None
+    if dt.tzinfo is None: dt = dt.replace(tzinfo=DEFAULT_TZ)
+    return dt.timestamp()
+
+def event_bounds(event: Dict[str, Any]) -> Optional[Tuple[float, float]]:
+    start, end = _ts(event.get("start", {})), _ts(event.get("end", {}))
+    if start is None: return None
+    return start, end if end is not None else start
+
+class EventStore:
+    """One user's calendar: events by id, a start-sorted interval index and a title index."""
+
+    def __init__(self, calendar_id: str = "primary", shared_key: Optional[str] = None):
+        self.calendar_id = calendar_id
+        self.shared_key = shared_key     # prefix for this calendar's shared_state keys
+        self.seen_version = 0
+        self.events: Dict[str, Dict[str, Any]] = {}
+        self._index: List[Tuple[float, float, str]] = []   # (start, end, id), sorted
+        self._starts: List[float] = []                     # parallel to _index, for bisect
+        self._bounds: Dict[str, Tuple[float, float]] = {}  # id -> (start, end), parsed once
+        self._max_duration = 0.0
+        self.titles = event_index.TitleIndex()
+        self.sync_token: Optional[str] = None
+        self.synced_at = 0.0
+        self.last_used = time.monotonic()
+        self.push_until = 0.0            # monotonic expiry of this calendar's watch channel
+        self.watch_retry_at = 0.0
+        self.revision = 0                # changes on every change to the local copy
+        self._waiters: List[asyncio.Future] = []
+        self._lock = asyncio.Lock()
+
+    # --- interval index ---
+    def _unindex(self, event_id: str):
+        bounds = self._bounds.pop(event_id, None)
+        if bounds is None: return
+        i = bisect.bisect_left(self._index, (bounds[0], bounds[1], event_id))
+        if i < len(self._index) and self._index[i][2] == event_id:
+            del self._index[i]
+            del self._starts[i]
+
+    def upsert(self, event: Dict[str, Any]):
+        event_id = event.get("id")
+        if not event_id: return
+        if event.get("status") == "cancelled":
+            self.remove(event_id)
+            return
+        self._changed()
+        self._unindex(event_id)
+        self.events[event_id] = event
+        self.titles.add(event_id, event.get("summary", ""))
+        bounds = event_bounds(event)
+        if bounds is None: return
+        self._bounds[event_id] = bounds
+        key = (bounds[0], bounds[1], event_id)
+        i = bisect.bisect_left(self._index, key)
+        self._index.insert(i, key)
+        self._starts.insert(i, bounds[0])
+        self._max_duration = max(self._max_duration, bounds[1] - bounds[0])
+
+    def remove(self, event_id: str):
+        if event_id in self.events: self._changed()
+        self._unindex(event_id)
+        self.events.pop(event_id, None)
+        self.titles.remove(event_id)
+
+    def window(self, time_min: float, time_max: float) -> List[Dict[str, Any]]:
+        # Same overlap rule as events.list(timeMin, timeMax): end > min and start < max.
+        # Nothing starting before time_min - longest event can still overlap.
+        lo = bisect.bisect_left(self._starts, time_min - self._max_duration)
+        hi = bisect.bisect_left(self._starts, time_max)
+        return [self.events[eid] for start, end, eid in self._index[lo:hi] if end > time_min or start >= time_min]
+
+    def bounds_of(self, event_id: str) -> Tuple[float, float]:
+        # (start, end) of an event returned by window(), which all have bounds; parsed once at upsert
+        return self._bounds[event_id]
+
+    def find(self, query: str, time_min: Optional[float] = None, time_max: Optional[float] = None,
+             limit: int = 5) -> List[Dict[str, Any]]:
+        """Events whose title matches `query`, best first; optionally only those overlapping [time_min, time_max).
+
+        Ties (e.g. the instances of a recurring event) go to the next upcoming one.
+        """
+        return [event for _, event in self.rank(query, time_min, time_max, limit)]
+
+    def rank(self, query: str, time_min: Optional[float] = None, time_max: Optional[float] = None,
+             limit: int = 5) -> List[Tuple[Tuple, Dict[str, Any]]]:
+        """find() with each event's sort key, so rankings from several calendars can be merged."""
+        scores = self.titles.search(query)
+        if not scores: return []
+        # Drop weak partial matches once something matches well
+        cutoff = max(scores.values()) / 2
+        now = time.time()
+        ranked = []
+        for event_id, score in scores.items():
+            if score < cutoff: continue
+            bounds = self._bounds.get(event_id)
+            if time_min is not None or time_max is not None:
+                if bounds is None: continue
+                if time_max is not None and bounds[0] >= time_max: continue
+                if time_min is not None and bounds[1] <= time_min and bounds[0] < time_min: continue
+            start = bounds[0] if bounds else float("inf")
+            ranked.append((-score, start < now, abs(start - now), event_id))
+        return [(key[:3], self.events[key[3]]) for key in heapq.nsmallest(limit, ranked)]
+
+    # --- change tracking: revision and long-poll waiters ---
+    def _changed(self):
+        self.revision = next(_revisions)
+        self._wake()
+
+    def _wake(self):
+        waiters, self._waiters = self._waiters, []
+        for fut in waiters:
+            if not fut.done(): fut.set_result(None)
+
+    async def wait(self, timeout: float):
+        """Return when the copy changes or is invalidated, or after `timeout` seconds."""
+        fut = asyncio.get_running_loop().create_future()
+        self._waiters.append(fut)
+        try:
+            await asyncio.wait_for(fut, timeout)
+        except asyncio.TimeoutError:
+            pass
+        finally:
+            if fut in self._waiters: self._waiters.remove(fut)
+
+    # --- sync with Google ---
+    def invalidate(self):
+        self.synced_at = 0.0
+        self._wake()
+
+    # --- shared state (no-ops when it's off; backend calls and big (de)serialising run on its threads) ---
+    async def _shared_version(self) -> int:
+        if not self.shared_key: return 0
+        raw = await shared_state.aget(f"{self.shared_key}:v")
+        return int(raw) if raw else 0
+
+    def note_write(self, version: Optional[int]):
+        # Our own write is already applied here; only skip the re-sync if nobody else wrote in between
+        if version is not None and version == self.seen_version + 1: self.seen_version = version
+
+    async def _load_snapshot(self):
+        if not self.shared_key: return
+        key = f"{self.shared_key}:snapshot"
+        snap = await shared_state.run(lambda: json.loads(shared_state.get(key) or "null"))
+        if snap is None: return
+        for event in snap["events"]: self.upsert(event)
+        self.sync_token = snap["sync_token"]
+        # As fresh as the other worker's sync: inside SYNC_TTL and at the same version it's a hit
+        self.synced_at = time.monotonic() - (time.time() - snap["synced_at"])
+        self.seen_version = snap["version"]
+        counters["snapshot_loads"] += 1
+
+    async def _save_snapshot(self, version: int):
+        if not self.shared_key or not self.sync_token or len(self.events) > SHARED_MAX_EVENTS: return
+        # Events are replaced on upsert, never edited, so the thread can dump this list while we go on
+        snap = {"sync_token": self.sync_token, "events": list(self.events.values()),
+                "synced_at": time.time(), "version": version}
+        key = f"{self.shared_key}:snapshot"
+        await shared_state.run(lambda: shared_state.put(key, json.dumps(snap).encode("utf-8"), IDLE_TTL))
+
+    async def refresh(self, token: str, force: bool = False) -> Optional[str]:
+        """Bring the copy up to date. Returns an error string or None."""
+        async with self._lock:
+            version = await self._shared_version()
+            if not self.sync_token: await self._load_snapshot()
+            ttl = PUSH_SYNC_TTL if self.push_until > time.monotonic() else SYNC_TTL
+            if (not force and self.sync_token and time.monotonic() - self.synced_at < ttl
+                    and version == self.seen_version):
+                counters["hits"] += 1
+                return None
+            error = None
+            if self.sync_token:
+                error = await self._sync(token, incremental=True, version=version)
+                # 410 Gone: sync token expired server-side, start over
+                if error == "gone": error = None; self.sync_token = None
+            if not self.sync_token:
+                error = await self._sync(token, incremental=False, version=version)
+            if error is None:
+                self.synced_at = time.monotonic()
+                self.seen_version = version
+            return error
+
+    async def _sync(self, token: str, incremental: bool, version: int = 0) -> Optional[str]:
+        params = {"singleEvents": "true", "showDeleted": "true" if incremental else "false"}
+        if incremental: params["syncToken"] = self.sync_token
+        counters["incremental_syncs" if incremental else "full_syncs"] += 1
+        # A full sync fills a scratch store so a failure halfway leaves the old copy intact
+        target = self if incremental else EventStore(self.calendar_id)
+        page = {}
+        changed = 0
+        async for page in calendar_client.iter_event_pages(token, params, self.calendar_id):
+            if "error" in page:
+                if incremental and page.get("status") == 410: return "gone"
+                return page["error"]
+            for event in page.get("items", []):
+                target.upsert(event)
+                changed += 1
+        if not incremental:
+            self.events, self._index, self._starts = target.events, target._index, target._starts
+            self._bounds = target._bounds
+            self._max_duration, self.titles = target._max_duration, target.titles
+            self._changed()
+        self.sync_token = page.get("nextSyncToken")
+        if changed or not incremental: await self._save_snapshot(version)
+        return None
+
+class StoreRegistry:
+    """LRU of EventStores keyed by (user, calendar); idle users are evicted."""
+
+    def __init__(self, max_users: int = MAX_USERS, idle_ttl: float = IDLE_TTL):
+        self.max_users = max_users
+        self.idle_ttl = idle_ttl
+        self._stores: "OrderedDict[Tuple[str, str], EventStore]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, token: str, calendar_id: str = "primary") -> EventStore:
+        key = (token_cache.user_key(token), calendar_id)
+        now = time.monotonic()
+        with self._lock:
+            store = self._stores.get(key)
+            if store is None:
+                store = self._stores[key] = EventStore(calendar_id, shared_key(*key) if shared_state.enabled() else None)
+            self._stores.move_to_end(key)
+            store.last_used = now
+            while len(self._stores) > self.max_users:
+                self._stores.popitem(last=False)
+            while self._stores:
+                oldest = next(iter(self._stores.values()))
+                if now - oldest.last_used < self.idle_ttl: break
+                self._stores.popitem(last=False)
+        return store
+
+    def peek(self, token: str, calendar_id: str = "primary") -> Optional[EventStore]:
+        # Write-through helpers only patch calendars that are already cached
+        return self.peek_user(token_cache.user_key(token), calendar_id)
+
+    def peek_user(self, user: str, calendar_id: str = "primary") -> Optional[EventStore]:
+        with self._lock:
+            return self._stores.get((user, calendar_id))
+
+    def clear(self):
+        with self._lock:
+            self._stores.clear()
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            users = len(self._stores)
+        return dict(counters, stores=users)
+
+stores = StoreRegistry()
+
+def shared_key(user: str, calendar_id: str) -> str:
+    return f"events:{user}:{calendar_id}"
+
+async def _bump(token: str, calendar_id: str) -> Optional[int]:
+    # Tell other workers their copy of this calendar is stale
+    if not shared_state.enabled(): return None
+    return await shared_state.aincr(f"{shared_key(token_cache.user_key(token), calendar_id)}:v")
+
+async def mark_stale(user: str, calendar_id: str = "primary"):
+    """Google says the calendar changed (watch.py): re-sync on next use, in every worker."""
+    store = stores.peek_user(user, calendar_id)
+    if store is not None: store.invalidate()
+    await shared_state.aincr(f"{shared_key(user, calendar_id)}:v")
+
+async def list_window(token: str, time_min: datetime, time_max: datetime, calendar_id: str = "primary") -> Dict[str, Any]:
+    """events.list(timeMin, timeMax, singleEvents, orderBy=startTime) served from the local copy.
+
+    Returns {"items": [...]} or {"error": "..."} like a raw Calendar call.
+    """
+    store = stores.get(token, calendar_id)
+    error = await store.refresh(token)
+    if error: return {"error": error}
+    return {"items": store.window(time_min.timestamp(), time_max.timestamp())}
+
+def cached_event(token: str, event_id: str, calendar_id: str = "primary") -> Optional[Dict[str, Any]]:
+    """The event as last synced, if this user's calendar is cached. Never hits Google."""
+    store = stores.peek(token, calendar_id)
+    return store.events.get(event_id) if store is not None else None
+
+# --- write-through hooks for the mutating tools ---
+async def record_upsert(token: str, event: Dict[str, Any], calendar_id: str = "primary"):
+    version = await _bump(token, calendar_id)
+    store = stores.peek(token, calendar_id)
+    if store is None: return
+    if event.get("recurrence"):
+        # A recurring master: the copy holds instances (singleEvents=true), which syncs never
+        # reconcile with the master. Let the next sync bring the instances in instead.
+        store.invalidate()
+        return
+    store.upsert(event)
+    store.note_write(version)
+
+async def record_delete(token: str, event_id: str, calendar_id: str = "primary"):
+    version = await _bump(token, calendar_id)
+    store = stores.peek(token, calendar_id)
+    if store is not None:
+        store.remove(event_id)
+        store.note_write(version)
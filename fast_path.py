@@ -0,0 +1,269 @@
+import os
+import re
+from collections import Counter
+from datetime import date, datetime, time as dtime, timedelta
+from typing import Any, Dict, Optional
+
+# Rule-based front stage for the graph. Recognises the common, unambiguous
+# commands ("show my events this week", "delete everything tomorrow",
+# "schedule 'Gym' tomorrow at 6pm for 1 hour") and turns them straight into
+# a tool call. Anything it isn't sure about returns None and goes to the LLM.
+ENABLED = os.getenv("FAST_PATH", "1") != "0"
+
+stats = Counter()  # "hits", "misses", "tool:<name>"; "asked"/"filled" for slot filling
+
+WEEKDAYS = ["monday", "tuesday", "wednesday", "thursday", "friday", "saturday", "sunday"]
+
+# Anything that hints at a second clause, a condition or a recurrence is the LLM's job
+_AMBIGUOUS = re.compile(
+    r"\b(and|but|except|unless|if|then|also|every|each|daily|weekly|monthly|recurring|"
+    r"instead|move|reschedule|free|slot|available|availability|maybe|not|don't|dont)\b|[?]|,")
+
+_DAY = (r"(?P<day>day after tomorrow|today|tonight|tomorrow|"
+        r"(?:next |this |on )?(?:" + "|".join(WEEKDAYS) + r")|(?:on )?\d{4}-\d{2}-\d{2})")
+# A bare hour only counts after "at" ("at 10"); see _resolve_time for am/pm
+_TIME = (r"(?:at )?(?P<time>noon|midnight|\d{1,2}(?::\d{2})?\s*(?:am|pm)|(?:[01]?\d|2[0-3]):[0-5]\d|"
+         r"(?<=at )\d{1,2}(?![\d:]))")
+# "for 1 hour", and also "a 30 minute call" / "45-min sync"
+_DURATION = (r"(?<![\d:])(?:for (?P<amount>\d+(?:\.\d+)?|an?|one|half an?) ?|(?P<count>\d+(?:\.\d+)?)[ -]?)"
+             r"(?P<unit>hours?|hrs?|h|minutes?|mins?|m)\b")
+
+_NOUN = r"(?:events?|meetings?|schedule|calendar|agenda|plans?|appointments?)"
+_LIST = re.compile(
+    r"^(?:can you |could you |please )*(?:"
+    r"(?:show|list|display|tell me|give me)\b.*\b" + _NOUN + r"\b|"
+    r"what(?:'s| is) on\b|what(?:'s| is| are)\b.*\b" + _NOUN + r"\b|what (?:do i have|have i got)\b)")
+_LIST_RANGE = re.compile(
+    r"\b(?P<range>today|tonight|tomorrow|this week|next week|the week|this month|"
+    r"next (?P<n>\d{1,2}) days?|(?:the )?rest of (?:the|this) week)\b")
+# Past tense or a time phrase _LIST_RANGE doesn't cover ("last week", "next month",
+# "on friday", "the meetings I had"): listing the next 7 days would be a wrong answer
+_LIST_PAST = re.compile(r"\b(?:yesterday|last|past|previous|ago|earlier|did|had|was|were|been|went|attended|missed|happened)\b")
+_LIST_WHEN = re.compile(
+    r"\d|\b(?:next|this|coming|following|weekend|weeks?|months?|years?|days?|morning|afternoon|evening|night|"
+    r"noon|midnight|today|tonight|tomorrow|since|until|till|before|after|between|from|"
+    r"(?:mon|tues|wednes|thurs|fri|satur|sun)day|january|february|march|april|may|june|july|august|"
+    r"september|october|november|december|jan|feb|mar|apr|jun|jul|aug|sept?|oct|nov|dec)\b")
+_DELETE = re.compile(
+    r"^(?:can you |could you |please )*(?:delete|clear|cancel|remove|wipe)\s+"
+    r"(?:out\s+)?(?:all\s+(?:of\s+)?)?(?:my\s+)?(?:the\s+)?"
+    r"(?:everything|all|events|meetings|schedule|calendar|appointments)\b(?:\s+(?:events|meetings))?\s*(?:on\s+|for\s+)?(?P<when>.*)$")
+_ADD = re.compile(r"^(?:can you |could you |please )*(?:schedule|book|add|create|put|set up|plan)\s+(?P<rest>.+)$")
+
+_TITLE_FILLER = re.compile(r"^(?:(?:an?|the|new|my|(?:event|meeting) (?=called|named|titled)|called|named|titled|for|on|in|at)\s*)+")
+_CALENDAR_REF = re.compile(r"\b(?:to|on|in|into|onto)\s+(?:my\s+|the\s+|our\s+)?(?:calendar|schedule|agenda)\b")
+# A leftover number or time word means part of the when wasn't understood ("dentist at 10ish")
+_TITLE_TIMEWORDS = re.compile(
+    r"\d|\b(?:am|pm|noon|midnight|morning|afternoon|evening|tonight|today|tomorrow|yesterday|o'?clock|"
+    r"hours?|hrs?|minutes?|mins?|week|weekend|month|next|this|last|(?:mon|tues|wednes|thurs|fri|satur|sun)day)\b")
+_VAGUE_TITLES = {"", "it", "this", "that", "something", "something in", "an event", "event", "a meeting"}
+
+def _resolve_day(text: str, today: date) -> Optional[date]:
+    text = text.strip()
+    if text in ("today", "tonight"): return today
+    if text == "tomorrow": return today + timedelta(days=1)
+    if text == "day after tomorrow": return today + timedelta(days=2)
+    m = re.fullmatch(r"(?:on )?(\d{4}-\d{2}-\d{2})", text)
+    if m:
+        try: return date.fromisoformat(m.group(1))
+        except ValueError: return None
+    m = re.fullmatch(r"(next |this |on )?(\w+)", text)
+    if m and m.group(2) in WEEKDAYS:
+        # "next friday" on a Wednesday is this week's Friday to some, the following one to others
+        if m.group(1) == "next ": return None
+        return today + timedelta(days=(WEEKDAYS.index(m.group(2)) - today.weekday()) % 7)
+    return None
+
+def _resolve_time(text: str) -> Optional[dtime]:
+    text = text.strip()
+    if text == "noon": return dtime(12)
+    if text == "midnight": return dtime(0)
+    m = re.fullmatch(r"(\d{1,2})(?::(\d{2}))?\s*(am|pm)?", text)
+    if not m: return None
+    hour, minute, meridiem = int(m.group(1)), int(m.group(2) or 0), m.group(3)
+    if not meridiem and m.group(2) is None and 1 <= hour <= 7:
+        hour += 12   # bare "at 3" means the afternoon; "at 9" the morning
+    if meridiem:
+        if not 1 <= hour <= 12: return None
+        hour = hour % 12 + (12 if meridiem == "pm" else 0)
+    if hour > 23 or minute > 59: return None
+    return dtime(hour, minute)
+
+def _resolve_duration(match: "re.Match") -> Optional[int]:
+    amount, unit = match.group("amount") or match.group("count"), match.group("unit")
+    value = {"a": 1, "an": 1, "one": 1, "half a": 0.5, "half an": 0.5}.get(amount)
+    if value is None: value = float(amount)
+    minutes = value * 60 if unit.startswith("h") else value
+    return int(minutes) if 5 <= minutes <= 12 * 60 else None
+
+def _list_intent(text: str) -> Optional[Dict[str, Any]]:
+    if not _LIST.search(text): return None
+    m = _LIST_RANGE.search(text)
+    rest = text[:m.start()] + " " + text[m.end():] if m else text
+    if _LIST_PAST.search(text) or _LIST_WHEN.search(rest): return None
+    if not m:
+        # "show my events" / "what's on my calendar" with no range: same default the prompt uses
+        return {"tool": "list_events", "args": {"days": 7}}
+    r = m.group("range")
+    if m.group("n"): days = int(m.group("n"))
+    elif r in ("today", "tonight"): days = 1
+    elif r == "tomorrow": days = 2
+    elif r == "this month": days = 30
+    elif r == "next week": days = 14
+    else: days = 7
+    return {"tool": "list_events", "args": {"days": days}} if 1 <= days <= 60 else None
+
+def _delete_intent(text: str, now: datetime) -> Optional[Dict[str, Any]]:
+    m = _DELETE.match(text)
+    if not m: return None
+    when = m.group("when").strip()
+    if when in ("this week", "the rest of the week", "rest of the week", "for the rest of the week"):
+        start = now
+        end_day = now.date() + timedelta(days=6 - now.weekday())
+    else:
+        day = _resolve_day(when, now.date())
+        if day is None or day < now.date(): return None
+        start = max(now, datetime.combine(day, dtime(0), tzinfo=now.tzinfo))
+        end_day = day
+    end = datetime.combine(end_day, dtime(23, 59, 59), tzinfo=now.tzinfo)
+    return {"tool": "delete_events_in_range",
+            "args": {"start_date": start.replace(microsecond=0).isoformat(), "end_date": end.isoformat()}}
+
+def _add_slots(text: str, raw: str, now: datetime) -> Optional[Dict[str, Any]]:
+    """title/day/time/minutes of a booking request; day or time may be None."""
+    m = _ADD.match(text)
+    if not m: return None
+    rest = m.group("rest")
+    quoted = re.search(r"[\"']([^\"']+)[\"']", raw)
+
+    day_m = re.search(r"\b" + _DAY + r"\b", rest)
+    time_m = re.search(r"\b" + _TIME + r"(?=\s|$)", rest)
+    day = _resolve_day(day_m.group("day"), now.date()) if day_m else None
+    clock = _resolve_time(time_m.group("time")) if time_m else None
+    if (day_m and day is None) or (time_m and clock is None): return None
+
+    minutes = 60
+    dur_m = re.search(_DURATION, rest)
+    if dur_m:
+        minutes = _resolve_duration(dur_m)
+        if minutes is None: return None
+
+    if quoted:
+        title = quoted.group(1).strip()
+    else:
+        title = rest
+        for span in sorted((x.span() for x in (day_m, time_m, dur_m) if x), reverse=True):
+            title = title[:span[0]] + " " + title[span[1]:]
+        title = _CALENDAR_REF.sub(" ", title)
+        title = _TITLE_FILLER.sub("", re.sub(r"\s+", " ", title).strip())
+        title = re.sub(r"\s+(?:on|at|for|from)$", "", title).strip()
+        if title in _VAGUE_TITLES or len(title.split()) > 6 or _TITLE_TIMEWORDS.search(title): return None
+        # Recover the user's own casing for the title
+        found = re.search(re.escape(title), raw, re.IGNORECASE)
+        title = found.group(0) if found else title
+        title = title[0].upper() + title[1:]
+    return {"title": title, "day": day, "time": clock, "minutes": minutes}
+
+def _add_command(title: str, day: date, clock: dtime, minutes: int, now: datetime) -> Optional[Dict[str, Any]]:
+    start = datetime.combine(day, clock, tzinfo=now.tzinfo)
+    if start < now: return None
+    end = start + timedelta(minutes=minutes)
+    return {"tool": "add_event", "args": {"summary": title, "start_iso": start.isoformat(), "end_iso": end.isoformat()}}
+
+def _add_intent(text: str, raw: str, now: datetime) -> Optional[Dict[str, Any]]:
+    slots = _add_slots(text, raw, now)
+    if not slots or slots["day"] is None or slots["time"] is None: return None  # NO TIME? NO TOOL.
+    return _add_command(slots["title"], slots["day"], slots["time"], slots["minutes"], now)
+
+# --- multi-turn slot filling (state["pending_details"]) ---
+def _clean(message: str) -> str:
+    text = re.sub(r"\s+", " ", message.strip().lower()).rstrip(".!")
+    return text.rstrip("?").strip()
+
+def partial(message: str, now: datetime) -> Optional[Dict[str, Any]]:
+    """A booking with a clear title but no day and/or time, as JSON-safe pending_details."""
+    if not ENABLED: return None
+    text = _clean(message)
+    if not text or len(text) > 160 or _AMBIGUOUS.search(text): return None
+    slots = _add_slots(text, message.strip(), now)
+    if not slots or (slots["day"] is not None and slots["time"] is not None): return None
+    return {"tool": "add_event", "title": slots["title"], "minutes": slots["minutes"],
+            "day": slots["day"].isoformat() if slots["day"] else None,
+            "time": slots["time"].strftime("%H:%M") if slots["time"] else None}
+
+def question(pending: Dict[str, Any]) -> str:
+    stats["asked"] += 1
+    title = pending["title"]
+    if pending["day"] is None and pending["time"] is None:
+        return f"Sure, what day and time should I book '{title}' for?"
+    if pending["time"] is None:
+        day = date.fromisoformat(pending["day"])
+        return f"Sure, what time on {day.strftime('%a, %b %d')} should I book '{title}'?"
+    clock = dtime.fromisoformat(pending["time"])
+    return f"Sure, which day should I book '{title}' at {clock.strftime('%I:%M %p')}?"
+
+def fill(pending: Dict[str, Any], message: str, now: datetime) -> Optional[Dict[str, Any]]:
+    """Complete a pending booking from a short reply ("6pm", "tomorrow at 9am").
+
+    None if the reply doesn't supply what's missing; the caller then drops the
+    pending booking and handles the message normally.
+    """
+    if not ENABLED or pending.get("tool") != "add_event": return None
+    text = _clean(message)
+    if not text or len(text.split()) > 8 or _AMBIGUOUS.search(text): return None
+    day = date.fromisoformat(pending["day"]) if pending.get("day") else None
+    clock = dtime.fromisoformat(pending["time"]) if pending.get("time") else None
+    minutes = pending.get("minutes", 60)
+    day_m = re.search(r"\b" + _DAY + r"\b", text)
+    time_m = re.search(r"\b" + _TIME + r"(?=\s|$)", text)
+    dur_m = re.search(_DURATION, text)
+    if day_m: day = _resolve_day(day_m.group("day"), now.date())
+    if time_m: clock = _resolve_time(time_m.group("time"))
+    if dur_m: minutes = _resolve_duration(dur_m)
+    if day is None or clock is None or minutes is None: return None
+    cmd = _add_command(pending["title"], day, clock, minutes, now)
+    if cmd: stats["filled"] += 1
+    return cmd
+
+def parse(message: str, now: datetime) -> Optional[Dict[str, Any]]:
+    """High-confidence tool call for `message`, or None to defer to the LLM.
+
+    `now` must be timezone-aware; it fixes the user's timezone and "today".
+    """
+    raw = message.strip()
+    text = re.sub(r"\s+", " ", raw.lower()).rstrip(".!")
+    if not text or len(text) > 160: return None
+    text = text.rstrip("?").strip()
+    if _AMBIGUOUS.search(text): return None
+    return _list_intent(text) or _delete_intent(text, now) or _add_intent(text, raw, now)
+
+def route(message: str, now: datetime) -> Optional[Dict[str, Any]]:
+    """parse() plus hit-rate accounting; honours the FAST_PATH switch."""
+    cmd = parse(message, now) if ENABLED else None
+    if cmd is None:
+        stats["misses"] += 1
+        return None
+    stats["hits"] += 1
+    stats[f"tool:{cmd['tool']}"] += 1
+    return cmd
+
+def hit_rate() -> float:
+    """Share of routed messages served without the LLM (exported on /metrics)."""
+    total = stats["hits"] + stats["misses"]
+    return stats["hits"] / total if total else 0.0
+
+def reply(cmd: Dict[str, Any], tool_output: str) -> str:
+    """User-facing answer for a fast-path tool result (no LLM summarisation)."""
+    tool, args = cmd["tool"], cmd["args"]
+    if tool_output.startswith("Error") or "Error" in tool_output[:40]:
+        return f"Sorry, that didn't work: {tool_output}"
+    if tool == "list_events":
+        if tool_output.startswith("No upcoming"): return "You have no events coming up in that window."
+        return f"Here's what's on your calendar:\n{tool_output}"
+    if tool == "add_event":
+        start = datetime.fromisoformat(args["start_iso"])
+        return f"Done! '{args['summary']}' is booked for {start.strftime('%a, %b %d at %I:%M %p')}."
+    if tool == "delete_events_in_range":
+        if tool_output.startswith("No events"): return "There was nothing to delete in that time range."
+        return f"Done. {tool_output}"
+    return tool_output
@@ -1,45 +1,54 @@
+import asyncio
 import os
 import json # <--- IMPORT JSON
-import re
+import time
 from datetime import datetime, timedelta
+from typing import List
 from zoneinfo import ZoneInfo # <--- IMPORT ZONEINFO
 from langgraph.graph import StateGraph, START, END
-from langchain_core.messages import SystemMessage, AIMessage
-from langchain_huggingface import HuggingFaceEndpoint, ChatHuggingFace
+from langchain_core.messages import BaseMessage, SystemMessage, AIMessage, HumanMessage
 from dotenv import load_dotenv
 
 from state import AgentState
-from guardrail import validate_intent
+import guardrail
+import fast_path
+import llm
+import sessions
+import telemetry
 import tools
 
 load_dotenv()
 
-# Model setup
-llm = HuggingFaceEndpoint(
-    repo_id="Qwen/Qwen2.5-Coder-32B-Instruct",
-    task="text-generation",
-    max_new_tokens=512,
-    temperature=0.1,
-    huggingfacehub_api_token=os.getenv("HUGGINGFACEHUBAPITOKEN")
-)
-chat_model = ChatHuggingFace(llm=llm)
+# Model setup: built lazily by llm.get_chat_model() (LLM_BACKEND picks hf or stub).
+# Assign a model here to override it, e.g. in benchmarks.
+chat_model = None
 
-def get_system_prompt(current_time_str: str) -> str:
-    return f"""You are an AI Personal Planning Assistant.
-
-Current Date & Time: {current_time_str}
+# Static instructions + few-shots. Byte-identical on every call, so a provider
+# prefix/KV cache can reuse it; the clock goes in a separate message at the end.
+SYSTEM_PROMPT = """You are an AI Personal Planning Assistant.
 
 TOOLS AVAILABLE (Output ONLY JSON):
-1. LIST EVENTS: {{"tool": "list_events", "args": {{"days": 7}}}}
-2. ADD EVENT:   {{"tool": "add_event", "args": {{"summary": "Title", "start_iso": "...", "end_iso": "..."}}}}
-3. DELETE:      {{"tool": "delete_event", "args": {{"event_id": "..."}}}}
-4. RESCHEDULE:  {{"tool": "reschedule_event", "args": {{"old_event_id": "...", "new_summary": "...", "new_start_iso": "...", "new_end_iso": "..."}}}}
-5. MASS DELETE: {{"tool": "delete_events_in_range", "args": {{"start_date": "...", "end_date": "..."}}}}
+1. LIST EVENTS: {"tool": "list_events", "args": {"days": 7}}
+2. ADD EVENT:   {"tool": "add_event", "args": {"summary": "Title", "start_iso": "...", "end_iso": "..."}}
+3. DELETE:      {"tool": "delete_event", "args": {"event_id": "..."}}
+4. RESCHEDULE:  {"tool": "reschedule_event", "args": {"old_event_id": "...", "new_start_iso": "...", "new_end_iso": "..."}}
+   (Moves the event in place, keeping guests/description. Optional: "new_summary", "dry_run": true to preview without saving. Omit "new_end_iso" to keep the duration.)
+5. MASS DELETE: {"tool": "delete_events_in_range", "args": {"start_date": "...", "end_date": "..."}}
+6. UPDATE:      {"tool": "update_event", "args": {"event_id": "...", "summary": "New title"}}
+   (Rename or edit fields of an existing event. "start_iso"/"end_iso" are optional.)
+7. FIND SLOT:   {"tool": "find_best_slot", "args": {"duration_minutes": 60, "deadline": "...", "after_time": "..."}}
+   (Returns the best free slots inside working hours 09:00-18:00, skipping lunch 13:00-14:00 with 10 min buffers. Optional: "top_n", "max_events_per_day", "work_start", "work_end".)
+8. AVAILABILITY: {"tool": "check_availability", "args": {"start_iso": "...", "end_iso": "..."}}
+9. FIND EVENT:  {"tool": "find_event", "args": {"query": "Weekly Sync"}}
+   (Searches event titles, typos and partial words allowed; returns the best matches with IDs. Optional: "start_iso"/"end_iso" to only look in that window.)
 
 CRITICAL RULES:
 1. NO TIME? NO TOOL. If user omits time/date, ASK them. Do not guess.
-2. NO ID? FIND IT. If rescheduling/deleting and you lack the 'event_id', call 'list_events' first.
-3. FORMAT: ISO 8601 with timezone (e.g., "+05:30").
+2. NO ID? FIND IT. If rescheduling/deleting and you lack the 'event_id', call 'find_event' with words from its title (plus start_iso/end_iso if the user named a day). Use 'list_events' only if they can't name it.
+3. FORMAT: ISO 8601 with the user's UTC offset (given with the current time, e.g., "+05:30").
+4. FREE TIME? If the user wants "a slot", "when am I free" or a time that fits, call 'find_best_slot' instead of listing events and guessing.
+5. SEVERAL ACTIONS? Output them together as one JSON list: [{"tool": ...}, {"tool": ...}]. They run at once and you get all results back together.
+6. OTHER CALENDARS: Listings cover all the user's calendars. An event shown with a "calendar_id" (team/shared calendar) needs that same "calendar_id" in the args to update, reschedule or delete it.
 
 --- FEW-SHOT EXAMPLES ---
 
@@ -51,76 +60,259 @@ AI: "Sure, what day and time would you like to schedule that?"
 Scenario 2: Simple Booking (Relative Date)
 User: "Schedule 'Gym' for tomorrow at 6pm for 1 hour."
 (Assuming 'Tomorrow' is 2026-01-20)
-AI: {{"tool": "add_event", "args": {{"summary": "Gym", "start_iso": "2026-01-20T18:00:00+05:30", "end_iso": "2026-01-20T19:00:00+05:30"}}}}
+AI: {"tool": "add_event", "args": {"summary": "Gym", "start_iso": "2026-01-20T18:00:00+05:30", "end_iso": "2026-01-20T19:00:00+05:30"}}
 
 Scenario 3: Rescheduling (Unknown ID)
-User: "Move the 'Weekly Sync' to 4pm."
-(Reason: You cannot reschedule without an ID. You must find it first.)
-AI: {{"tool": "list_events", "args": {{"days": 7}}}}
+User: "Move the 'Weekly Sync' on Friday to 4pm."
+(Reason: You cannot reschedule without an ID. Find it by title first; Friday is 2026-01-23.)
+AI: {"tool": "find_event", "args": {"query": "Weekly Sync", "start_iso": "2026-01-23T00:00:00+05:30", "end_iso": "2026-01-24T00:00:00+05:30"}}
 
 Scenario 4: Mass Delete
 User: "Clear my schedule for the rest of January."
 (Assuming 'Rest of Jan' is Now to Jan 31)
-AI: {{"tool": "delete_events_in_range", "args": {{"start_date": "2026-01-19T13:00:00+05:30", "end_date": "2026-01-31T23:59:59+05:30"}}}}
+AI: {"tool": "delete_events_in_range", "args": {"start_date": "2026-01-19T13:00:00+05:30", "end_date": "2026-01-31T23:59:59+05:30"}}
 
 Scenario 5: Recurring Event
 User: "Team standup every Monday at 10am for 4 weeks."
-AI: {{"tool": "add_event", "args": {{"summary": "Team Standup", "start_iso": "2026-01-26T10:00:00+05:30", "end_iso": "2026-01-26T10:30:00+05:30", "recurrence": "RRULE:FREQ=WEEKLY;COUNT=4"}}}}
+AI: {"tool": "add_event", "args": {"summary": "Team Standup", "start_iso": "2026-01-26T10:00:00+05:30", "end_iso": "2026-01-26T10:30:00+05:30", "recurrence": "RRULE:FREQ=WEEKLY;COUNT=4"}}
+
+Scenario 6: Several Actions (IDs known from an earlier listing)
+User: "Move standup to 11am and delete lunch."
+AI: [{"tool": "reschedule_event", "args": {"old_event_id": "abc123", "new_start_iso": "2026-01-20T11:00:00+05:30"}}, {"tool": "delete_event", "args": {"event_id": "def456"}}]
 """
 
-def agent_node(state: AgentState):
-    # Calculate current time for the prompt
-    now = datetime.now(ZoneInfo("Asia/Calcutta"))
-    now_str = now.strftime("%Y-%m-%d %H:%M:%S")
-    
-    # Generate the prompt with the dynamic time
-    sys_msg = SystemMessage(content=get_system_prompt(now_str))
-    
-    # Prepend the system message to the chat history
-    messages = [sys_msg] + state["messages"]
-
-    # Call the LLM
-    resp = chat_model.invoke(messages)
+def user_tz(state: AgentState):
+    # The user's timezone, falling back to the tools' default
+    try:
+        return ZoneInfo(state.get("user_timezone") or "")
+    except Exception:
+        return tools.DEFAULT_TZ
+
+def user_now(state: AgentState) -> datetime:
+    return datetime.now(user_tz(state))
+
+async def guardrail_node(state: AgentState):
+    # Off-topic messages stop here, before any tool or agent step
+    last = state["messages"][-1] if state["messages"] else None
+    if not guardrail.ENABLED or not isinstance(last, HumanMessage):
+        return {"route": None}
+    follow_up = any(isinstance(m, AIMessage) for m in state["messages"][:-1])
+    with telemetry.span("guardrail") as s:
+        s["allowed"] = await guardrail.validate_intent(last.content, follow_up=follow_up)
+    if s["allowed"]:
+        return {"route": None}
+    return {"messages": [AIMessage(content=guardrail.REFUSAL)], "route": "blocked"}
+
+def fast_path_node(state: AgentState):
+    # Rule-based front stage: obvious commands skip the LLM entirely
+    last = state["messages"][-1] if state["messages"] else None
+    if not isinstance(last, HumanMessage):
+        return {"route": None}
+    now = user_now(state)
+    update = {"route": None}
+    pending = state.get("pending_details")
+    if pending:
+        # Previous turn asked for a missing day/time; this reply may complete it.
+        # Either way the pending booking is used up.
+        update = {"route": None, "pending_details": None, "current_action": None}
+        cmd = fast_path.fill(pending, last.content, now)
+        if cmd is not None:
+            return {**update, "messages": [AIMessage(content=json.dumps(cmd))], "route": "fast_path"}
+    cmd = fast_path.route(last.content, now)
+    if cmd is not None:
+        return {**update, "messages": [AIMessage(content=json.dumps(cmd))], "route": "fast_path"}
+    partial = fast_path.partial(last.content, now)
+    if partial is not None:
+        # Clear title but no day/time: ask for it and keep the booking in state
+        return {"messages": [AIMessage(content=fast_path.question(partial))], "route": "ask",
+                "pending_details": partial, "current_action": "scheduling"}
+    return update
+
+def fast_reply_node(state: AgentState):
+    # Turn the tool output into the final answer without another generation
+    cmd = json.loads(state["messages"][-2].content)
+    output = state["messages"][-1].content.replace("Calendar Tool Output: ", "", 1)
+    return {"messages": [AIMessage(content=fast_path.reply(cmd, output))], "route": None}
+
+# --- prompt assembly ---
+# History sent to the model is capped at a token budget (estimated at ~4 chars
+# per token); older turns fall off the front and superseded tool outputs are clipped.
+HISTORY_TOKEN_BUDGET = int(os.getenv("AGENT_HISTORY_TOKEN_BUDGET", "2000"))
+OLD_TOOL_OUTPUT_CHARS = int(os.getenv("AGENT_OLD_TOOL_OUTPUT_CHARS", "600"))
+HISTORY_CUT_STRIDE = 4
+
+# Per-generation accounting: input tokens (provider-reported when available) and latency
+llm_stats = {"calls": 0, "input_tokens": 0, "generation_ms": 0.0}
+
+SYSTEM_MESSAGE = SystemMessage(content=SYSTEM_PROMPT)
+
+def estimate_tokens(text: str) -> int:
+    return len(text) // 4 + 4  # + a few for role/turn markers
+
+def context_message(state: AgentState) -> SystemMessage:
+    # The only part of the prompt that changes per call; minute precision is plenty
+    now = user_now(state)
+    return SystemMessage(content=f"Current Date & Time: {now.strftime('%Y-%m-%d %H:%M (%A)')}, "
+                                 f"timezone {now.tzinfo} (UTC{now.strftime('%z')[:3]}:{now.strftime('%z')[3:]})")
+
+def history_window(messages: List[BaseMessage], budget: int = None) -> List[BaseMessage]:
+    """Newest messages that fit the token budget, starting at a user turn.
+
+    The current turn (last user message onward) is always kept. Older turns are
+    dropped HISTORY_CUT_STRIDE at a time, so the window start (and with it the
+    cached prompt prefix) stays put for several turns instead of sliding every
+    turn. Tool outputs other than the latest one are clipped.
+    """
+    budget = HISTORY_TOKEN_BUDGET if budget is None else budget
+    last_tool = max((i for i, m in enumerate(messages) if m.content.startswith("Calendar Tool Output:")), default=-1)
+    clipped = []
+    for i, m in enumerate(messages):
+        if m.content.startswith("Calendar Tool Output:") and i != last_tool and len(m.content) > OLD_TOOL_OUTPUT_CHARS:
+            m = AIMessage(content=m.content[:OLD_TOOL_OUTPUT_CHARS] + " ... [truncated]")
+        clipped.append(m)
+
+    user_turns = [i for i, m in enumerate(clipped) if isinstance(m, HumanMessage)]
+    if not user_turns:
+        return clipped
+    # Allowed cut points: every HISTORY_CUT_STRIDE-th user turn, plus the current one
+    cuts = [i for n, i in enumerate(user_turns) if n % HISTORY_CUT_STRIDE == 0] + [user_turns[-1]]
+    suffix = [0] * (len(clipped) + 1)
+    for i in range(len(clipped) - 1, -1, -1):
+        suffix[i] = suffix[i + 1] + estimate_tokens(clipped[i].content)
+    start = next(i for i in cuts if suffix[i] <= budget or i == user_turns[-1])
+    return clipped[start:]
+
+def build_prompt(state: AgentState) -> List[BaseMessage]:
+    # static prefix | bounded history | clock: only the tail differs between calls
+    return [SYSTEM_MESSAGE] + history_window(state["messages"]) + [context_message(state)]
+
+async def agent_node(state: AgentState):
+    messages = build_prompt(state)
+
+    t0 = time.perf_counter()
+    model = chat_model or llm.get_chat_model(max_new_tokens=512, temperature=0.1)
+    with telemetry.span("llm.agent") as s:
+        resp = await model.ainvoke(messages)
+        usage = getattr(resp, "usage_metadata", None) or {}
+        s["input_tokens"] = usage.get("input_tokens") or sum(estimate_tokens(m.content) for m in messages)
+        s["output_tokens"] = usage.get("output_tokens") or estimate_tokens(str(resp.content))
+        elapsed_ms = (time.perf_counter() - t0) * 1000
+        s["generation_ms"] = round(elapsed_ms, 1)   # incl. building the model on the first call
+    input_tokens = s["input_tokens"]
+    telemetry.llm_tokens.inc("input", amount=input_tokens)
+    telemetry.llm_tokens.inc("output", amount=s["output_tokens"])
+    llm_stats["calls"] += 1
+    llm_stats["input_tokens"] += input_tokens
+    llm_stats["generation_ms"] += elapsed_ms
     return {"messages": [resp]}
 
-def tool_node(state: AgentState):
+# --- tool execution ---
+TOOLS = {
+    "list_events": tools.list_events,
+    "add_event": tools.add_event,
+    "update_event": tools.update_event,
+    "delete_event": tools.delete_event,
+    "reschedule_event": tools.reschedule_event,
+    "delete_events_in_range": tools.delete_events_in_range,
+    "find_best_slot": tools.find_best_slot,
+    "check_availability": tools.check_availability,
+    "find_event": tools.find_event,
+}
+READ_TOOLS = {"list_events", "find_best_slot", "check_availability", "find_event"}
+LOCAL_TIME_TOOLS = {"find_best_slot", "check_availability"}  # take the user's tz (working hours, output)
+TOOL_CONCURRENCY = int(os.getenv("AGENT_TOOL_CONCURRENCY", "4"))
+MAX_TOOL_CALLS = 10  # per agent message
+
+_decoder = json.JSONDecoder()
+
+def parse_tool_calls(text: str) -> List[dict]:
+    """Every {"tool": ..., "args": ...} in the text, in order.
+
+    Accepts one object, a JSON list of them, or several objects mixed with
+    prose / code fences. Each candidate is decoded exactly (raw_decode), so
+    braces inside strings or trailing text can't break it.
+    """
+    calls, i = [], 0
+    while i < len(text):
+        if text[i] not in "{[":
+            i += 1
+            continue
+        try:
+            value, end = _decoder.raw_decode(text, i)
+        except ValueError:
+            i += 1
+            continue
+        items = value if isinstance(value, list) else [value]
+        found = [c for c in items if isinstance(c, dict) and isinstance(c.get("tool"), str)]
+        if found:
+            calls.extend(found)
+            i = end
+        else:
+            i += 1
+    return calls[:MAX_TOOL_CALLS]
+
+def _touches(cmd: dict) -> set:
+    args = cmd.get("args") or {}
+    return {args[k] for k in ("event_id", "old_event_id") if isinstance(args.get(k), str)}
+
+def _conflicts(a: dict, b: dict) -> bool:
+    # Two calls must run in order if they touch the same event, if one reads
+    # what the other writes, or if either is a range delete
+    if "delete_events_in_range" in (a.get("tool"), b.get("tool")): return True
+    if (a.get("tool") in READ_TOOLS) != (b.get("tool") in READ_TOOLS): return True
+    return bool(_touches(a) & _touches(b))
+
+def plan_waves(calls: List[dict]) -> List[List[int]]:
+    """Group call indexes into waves: each wave runs concurrently, waves in order."""
+    level = []
+    for i, cmd in enumerate(calls):
+        level.append(max((level[j] + 1 for j in range(i) if _conflicts(calls[j], cmd)), default=0))
+    return [[i for i, l in enumerate(level) if l == n] for n in range(max(level) + 1)] if level else []
+
+async def run_tool(token: str, cmd: dict, tz=None) -> str:
+    tool = cmd.get("tool")
+    args = cmd.get("args") or {}
+    fn = TOOLS.get(tool)
+    if fn is None:
+        return f"Unknown tool: {tool}"
+    if tool in LOCAL_TIME_TOOLS: args = {**args, "tz": tz}
+    with telemetry.span("tool." + tool) as s:
+        try:
+            return await fn(token, **args)
+        except Exception as e:
+            s["error"] = type(e).__name__
+            return f"Error executing tool: {str(e)}"
+
+async def tool_node(state: AgentState):
     last_msg = state["messages"][-1].content
     token = state["user_token"]
+    tz = user_tz(state)
 
-    try:
-        # Extract JSON using Regex
-        json_match = re.search(r"\{.*\}", last_msg, re.DOTALL)
-        if not json_match:
-            return {"messages": [AIMessage(content="Please provide more details about your task.")]}
-
-        # --- FIX 3: USE JSON.LOADS INSTEAD OF EVAL ---
-        # Qwen might output 'true' (json) which fails in eval() (expects 'True')
-        cmd = json.loads(json_match.group(0)) 
-        
-        tool = cmd.get("tool")
-        args = cmd.get("args", {})
-
-        if tool == "list_events":
-            res = tools.list_events(token, **args)
-        elif tool == "add_event":
-            res = tools.add_event(token, **args)
-        elif tool == "update_event":
-            res = tools.update_event(token, **args)
-        elif tool == "delete_event":
-            res = tools.delete_event(token, **args)
-        elif tool == "reschedule_event":
-            res = tools.reschedule_event(token, **args)
-        elif tool == "delete_events_in_range":
-            res = tools.delete_events_in_range(token, **args)
-        else:
-            res = f"Unknown tool: {tool}"
+    calls = parse_tool_calls(last_msg)
+    if not calls:
+        if "{" in last_msg:
+            return {"messages": [AIMessage(content="Error: The AI generated invalid JSON. Please try again.")]}
+        return {"messages": [AIMessage(content="Please provide more details about your task.")]}
+
+    # Independent calls run together (bounded); dependent ones wait for their wave
+    results: List[str] = [""] * len(calls)
+    sem = asyncio.Semaphore(TOOL_CONCURRENCY)
 
-        return {"messages": [AIMessage(content=f"Calendar Tool Output: {res}")]}
+    async def run(i):
+        async with sem:
+            results[i] = await run_tool(token, calls[i], tz)
 
-    except json.JSONDecodeError:
-        return {"messages": [AIMessage(content="Error: The AI generated invalid JSON. Please try again.")]}
-    except Exception as e:
-        return {"messages": [AIMessage(content=f"Error executing tool: {str(e)}")]}
+    with telemetry.span("tool_node", calls=len(calls)) as s:
+        waves = plan_waves(calls)
+        s["waves"] = len(waves)
+        for wave in waves:
+            await asyncio.gather(*(run(i) for i in wave))
+
+    if len(calls) == 1:
+        return {"messages": [AIMessage(content=f"Calendar Tool Output: {results[0]}")]}
+    # All results in one message, numbered in the order the agent asked for them
+    lines = [f"[{n}] {cmd.get('tool')}: {res}" for n, (cmd, res) in enumerate(zip(calls, results), 1)]
+    return {"messages": [AIMessage(content="Calendar Tool Output: \n" + "\n".join(lines))]}
 
 def router(state: AgentState):
     last_msg = state["messages"][-1].content
@@ -128,13 +320,32 @@ def router(state: AgentState):
         return "tools"
     return END
 
+def guardrail_router(state: AgentState):
+    return END if state.get("route") == "blocked" else "fast_path"
+
+def fast_path_router(state: AgentState):
+    route = state.get("route")
+    if route == "ask": return END
+    return "tools" if route == "fast_path" else "agent"
+
+def after_tools(state: AgentState):
+    return "fast_reply" if state.get("route") == "fast_path" else "agent"
+
 # Build workflow
 workflow = StateGraph(AgentState)
+workflow.add_node("guardrail", guardrail_node)
+workflow.add_node("fast_path", fast_path_node)
 workflow.add_node("agent", agent_node)
 workflow.add_node("tools", tool_node)
+workflow.add_node("fast_reply", fast_reply_node)
 
-workflow.add_edge(START, "agent")
+workflow.add_edge(START, "guardrail")
+workflow.add_conditional_edges("guardrail", guardrail_router, {"fast_path": "fast_path", END: END})
+workflow.add_conditional_edges("fast_path", fast_path_router, {"tools": "tools", "agent": "agent", END: END})
 workflow.add_conditional_edges("agent", router, {"tools": "tools", END: END})
-workflow.add_edge("tools", "agent")
+workflow.add_conditional_edges("tools", after_tools, {"fast_reply": "fast_reply", "agent": "agent"})
+workflow.add_edge("fast_reply", END)
 
-app = workflow.compile()
\ No newline at end of file
+app = workflow.compile()
+# Same graph, with state kept per thread_id between requests (server.py session mode)
+persistent_app = workflow.compile(checkpointer=sessions.saver)
@@ -1,23 +1,121 @@
-from langchain_huggingface import HuggingFaceEndpoint
-from dotenv import load_dotenv
+import os
+import re
+import threading
+from collections import Counter, OrderedDict
+from typing import Optional, Tuple
 
-load_dotenv()
+import llm
+import telemetry
 
-llm = HuggingFaceEndpoint(
-    repo_id="Qwen/Qwen2.5-Coder-32B-Instruct",
-    task="text-generation",
-    max_new_tokens=10,
-    temperature=0.1
-)
+# Two-stage intent gate. A keyword/pattern scorer decides the clear cases in
+# microseconds; only the gray zone pays for an LLM YES/NO. Verdicts are cached
+# per normalised message.
+ENABLED = os.getenv("GUARDRAIL", "1") != "0"
+CACHE_SIZE = int(os.getenv("GUARDRAIL_CACHE_SIZE", "4096"))
+ALLOW_AT = 2    # score >= ALLOW_AT: on topic
+BLOCK_AT = -2   # score <= BLOCK_AT: off topic; anything in between goes to the LLM
 
-def validate_intent(text: str) -> bool:
+REFUSAL = ("I can only help with your calendar: checking your schedule, booking, moving or "
+           "clearing events, and finding free time.")
+
+# "local_allow", "local_block", "escalated", "cache_hits"
+stats = Counter()
+
+_WEIGHTS = {}
+for _words, _weight in [
+    # scheduling vocabulary
+    ("calendar calendars schedule scheduled scheduling reschedule meeting meetings appointment appointments "
+     "agenda event events book booked booking standup sync invite availability available slot slots busy "
+     "remind reminder deadline postpone", 3),
+    ("cancel delete clear move shift plan call calls lunch dinner breakfast interview review block focus gym "
+     "dentist doctor session class week weekend tonight today tomorrow morning afternoon evening noon "
+     "hour hours minute minutes time date day days when free upcoming next monday tuesday wednesday thursday "
+     "friday saturday sunday january february march april may june july august september october november "
+     "december month", 2),
+    # clearly something else
+    ("weather joke jokes poem story recipe capital president python javascript code program function bug "
+     "translate essay homework math equation stock stocks price bitcoin crypto news movie movies song lyrics "
+     "sports football cricket explain history define meaning recommend", -3),
+]:
+    for _w in _words.split():
+        _WEIGHTS[_w] = _weight
+
+_TIME_EXPR = re.compile(r"\b\d{1,2}(?::\d{2})?\s?(?:am|pm)\b|\b\d{1,2}:\d{2}\b|\b\d{4}-\d{2}-\d{2}\b|\bo'clock\b")
+_SMALL_TALK = {"hi", "hello", "hey", "thanks", "thank you", "ok", "okay", "yes", "no", "sure", "cool",
+               "great", "yes please", "no thanks", "go ahead", "do it", "cancel that", "never mind", "nevermind"}
+
+def normalise(text: str) -> str:
+    return " ".join(re.findall(r"\d{1,2}:\d{2}|[a-z0-9'-]+", text.lower()))
+
+def score(text: str) -> int:
+    norm = normalise(text)
+    total = sum(_WEIGHTS.get(w, 0) for w in norm.split())
+    if _TIME_EXPR.search(norm): total += 3
+    return total
+
+def classify(text: str, follow_up: bool = False) -> Tuple[Optional[bool], int]:
+    """(verdict, score); verdict None means "not sure, ask the LLM".
+
+    follow_up: the message answers an earlier assistant turn, so short
+    replies ("the gym one", "yes") are fine unless clearly off topic.
+    """
+    norm = normalise(text)
+    s = score(text)
+    if norm in _SMALL_TALK: return True, s
+    if s >= ALLOW_AT: return True, s
+    if s <= BLOCK_AT: return False, s
+    if follow_up and len(norm.split()) <= 6: return True, s
+    return None, s
+
+class _VerdictCache:
+    def __init__(self, max_entries: int):
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[str, bool]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> Optional[bool]:
+        with self._lock:
+            verdict = self._entries.get(key)
+            if verdict is not None: self._entries.move_to_end(key)
+            return verdict
+
+    def put(self, key: str, verdict: bool):
+        with self._lock:
+            self._entries[key] = verdict
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+verdicts = _VerdictCache(CACHE_SIZE)
+
+async def ask_llm(text: str) -> bool:
     prompt = f"""
     Is this text related to calendars, scheduling, meetings, or time?
     Text: "{text}"
     Reply only YES or NO.
     """
-    try:
-        resp = llm.invoke(prompt)
-        return "YES" in resp.upper()
-    except:
-        return True # Fail open if API errors
+    with telemetry.span("llm.guardrail"):
+        resp = await llm.get_chat_model(max_new_tokens=10, temperature=0.1).ainvoke(prompt)
+    return "YES" in resp.content.upper()
+
+async def validate_intent(text: str, follow_up: bool = False) -> bool:
+    key = f"{int(follow_up)}:{normalise(text)}"
+    cached = verdicts.get(key)
+    if cached is not None:
+        stats["cache_hits"] += 1
+        return cached
+    verdict, _ = classify(text, follow_up)
+    if verdict is not None:
+        stats["local_allow" if verdict else "local_block"] += 1
+    else:
+        stats["escalated"] += 1
+        try:
+            verdict = await ask_llm(text)
+        except:
+            return True # Fail open if API errors (and don't cache it)
+    verdicts.put(key, verdict)
+    return verdict
@@ -32,17 +32,30 @@ export async function GET(request: NextRequest) {
     
     // Append the token as a query parameter: ?user_token=...
     nlpUrl.searchParams.append('user_token', userToken);
+    // Pass through the browser's timezone and long-poll wait, if given
+    for (const param of ['timezone', 'wait']) {
+      const value = request.nextUrl.searchParams.get(param);
+      if (value) nlpUrl.searchParams.append(param, value);
+    }
+    const ifNoneMatch = request.headers.get('if-none-match');
 
     console.log(`Fetching events from: ${nlpUrl.toString()}`);
 
     const nlpResponse = await fetch(nlpUrl.toString(), {
       method: 'GET',
       headers: { 
-        'Content-Type': 'application/json'
+        'Content-Type': 'application/json',
         // Note: 'user_token' is REMOVED from headers
+        ...(ifNoneMatch ? { 'If-None-Match': ifNoneMatch } : {}),
       },
+      cache: 'no-store',
     });
 
+    // Nothing changed since the browser's copy
+    if (nlpResponse.status === 304) {
+      return new NextResponse(null, { status: 304, headers: { ETag: nlpResponse.headers.get('etag') || '' } });
+    }
+
     if (!nlpResponse.ok) {
       console.error('NLP Events Error:', nlpResponse.status);
       // Return empty array on failure so UI doesn't crash
@@ -50,7 +63,10 @@ export async function GET(request: NextRequest) {
     }
 
     const eventsData = await nlpResponse.json();
-    return NextResponse.json(eventsData);
+    const etag = nlpResponse.headers.get('etag');
+    return NextResponse.json(eventsData, {
+      headers: etag ? { ETag: etag, 'Cache-Control': 'private, no-cache' } : {},
+    });
 
   } catch (error) {
     console.error('Events API error:', error);
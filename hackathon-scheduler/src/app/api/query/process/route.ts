@@ -24,6 +24,7 @@ interface SessionData {
 interface RequestBody {
   messages: InputMessage[];
   timezone?: string;
+  session_id?: string; // backend keeps the history; messages is just the new turn
 }
 
 export const maxDuration = 600; 
@@ -46,7 +47,7 @@ export async function POST(request: NextRequest) {
 
     // 3. Parse and Type-Check Body
     const body = await request.json() as RequestBody;
-    const { messages, timezone } = body;
+    const { messages, timezone, session_id } = body;
 
     if (!Array.isArray(messages)) {
        return NextResponse.json({ success: false, message: 'Invalid format: messages must be an array.' }, { status: 400 });
@@ -62,7 +63,8 @@ export async function POST(request: NextRequest) {
     const nlpPayload = {
       messages: formattedMessages,
       user_token: userToken,
-      timezone: "Asia/Kolkata"
+      timezone: timezone || "Asia/Kolkata",
+      ...(session_id ? { session_id } : {})
     };
 
     console.log('Sending Payload:', JSON.stringify(nlpPayload, null, 2));
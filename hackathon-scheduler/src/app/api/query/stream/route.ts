@@ -0,0 +1,83 @@
+import { NextRequest, NextResponse } from 'next/server';
+
+// Streaming twin of api/query/process: forwards to the backend's /chat/stream
+// and pipes its Server-Sent Events straight back to the browser.
+interface InputMessage {
+  role: string;
+  text?: string;
+  content?: string;
+}
+
+interface SessionData {
+  tokens: {
+    access_token?: string;
+    id_token?: string;
+  };
+}
+
+interface RequestBody {
+  messages: InputMessage[];
+  timezone?: string;
+  session_id?: string;
+}
+
+export const maxDuration = 600;
+// Never buffer or cache a stream
+export const dynamic = 'force-dynamic';
+
+export async function POST(request: NextRequest) {
+  const sessionCookie = request.cookies.get('session')?.value;
+  if (!sessionCookie) {
+    return NextResponse.json({ success: false, message: 'Not authenticated' }, { status: 401 });
+  }
+
+  const session = JSON.parse(sessionCookie) as SessionData;
+  const userToken = session.tokens.access_token || session.tokens.id_token || "";
+  if (!userToken) {
+    return NextResponse.json({ success: false, message: 'Invalid token' }, { status: 401 });
+  }
+
+  const { messages, timezone, session_id } = await request.json() as RequestBody;
+  if (!Array.isArray(messages)) {
+    return NextResponse.json({ success: false, message: 'Invalid format: messages must be an array.' }, { status: 400 });
+  }
+
+  const nlpPayload = {
+    messages: messages.map((msg) => ({ role: msg.role, content: msg.content || msg.text || "" })),
+    user_token: userToken,
+    // The browser's zone decides "today" and the UTC offset; IST only if it didn't send one
+    timezone: timezone || "Asia/Kolkata",
+    ...(session_id ? { session_id } : {})
+  };
+
+  try {
+    const nlpResponse = await fetch('http://localhost:8000/chat/stream', {
+      method: 'POST',
+      headers: { 'Content-Type': 'application/json' },
+      body: JSON.stringify(nlpPayload),
+      // Closing the tab cancels the agent run upstream too
+      signal: request.signal
+    });
+
+    if (!nlpResponse.ok || !nlpResponse.body) {
+      console.error('NLP Server Error:', nlpResponse.status);
+      return NextResponse.json({
+        success: false,
+        message: 'The AI server had trouble processing your request.'
+      }, { status: nlpResponse.status === 401 ? 401 : 502 });
+    }
+
+    // Pass the body through untouched; frames reach the browser as they are produced
+    return new Response(nlpResponse.body, {
+      headers: {
+        'Content-Type': 'text/event-stream; charset=utf-8',
+        'Cache-Control': 'no-cache, no-transform',
+        'Connection': 'keep-alive',
+        'X-Accel-Buffering': 'no'
+      }
+    });
+  } catch (error) {
+    console.error('Streaming error:', error);
+    return NextResponse.json({ success: false, message: 'Internal server error' }, { status: 500 });
+  }
+}
@@ -57,6 +57,9 @@ export default function TaskScheduler() {
   const [loadingPhase, setLoadingPhase] = useState<'active' | 'fading' | 'complete'>('active');
 
   const messagesEndRef = useRef<HTMLDivElement>(null);
+  // The backend keeps the conversation under this id, so each request only carries the new message
+  const sessionIdRef = useRef<string>(typeof crypto !== 'undefined' && 'randomUUID' in crypto
+    ? crypto.randomUUID() : `${Date.now()}-${Math.random().toString(36).slice(2)}`);
 
   const scrollToBottom = () => {
     messagesEndRef.current?.scrollIntoView({ behavior: "smooth" });
@@ -134,26 +137,75 @@ export default function TaskScheduler() {
     try {
       const userTimezone = Intl.DateTimeFormat().resolvedOptions().timeZone;
       
-      const response = await fetch('/api/query/process', {
+      const response = await fetch('/api/query/stream', {
         method: 'POST',
         headers: { 'Content-Type': 'application/json' },
         body: JSON.stringify({ 
-            messages: updatedMessages, 
+            messages: [{ role: 'user', text: userMessage }], 
+            session_id: sessionIdRef.current,
             timezone: userTimezone 
         })
       });
+      if (!response.ok || !response.body) throw new Error(`HTTP ${response.status}`);
+
+      // Read the Server-Sent Events as they arrive: token frames grow a draft
+      // reply, tool_start throws the draft away, final is the whole answer.
+      const reader = response.body.getReader();
+      const decoder = new TextDecoder();
+      let buffer = '';
+      let draft = '';
+      let answer = '';
+      let shown = false;
+
+      const show = (text: string) => {
+        const replace = shown;
+        shown = true;
+        setIsLoading(false);
+        setMessages(prev => replace
+          ? [...prev.slice(0, -1), { role: 'assistant', text }]
+          : [...prev, { role: 'assistant', text }]);
+      };
+
+      while (true) {
+        const { done, value } = await reader.read();
+        if (done) break;
+        buffer += decoder.decode(value, { stream: true });
+        const frames = buffer.split('\n\n');
+        buffer = frames.pop() || '';
+
+        for (const frame of frames) {
+          const event = frame.match(/^event: (.*)$/m)?.[1];
+          const data = frame.match(/^data: (.*)$/m)?.[1];
+          if (!event || !data) continue;
+          const payload = JSON.parse(data);
+
+          if (event === 'token') {
+            draft += payload.text;
+            show(draft);
+          } else if (event === 'tool_start') {
+            draft = '';
+            if (shown) {
+              shown = false;
+              setMessages(prev => prev.slice(0, -1));
+              setIsLoading(true);
+            }
+          } else if (event === 'final') {
+            answer = payload.response;
+            show(answer);
+          } else if (event === 'error') {
+            throw new Error(payload.detail);
+          }
+        }
+      }
 
-      const result = await response.json();
-
-      if (result.response) {
-        setMessages(prev => [...prev, { role: 'assistant', text: result.response }]);
+      if (answer) {
         setCalendarId(prev => {
             if (!prev) return prev;
             const baseId = prev.split('&refresh=')[0];
             return `${baseId}&refresh=${Date.now()}`;
         });
       } else {
-        setMessages(prev => [...prev, { role: 'assistant', text: "I didn't get a response." }]);
+        show("I didn't get a response.");
       }
     } catch (error) {
       setMessages(prev => [...prev, { role: 'assistant', text: 'Connection error. Please try again.' }]);
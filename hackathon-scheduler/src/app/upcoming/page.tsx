@@ -43,7 +43,8 @@ export default function UpcomingPage() {
     // 2. Fetch Events
     const fetchEvents = async () => {
       try {
-        const res = await fetch('/api/events');
+        const timezone = Intl.DateTimeFormat().resolvedOptions().timeZone;
+        const res = await fetch(`/api/events?timezone=${encodeURIComponent(timezone)}`);
         const data: UpcomingResponse = await res.json();
         setEvents(data.upcoming || []);
       } catch (error) {
@@ -0,0 +1,290 @@
+import asyncio
+import hashlib
+import json
+import os
+import re
+import threading
+import time
+from collections import Counter, OrderedDict
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+from dotenv import load_dotenv
+from langchain_core.caches import RETURN_VAL_TYPE, BaseCache
+from langchain_core.callbacks import BaseCallbackHandler
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, AIMessageChunk, BaseMessage
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+from pydantic import Field
+
+import shared_state
+
+load_dotenv()
+
+# One place that decides which model answers. The agent (graph.py) and the
+# guardrail both get their chat model from get_chat_model(), built on first use:
+#   LLM_BACKEND=hf    Hugging Face Inference endpoint (default)
+#   LLM_BACKEND=stub  deterministic local model (replayed transcript, then
+#                     scripted rules, then a canned agent reply); no network
+BACKEND = os.getenv("LLM_BACKEND", "hf")
+MODEL_ID = os.getenv("LLM_MODEL", "Qwen/Qwen2.5-Coder-32B-Instruct")
+CACHE_ENABLED = os.getenv("LLM_CACHE", "1") != "0"
+CACHE_SIZE = int(os.getenv("LLM_CACHE_SIZE", "1024"))
+CACHE_TTL = float(os.getenv("LLM_CACHE_TTL", "600"))
+STUB_SCRIPT = os.getenv("LLM_STUB_SCRIPT")          # JSON list of {"match": regex, "reply": text}
+STUB_TRANSCRIPT = os.getenv("LLM_STUB_TRANSCRIPT")  # JSONL written by LLM_RECORD
+STUB_LATENCY_MS = float(os.getenv("LLM_STUB_LATENCY_MS", "0"))  # before the first word
+STUB_TOKEN_MS = float(os.getenv("LLM_STUB_TOKEN_MS", "0"))      # between words
+RECORD_PATH = os.getenv("LLM_RECORD")               # append every generation here, for replay
+
+# "calls": generations requested, "cache_hits": answered by the response cache
+stats = Counter()
+
+# --- normalised message keys ---
+def normalise(messages: Sequence[BaseMessage]) -> List[Dict[str, str]]:
+    # Role + whitespace-collapsed text; indentation/blank lines don't change the answer
+    return [{"role": m.type, "content": " ".join(str(m.content).split())} for m in messages]
+
+def _digest(normalised: List[Dict[str, str]]) -> str:
+    return hashlib.sha256(json.dumps(normalised, sort_keys=True).encode("utf-8")).hexdigest()
+
+def messages_key(messages: Sequence[BaseMessage]) -> str:
+    return _digest(normalise(messages))
+
+def _prompt_key(prompt: str) -> str:
+    # LangChain hands caches the serialized message list (langchain_core.load.dumps)
+    try:
+        serialized = json.loads(prompt)
+        normalised = [{"role": m["kwargs"].get("type") or m["id"][-1],
+                       "content": " ".join(str(m["kwargs"].get("content", "")).split())} for m in serialized]
+    except (ValueError, TypeError, KeyError):
+        normalised = [{"role": "human", "content": " ".join(prompt.split())}]
+    return _digest(normalised)
+
+# --- response cache ---
+class ResponseCache(BaseCache):
+    """Content-addressed TTL + LRU cache of generations.
+
+    Key: sha256 of the normalised messages and LangChain's llm_string (model
+    id, temperature, max tokens, stop, ...), so changing any parameter misses.
+    With shared_state on, entries are also published there for other workers.
+    """
+
+    def __init__(self, max_entries: int = CACHE_SIZE, ttl: float = CACHE_TTL):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries: "OrderedDict[str, Tuple[float, RETURN_VAL_TYPE]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.evictions = 0
+        self.shared_hits = 0
+
+    def _key(self, prompt: str, llm_string: str) -> str:
+        return hashlib.sha256(f"{_prompt_key(prompt)}\x00{llm_string}".encode("utf-8")).hexdigest()
+
+    def _local(self, key: str) -> Optional[RETURN_VAL_TYPE]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] <= time.monotonic():
+                del self._entries[key]
+                entry = None
+            if entry is not None:
+                self._entries.move_to_end(key)
+        return entry[1] if entry is not None else None
+
+    def lookup(self, prompt: str, llm_string: str) -> Optional[RETURN_VAL_TYPE]:
+        key = self._key(prompt, llm_string)
+        value = self._local(key)
+        if value is None: value = self._from_shared(key, shared_state.get(f"llm:{key}"))
+        if value is not None: stats["cache_hits"] += 1
+        return value
+
+    def _from_shared(self, key: str, raw: Optional[bytes]) -> Optional[RETURN_VAL_TYPE]:
+        if raw is None: return None
+        # Only the reply text is shared; token usage metadata stays with the worker that generated it
+        value = [ChatGeneration(message=AIMessage(content=text)) for text in json.loads(raw)]
+        self._store(key, value)
+        self.shared_hits += 1
+        return value
+
+    def update(self, prompt: str, llm_string: str, return_val: RETURN_VAL_TYPE) -> None:
+        if self.ttl <= 0: return
+        key = self._key(prompt, llm_string)
+        shared_state.put(f"llm:{key}", self._shared_text(return_val), self.ttl)
+        self._store(key, return_val)
+
+    def _shared_text(self, return_val: RETURN_VAL_TYPE) -> bytes:
+        return json.dumps([g.text for g in return_val]).encode("utf-8")
+
+    def _store(self, key: str, return_val: RETURN_VAL_TYPE):
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl, return_val)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self, **kwargs: Any) -> None:
+        with self._lock:
+            self._entries.clear()
+
+    # The in-memory part runs inline; only the shared_state call goes to its threads
+    async def alookup(self, prompt: str, llm_string: str) -> Optional[RETURN_VAL_TYPE]:
+        key = self._key(prompt, llm_string)
+        value = self._local(key)
+        if value is None: value = self._from_shared(key, await shared_state.aget(f"llm:{key}"))
+        if value is not None: stats["cache_hits"] += 1
+        return value
+
+    async def aupdate(self, prompt: str, llm_string: str, return_val: RETURN_VAL_TYPE) -> None:
+        if self.ttl <= 0: return
+        key = self._key(prompt, llm_string)
+        self._store(key, return_val)
+        await shared_state.aput(f"llm:{key}", self._shared_text(return_val), self.ttl)
+
+    async def aclear(self, **kwargs: Any) -> None:
+        self.clear()
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._entries)
+
+response_cache = ResponseCache()
+
+# --- call accounting + transcript recording ---
+class _Tap(BaseCallbackHandler):
+    run_inline = True
+
+    def __init__(self):
+        self._pending: Dict[Any, List[Dict[str, str]]] = {}
+
+    def on_chat_model_start(self, serialized, messages, *, run_id, **kwargs):
+        stats["calls"] += 1
+        if RECORD_PATH: self._pending[run_id] = normalise(messages[0])
+
+    def on_llm_end(self, response, *, run_id, **kwargs):
+        normalised = self._pending.pop(run_id, None)
+        if normalised is None: return
+        record = {"key": _digest(normalised), "messages": normalised, "reply": response.generations[0][0].text}
+        with open(RECORD_PATH, "a", encoding="utf-8") as f:
+            f.write(json.dumps(record) + "\n")
+
+    def on_llm_error(self, error, *, run_id, **kwargs):
+        self._pending.pop(run_id, None)
+
+_tap = _Tap()
+
+# --- stub backend ---
+def load_script(path: Optional[str]) -> List[Dict[str, str]]:
+    if not path: return []
+    with open(path, encoding="utf-8") as f:
+        return json.load(f)
+
+def load_transcript(path: Optional[str]) -> Dict[str, str]:
+    if not path: return {}
+    replies = {}
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            if line.strip():
+                record = json.loads(line)
+                replies[record["key"]] = record["reply"]
+    return replies
+
+def default_reply(messages: Sequence[BaseMessage]) -> str:
+    # Behaves like the agent on the happy path: list the week, then report back
+    convo = [m for m in messages if m.type != "system"]
+    last = str(convo[-1].content) if convo else ""
+    if "Reply only YES or NO" in last:
+        return "YES"
+    if last.startswith("Calendar Tool Output:"):
+        return "Here is what I found:\n" + last.replace("Calendar Tool Output:", "", 1).strip()
+    if convo and convo[-1].type == "human":
+        return '{"tool": "list_events", "args": {"days": 7}}'
+    return "Done."
+
+class StubChatModel(BaseChatModel):
+    """Deterministic local model for offline runs, tests and benchmarks."""
+
+    script: List[Dict[str, str]] = Field(default_factory=list)
+    transcript: Dict[str, str] = Field(default_factory=dict)
+    latency_ms: float = 0.0
+    token_ms: float = 0.0
+    # Only here so guardrail/agent settings get different cache keys, like the real model
+    max_new_tokens: int = 512
+    temperature: float = 0.1
+
+    @property
+    def _llm_type(self) -> str:
+        return "stub"
+
+    @property
+    def _identifying_params(self) -> Dict[str, Any]:
+        return {"max_new_tokens": self.max_new_tokens, "temperature": self.temperature}
+
+    def reply(self, messages: Sequence[BaseMessage]) -> str:
+        recorded = self.transcript.get(messages_key(messages))
+        if recorded is not None: return recorded
+        convo = [m for m in messages if m.type != "system"]
+        last = str(convo[-1].content) if convo else ""
+        for rule in self.script:
+            if re.search(rule["match"], last, re.IGNORECASE): return rule["reply"]
+        return default_reply(messages)
+
+    def _delay(self, text: str) -> float:
+        return (self.latency_ms + self.token_ms * max(0, len(text.split()) - 1)) / 1000
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs) -> ChatResult:
+        text = self.reply(messages)
+        time.sleep(self._delay(text))
+        return ChatResult(generations=[ChatGeneration(message=AIMessage(content=text))])
+
+    async def _agenerate(self, messages, stop=None, run_manager=None, **kwargs) -> ChatResult:
+        text = self.reply(messages)
+        await asyncio.sleep(self._delay(text))
+        return ChatResult(generations=[ChatGeneration(message=AIMessage(content=text))])
+
+    async def _astream(self, messages, stop=None, run_manager=None, **kwargs):
+        await asyncio.sleep(self.latency_ms / 1000)
+        for i, word in enumerate(self.reply(messages).split(" ")):
+            if i: await asyncio.sleep(self.token_ms / 1000)
+            yield ChatGenerationChunk(message=AIMessageChunk(content=word if i == 0 else " " + word))
+
+# --- provider ---
+_models: Dict[Tuple[str, int, float], BaseChatModel] = {}
+_models_lock = threading.Lock()
+
+def _build(max_new_tokens: int, temperature: float) -> BaseChatModel:
+    common = {"cache": response_cache if CACHE_ENABLED else False, "callbacks": [_tap]}
+    if BACKEND == "stub":
+        return StubChatModel(script=load_script(STUB_SCRIPT), transcript=load_transcript(STUB_TRANSCRIPT),
+                             latency_ms=STUB_LATENCY_MS, token_ms=STUB_TOKEN_MS,
+                             max_new_tokens=max_new_tokens, temperature=temperature, **common)
+    if BACKEND != "hf":
+        raise ValueError(f"Unknown LLM_BACKEND: {BACKEND}")
+    from langchain_huggingface import ChatHuggingFace, HuggingFaceEndpoint
+    endpoint = HuggingFaceEndpoint(
+        repo_id=MODEL_ID,
+        task="text-generation",
+        max_new_tokens=max_new_tokens,
+        temperature=temperature,
+        # graph.py used to read the misspelt HUGGINGFACEHUBAPITOKEN; keep it working
+        huggingfacehub_api_token=os.getenv("HUGGINGFACEHUB_API_TOKEN") or os.getenv("HUGGINGFACEHUBAPITOKEN"),
+    )
+    return ChatHuggingFace(llm=endpoint, **common)
+
+def get_chat_model(max_new_tokens: int = 512, temperature: float = 0.1) -> BaseChatModel:
+    """Shared chat model for these settings, created on first use."""
+    key = (BACKEND, max_new_tokens, temperature)
+    with _models_lock:
+        model = _models.get(key)
+        if model is None:
+            model = _models[key] = _build(max_new_tokens, temperature)
+    return model
+
+def cache_stats() -> Dict[str, int]:
+    return {
+        "calls": stats["calls"],
+        "cache_hits": stats["cache_hits"],
+        "generations": stats["calls"] - stats["cache_hits"],
+        "evictions": response_cache.evictions,
+        "shared_hits": response_cache.shared_hits,
+        "size": len(response_cache),
+    }
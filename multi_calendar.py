@@ -0,0 +1,228 @@
+import asyncio
+import heapq
+import itertools
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime
+from typing import Any, Awaitable, Callable, Dict, Iterator, List, Optional, Tuple
+
+import calendar_client
+import event_store
+import shared_state
+import token_cache
+from calendar_client import GOOGLE_CAL_BASE
+from event_store import EventStore
+
+# Reads across all of a user's calendars (own, team, shared, resources).
+# The list comes from calendarList, cached per user (and in shared_state, so
+# each worker doesn't ask again). The selected calendars are synced through
+# the event cache concurrently, CONCURRENCY at a time, so N calendars cost
+# about as much as the slowest one. Their start-sorted windows are merged
+# lazily with a heap (heapq.merge) into one timeline. A calendar that fails
+# is reported by name; the others still answer.
+LIST_TTL = float(os.getenv("CALENDAR_LIST_TTL", "600"))         # seconds a calendarList is trusted
+MAX_SELECTED = int(os.getenv("CALENDAR_MAX_SELECTED", "10"))    # calendars read per request, primary first
+CONCURRENCY = int(os.getenv("CALENDAR_FANOUT_CONCURRENCY", "8"))
+MAX_USERS = 1024
+LIST_FIELDS = "items(id,summary,summaryOverride,primary,selected,hidden,accessRole),nextPageToken"
+
+stats = {"list_hits": 0, "list_fetches": 0, "list_coalesced": 0, "list_errors": 0, "fanouts": 0, "calendar_errors": 0}
+
+_lists: "OrderedDict[str, Tuple[float, List[Dict[str, Any]]]]" = OrderedDict()   # user -> (expires, calendars)
+_inflight: Dict[str, Tuple[asyncio.AbstractEventLoop, asyncio.Future]] = {}   # user -> list fetch in progress
+_lock = threading.Lock()
+
+def _entry(item: Dict[str, Any]) -> Dict[str, Any]:
+    # The primary calendar is addressed as "primary" everywhere else (event cache, write-through hooks)
+    return {"id": "primary" if item.get("primary") else item["id"],
+            "name": item.get("summaryOverride") or item.get("summary") or item["id"],
+            "selected": bool(item.get("primary") or item.get("selected")) and not item.get("hidden"),
+            "access": item.get("accessRole", "")}
+
+async def _fetch_list(token: str) -> Dict[str, Any]:
+    calendars, params = [], {"fields": LIST_FIELDS, "maxResults": 250, "minAccessRole": "freeBusyReader"}
+    while True:
+        page = await calendar_client.request("GET", f"{GOOGLE_CAL_BASE}/users/me/calendarList", token, params=params)
+        if "error" in page: return page
+        calendars.extend(_entry(item) for item in page.get("items", []) if item.get("id"))
+        if not page.get("nextPageToken"): break
+        params["pageToken"] = page["nextPageToken"]
+    # Primary first, then Google's order
+    calendars.sort(key=lambda c: c["id"] != "primary")
+    return {"calendars": calendars}
+
+async def calendar_list(token: str) -> Dict[str, Any]:
+    """{"calendars": [{"id", "name", "selected", "access"}, ...]} or {"error": "..."}.
+
+    Concurrent misses for the same user share one fetch (same scheme as token_cache).
+    """
+    user = token_cache.user_key(token)
+    loop = asyncio.get_running_loop()
+    with _lock:
+        hit = _lists.get(user)
+        if hit and hit[0] > time.monotonic():
+            _lists.move_to_end(user)
+            stats["list_hits"] += 1
+            return {"calendars": hit[1]}
+        pending = _inflight.get(user)
+        # Futures can only be awaited on their own loop
+        if pending is not None and pending[0] is loop:
+            stats["list_coalesced"] += 1
+            fut = pending[1]
+        else:
+            fut = None
+            owned = loop.create_future()
+            _inflight[user] = (loop, owned)
+
+    if fut is not None:
+        return await asyncio.shield(fut)
+
+    try:
+        data = await _load_list(token, user)
+        owned.set_result(data)
+        return data
+    except asyncio.CancelledError:
+        owned.cancel()
+        raise
+    except Exception as e:
+        owned.set_exception(e)
+        owned.exception()   # nobody may be waiting on it
+        raise
+    finally:
+        with _lock:
+            if _inflight.get(user, (None, None))[1] is owned:
+                del _inflight[user]
+
+async def _load_list(token: str, user: str) -> Dict[str, Any]:
+    raw = await shared_state.aget(f"calendars:{user}")
+    if raw is not None:
+        data = {"calendars": json.loads(raw)}
+        stats["list_hits"] += 1
+    else:
+        data = await _fetch_list(token)
+        if "error" in data:
+            stats["list_errors"] += 1
+            return data
+        stats["list_fetches"] += 1
+        await shared_state.aput(f"calendars:{user}", json.dumps(data["calendars"]).encode("utf-8"), LIST_TTL)
+    with _lock:
+        _lists[user] = (time.monotonic() + LIST_TTL, data["calendars"])
+        _lists.move_to_end(user)
+        while len(_lists) > MAX_USERS: _lists.popitem(last=False)
+    return data
+
+async def forget(token: str):
+    """Drop the cached calendar list (e.g. after the user subscribed to a new calendar)."""
+    user = token_cache.user_key(token)
+    with _lock: _lists.pop(user, None)
+    await shared_state.adelete(f"calendars:{user}")
+
+async def selected(token: str, calendar_ids: Optional[List[str]] = None) -> Dict[str, str]:
+    """{calendar id: display name} to read, primary first.
+
+    Explicit ids are used as given. Otherwise the calendars the user shows in
+    Google Calendar; if the list can't be read, just the primary (as before).
+    """
+    data = await calendar_list(token)
+    known = {c["id"]: c["name"] for c in data.get("calendars", [])}
+    if calendar_ids:
+        return {cal: known.get(cal, cal) for cal in calendar_ids}
+    chosen = [c for c in data.get("calendars", []) if c["selected"]][:MAX_SELECTED]
+    return {c["id"]: c["name"] for c in chosen} or {"primary": "primary"}
+
+async def fan_out(calendar_ids: List[str], fn: Callable[[str], Awaitable[Any]]) -> Tuple[Dict[str, Any], Dict[str, str]]:
+    """Run fn(calendar_id) for each calendar, CONCURRENCY at a time: ({id: result}, {id: error}).
+
+    A result shaped {"error": ...} or an exception counts as that calendar's
+    error; it doesn't fail the others.
+    """
+    sem = asyncio.Semaphore(CONCURRENCY)
+    results: Dict[str, Any] = {}
+    errors: Dict[str, str] = {}
+
+    async def one(cal):
+        async with sem:
+            try:
+                value = await fn(cal)
+            except Exception as e:
+                value = {"error": f"{type(e).__name__}: {e}"}
+        if isinstance(value, dict) and "error" in value:
+            errors[cal] = str(value["error"])
+            stats["calendar_errors"] += 1
+        else:
+            results[cal] = value
+
+    stats["fanouts"] += 1
+    await asyncio.gather(*(one(cal) for cal in calendar_ids))
+    return results, errors
+
+async def sync(token: str, calendar_ids: Optional[List[str]] = None) -> Dict[str, Any]:
+    """Fresh event-cache copies of the calendars to read.
+
+    {"names": {id: name}, "stores": {id: EventStore}, "errors": {id: error}};
+    stores keep the order of names (primary first).
+    """
+    names = await selected(token, calendar_ids)
+
+    async def refresh(cal):
+        store = event_store.stores.get(token, cal)
+        error = await store.refresh(token)
+        return {"error": error} if error else store
+
+    stores, errors = await fan_out(list(names), refresh)
+    return {"names": names, "stores": {cal: stores[cal] for cal in names if cal in stores}, "errors": errors}
+
+def merge(windows: Dict[str, Tuple[EventStore, List[Dict[str, Any]]]]) -> Iterator[Tuple[str, Dict[str, Any]]]:
+    """(calendar id, event) across calendars by start time; each window is already start-sorted.
+
+    A heap over the per-calendar lists: nothing is concatenated or re-sorted,
+    and a caller that stops early never touches the rest.
+    """
+    def keyed(cal, store, events):
+        for event in events:
+            yield store.bounds_of(event["id"])[0], cal, event
+    streams = [keyed(cal, store, events) for cal, (store, events) in windows.items()]
+    return ((cal, event) for _, cal, event in heapq.merge(*streams, key=lambda item: item[0]))
+
+async def list_window(token: str, time_min: datetime, time_max: datetime,
+                      calendar_ids: Optional[List[str]] = None) -> Dict[str, Any]:
+    """Like event_store.list_window over several calendars.
+
+    {"items": iterator of (calendar id, event), "names": {...}, "errors": {...}},
+    or {"error": "..."} if no calendar could be read.
+    """
+    data = await sync(token, calendar_ids)
+    if not data["stores"]: return {"error": "; ".join(data["errors"].values()) or "no calendars"}
+    lo, hi = time_min.timestamp(), time_max.timestamp()
+    windows = {cal: (store, store.window(lo, hi)) for cal, store in data["stores"].items()}
+    return {"items": merge(windows), "names": data["names"], "errors": data["errors"]}
+
+async def find(token: str, query: str, time_min: Optional[datetime] = None, time_max: Optional[datetime] = None,
+               limit: int = 5, calendar_ids: Optional[List[str]] = None) -> Dict[str, Any]:
+    """Title search (see event_index) over several calendars, best matches first. Same shape as list_window."""
+    data = await sync(token, calendar_ids)
+    if not data["stores"]: return {"error": "; ".join(data["errors"].values()) or "no calendars"}
+    lo, hi = (time_min.timestamp() if time_min else None), (time_max.timestamp() if time_max else None)
+    # Each calendar's hits come ranked; merge the rankings and keep the overall top `limit`
+    def ranked(cal, store):
+        for key, event in store.rank(query, lo, hi, limit):
+            yield key, cal, event
+    merged = heapq.merge(*(ranked(cal, store) for cal, store in data["stores"].items()), key=lambda item: item[0])
+    return {"items": ((cal, event) for _, cal, event in itertools.islice(merged, limit)),
+            "names": data["names"], "errors": data["errors"]}
+
+async def wait_any(stores: List[EventStore], timeout: float):
+    """Return when any of the stores changes (see EventStore.wait), or after `timeout` seconds."""
+    waits = [asyncio.ensure_future(store.wait(timeout)) for store in stores]
+    try:
+        await asyncio.wait(waits, return_when=asyncio.FIRST_COMPLETED)
+    finally:
+        for w in waits: w.cancel()
+
+def cache_stats() -> Dict[str, int]:
+    with _lock:
+        users = len(_lists)
+    return dict(stats, cached_lists=users)
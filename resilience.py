@@ -0,0 +1,155 @@
+import asyncio
+import os
+import random
+import time
+from collections import OrderedDict
+from typing import Dict, Optional
+
+import telemetry
+
+# Policies for outbound Calendar calls (used by calendar_client.send):
+#   - token buckets per user and per project, sized to the Calendar quotas,
+#     so we queue briefly instead of collecting 429s
+#   - full-jitter exponential backoff on 429/5xx, honouring Retry-After
+#   - a circuit breaker that fails fast while Google is degraded instead of
+#     making every request wait out its timeouts
+# Per process: with WEB_CONCURRENCY workers each one gets its share of the per-user and project budgets
+# (a user's requests can land on any worker, so a whole bucket each would allow WORKERS x the quota)
+WORKERS = max(1, int(os.getenv("WEB_CONCURRENCY", "1")))
+USER_QPS = float(os.getenv("CALENDAR_USER_QPS", "10")) / WORKERS         # Calendar's default: 600 req/min per user
+USER_BURST = float(os.getenv("CALENDAR_USER_BURST", "300")) / WORKERS     # quota windows are per minute, so bursts are fine
+PROJECT_QPS = float(os.getenv("CALENDAR_PROJECT_QPS", "150")) / WORKERS  # keep under the per-project quota; 0 = unlimited
+PROJECT_BURST = float(os.getenv("CALENDAR_PROJECT_BURST", "300")) / WORKERS
+MAX_ATTEMPTS = int(os.getenv("CALENDAR_MAX_ATTEMPTS", "4"))
+BACKOFF_BASE = float(os.getenv("CALENDAR_BACKOFF_BASE", "0.25"))  # seconds; doubles per attempt, full jitter
+BACKOFF_CAP = 8.0
+DEADLINE = float(os.getenv("CALENDAR_DEADLINE", "20"))        # whole call incl. queueing and retries
+BREAKER_FAILURES = int(os.getenv("CALENDAR_BREAKER_FAILURES", "5"))  # consecutive failures that open it
+BREAKER_COOLDOWN = float(os.getenv("CALENDAR_BREAKER_COOLDOWN", "15"))
+RETRYABLE = {429, 500, 502, 503, 504}
+MAX_USERS = 10_000  # per-user buckets kept (LRU)
+
+retries = telemetry.Count("google_retries_total", "Google calls retried, by operation and cause", ("op", "reason"))
+rejected = telemetry.Count("google_rejected_total", "Google calls refused locally without being sent", ("reason",))
+throttle_wait = telemetry.Histogram("google_throttle_wait_seconds", "Time queued by the rate limiter", ())
+
+class Unavailable(Exception):
+    """Refused locally: circuit open or rate-limit queue longer than the deadline."""
+
+    def __init__(self, message: str, status: int, reason: str):
+        super().__init__(message)
+        self.status = status
+        self.reason = reason
+
+def backoff_delay(attempt: int, retry_after: Optional[float] = None) -> float:
+    """Seconds to wait before retry number `attempt` (1-based)."""
+    if retry_after is not None:
+        return min(retry_after, BACKOFF_CAP)
+    return random.uniform(0, min(BACKOFF_CAP, BACKOFF_BASE * (2 ** attempt)))
+
+def retry_after(headers) -> Optional[float]:
+    try:
+        return max(0.0, float(headers.get("retry-after")))
+    except (TypeError, ValueError):
+        return None  # absent, or an HTTP date; use our own backoff
+
+# --- rate limiting ---
+class TokenBucket:
+    # Reservation style: tokens may go negative and the caller sleeps off the
+    # debt, so waiters are served in arrival order without a lock or a queue.
+    __slots__ = ("rate", "burst", "tokens", "updated")
+
+    def __init__(self, rate: float, burst: float):
+        self.rate, self.burst = rate, burst
+        self.tokens, self.updated = burst, time.monotonic()
+
+    def reserve(self, cost: float, now: float) -> float:
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        self.tokens -= min(cost, self.burst)
+        return -self.tokens / self.rate if self.tokens < 0 else 0.0
+
+    def refund(self, cost: float):
+        self.tokens = min(self.burst, self.tokens + min(cost, self.burst))
+
+class RateLimiter:
+    def __init__(self, user_qps: float = USER_QPS, user_burst: float = USER_BURST,
+                 project_qps: float = PROJECT_QPS, project_burst: float = PROJECT_BURST):
+        self.user_qps, self.user_burst = user_qps, user_burst
+        self.project = TokenBucket(project_qps, project_burst) if project_qps > 0 else None
+        self._users: "OrderedDict[str, TokenBucket]" = OrderedDict()
+
+    def _user(self, key: str) -> Optional[TokenBucket]:
+        if self.user_qps <= 0: return None
+        bucket = self._users.get(key)
+        if bucket is None:
+            bucket = self._users[key] = TokenBucket(self.user_qps, self.user_burst)
+            if len(self._users) > MAX_USERS: self._users.popitem(last=False)
+        else:
+            self._users.move_to_end(key)
+        return bucket
+
+    async def acquire(self, user: str, cost: float = 1, budget: float = DEADLINE):
+        """Wait for quota; raises Unavailable(429) rather than queue past `budget` seconds."""
+        now = time.monotonic()
+        buckets = [b for b in (self._user(user), self.project) if b is not None]
+        wait = max([b.reserve(cost, now) for b in buckets], default=0.0)
+        if wait > budget:
+            for b in buckets: b.refund(cost)
+            rejected.inc("rate_limited")
+            raise Unavailable("Calendar request quota is exhausted for now. Do not retry; "
+                              "tell the user to try again in a minute.", 429, "rate_limited")
+        if wait > 0:
+            throttle_wait.observe(wait)
+            await asyncio.sleep(wait)
+
+    def stats(self) -> Dict[str, float]:
+        return {"users": len(self._users), "project_tokens": round(self.project.tokens, 1) if self.project else 0}
+
+# --- circuit breaker ---
+class CircuitBreaker:
+    """closed -> open after BREAKER_FAILURES consecutive failures; open fails fast for
+    BREAKER_COOLDOWN seconds; then one probe call (half-open) decides which way it goes."""
+    CLOSED, OPEN, HALF_OPEN = "closed", "open", "half_open"
+
+    def __init__(self, failures: int = BREAKER_FAILURES, cooldown: float = BREAKER_COOLDOWN):
+        self.threshold, self.cooldown = failures, cooldown
+        self.state = self.CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self.probing = False
+        self.opens = 0
+
+    def before(self):
+        if self.state == self.CLOSED: return
+        if self.state == self.OPEN and time.monotonic() - self.opened_at >= self.cooldown:
+            self.state, self.probing = self.HALF_OPEN, False
+        if self.state == self.HALF_OPEN and not self.probing:
+            self.probing = True
+            return
+        rejected.inc("circuit_open")
+        retry_in = max(1, round(self.cooldown - (time.monotonic() - self.opened_at)))
+        raise Unavailable(f"Google Calendar is unavailable right now. Do not retry; "
+                          f"tell the user to try again in about {retry_in} seconds.", 503, "circuit_open")
+
+    def record(self, ok: bool):
+        if ok:
+            self.state, self.failures, self.probing = self.CLOSED, 0, False
+            return
+        self.failures += 1
+        if self.state == self.HALF_OPEN or self.failures >= self.threshold:
+            if self.state != self.OPEN: self.opens += 1
+            self.state, self.opened_at, self.probing = self.OPEN, time.monotonic(), False
+
+    def release(self):
+        # A granted probe that never got an answer (cancelled): let the next call probe
+        if self.state == self.HALF_OPEN: self.probing = False
+
+    def stats(self) -> Dict[str, float]:
+        return {"open": int(self.state == self.OPEN), "half_open": int(self.state == self.HALF_OPEN),
+                "consecutive_failures": self.failures, "opens": self.opens}
+
+limiter = RateLimiter()
+breaker = CircuitBreaker()
+telemetry.register("google_breaker", breaker.stats)
+telemetry.register("google_limiter", limiter.stats)
@@ -1,27 +1,66 @@
 
 
-from fastapi import FastAPI, HTTPException, Query
+from fastapi import FastAPI, Header, HTTPException, Query
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import PlainTextResponse, Response, StreamingResponse
 from pydantic import BaseModel
-from typing import List, Dict, Any, Optional
-from datetime import datetime, timedelta, timezone
-import requests  # <--- Added for Google API calls
+from typing import List, Dict, Any, Optional, Tuple
+from datetime import datetime
+from contextlib import asynccontextmanager
+import json
 import os
 from dotenv import load_dotenv
 
 load_dotenv()
 
 # Import our Graph
-from graph import app as graph_app
+import graph
+from graph import app as graph_app, persistent_app, parse_tool_calls
 from tools import validate_token
+import calendar_client
+import event_store
+import fast_path
+import guardrail
+import llm
+import multi_calendar
+import sessions
+import shared_state
+import telemetry
+import token_cache
+import upcoming
+import watch
 
-app = FastAPI()
+@asynccontextmanager
+async def lifespan(app):
+    # Sessions idle past SESSION_TTL are dropped at startup (and periodically after)
+    sessions.saver.expire()
+    yield
+    # Drop the pooled Google connections on shutdown
+    await calendar_client.aclose()
+    sessions.saver.close()
+    shared_state.close()
 
-@app.middleware("http")
-async def log_requests(request, call_next):
-    print(f"Hit: {request.method} {request.url}")
-    response = await call_next(request)
-    return response
+app = FastAPI(lifespan=lifespan)
+
+# Per-request trace + latency histograms (telemetry.py); slow requests are
+# logged as one JSON line with their spans
+app.add_middleware(telemetry.Middleware)
+
+# Existing counters, exposed next to the histograms on /metrics
+telemetry.register("token_cache", lambda: token_cache.cache.stats())
+telemetry.register("event_store", lambda: event_store.stores.stats())
+telemetry.register("llm_cache", llm.cache_stats)
+telemetry.register("agent", lambda: graph.llm_stats)
+telemetry.register("fast_path", lambda: dict(fast_path.stats, hit_rate=fast_path.hit_rate()))
+telemetry.register("guardrail", lambda: dict(guardrail.stats))
+telemetry.register("shared_state", shared_state.stats)
+telemetry.register("upcoming", lambda: dict(upcoming.stats))
+telemetry.register("calendar_watch", lambda: dict(watch.stats))
+telemetry.register("calendars", multi_calendar.cache_stats)
+
+@app.get("/metrics")
+async def metrics():
+    return PlainTextResponse(telemetry.render(), media_type="text/plain; version=0.0.4")
 
 # --- CORS MIDDLEWARE ---
 origins = [
@@ -42,139 +81,186 @@ app.add_middleware(
 class ChatRequest(BaseModel):
     messages: List[Dict[str, Any]]
     user_token: str
-    timezone: Optional[str] = "UTC"
+    timezone: Optional[str] = calendar_client.DEFAULT_TZ.key  # same fallback as the tools
+    # With a session_id the server keeps the conversation (sessions.py): send
+    # only the new user message(s). Without one, send the full history each time.
+    session_id: Optional[str] = None
 
 # --- CHAT ENDPOINT ---
 @app.post("/chat")
 async def chat_endpoint(req: ChatRequest):
     try:
-        if not validate_token(req.user_token):
+        if not await validate_token(req.user_token):
             raise HTTPException(
                 status_code=401, 
                 detail="Invalid or expired Google OAuth token."
             )
         
-        lc_messages = to_lc_messages(req.messages)
-
-        result = graph_app.invoke({
-            "messages": lc_messages,
-            "user_token": req.user_token,
-            "current_time": datetime.now().isoformat(),
-            "user_timezone": req.timezone,
-            "current_action": None,
-            "pending_details": None
-        })
+        graph, state, config = graph_run(req)
+        # durability="exit": one checkpoint write per turn, not one per node
+        result = await graph.ainvoke(state, config, durability="exit" if config else None)
 
         last_message = result["messages"][-1]
+        if req.session_id:
+            return {"response": last_message.content, "session_id": req.session_id}
         return {"response": last_message.content}
 
+    except HTTPException:
+        raise
     except Exception as e:
         print(f"Error: {e}")
+        telemetry.record_error("chat", e)
         raise HTTPException(status_code=500, detail=str(e))
 
+# --- STREAMING CHAT ENDPOINT ---
+# Same graph as /chat, but as Server-Sent Events so the UI can render while
+# the agent is still working. Frames (event: <name>, data: <json>):
+#   token      {"text"}             a piece of the assistant's reply
+#   tool_start {"tool", "args"}     a calendar tool is about to run; drop any draft text
+#   tool_end   {"tool", "output"}
+#   final      {"response"}         the complete answer (same as /chat's "response")
+#   error      {"detail"}
+@app.post("/chat/stream")
+async def chat_stream_endpoint(req: ChatRequest):
+    if not await validate_token(req.user_token):
+        raise HTTPException(
+            status_code=401, 
+            detail="Invalid or expired Google OAuth token."
+        )
+    graph, state, config = graph_run(req)
+    return StreamingResponse(
+        chat_events(state, graph, config),
+        media_type="text/event-stream",
+        # no-transform/X-Accel-Buffering: keep proxies from holding frames back
+        headers={"Cache-Control": "no-cache, no-transform", "X-Accel-Buffering": "no"},
+    )
+
+def sse(event: str, data: Dict[str, Any]) -> str:
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+async def chat_events(state: Dict[str, Any], graph=graph_app, config: Optional[Dict[str, Any]] = None):
+    # Per LLM call: True = prose, stream it; False = JSON tool call(s), keep it quiet.
+    # Decided on the first non-blank characters, which are buffered until then.
+    prose: Dict[str, bool] = {}
+    held: Dict[str, str] = {}
+    current_tools = ""
+    try:
+        async for ev in graph.astream_events(state, config, version="v2", durability="exit" if config else None):
+            kind = ev["event"]
+            node = ev.get("metadata", {}).get("langgraph_node")
+
+            if kind == "on_chat_model_stream" and node == "agent":
+                text = ev["data"]["chunk"].content
+                if not isinstance(text, str) or not text:
+                    continue
+                run = ev["run_id"]
+                if run not in prose:
+                    text = held.pop(run, "") + text
+                    if not text.strip():
+                        held[run] = text
+                        continue
+                    prose[run] = not text.lstrip().startswith(("{", "[", "`"))
+                if prose[run]:
+                    yield sse("token", {"text": text})
+
+            elif kind == "on_chain_start" and ev["name"] == "tools" and node == "tools":
+                # One frame per call when the agent asked for several at once
+                calls = parse_tool_calls(ev["data"]["input"]["messages"][-1].content)
+                current_tools = ", ".join(str(cmd.get("tool")) for cmd in calls)
+                for cmd in calls:
+                    yield sse("tool_start", {"tool": cmd.get("tool"), "args": cmd.get("args", {})})
+
+            elif kind == "on_chain_end" and ev["name"] == "tools" and node == "tools":
+                output = ev["data"]["output"]["messages"][-1].content
+                yield sse("tool_end", {"tool": current_tools, "output": output.replace("Calendar Tool Output: ", "", 1)})
+
+            elif kind == "on_chain_end" and not ev.get("parent_ids"):
+                # The graph run itself finished
+                yield sse("final", {"response": ev["data"]["output"]["messages"][-1].content})
+
+    except Exception as e:
+        print(f"Error: {e}")
+        telemetry.record_error("chat_stream", e)
+        yield sse("error", {"detail": str(e)})
+
 # --- UPCOMING EVENTS ENDPOINT (NEW) ---
+# Today + the next 4 days in the caller's timezone, served from the event
+# cache as a prepared payload (upcoming.py). Send If-None-Match with the last
+# ETag to get a 304 when nothing changed; add ?wait=N to long-poll for up
+# to N seconds until something does.
 @app.get("/events/upcoming")
-async def get_upcoming_events(user_token: str = Query(..., alias="user_token")):
+async def get_upcoming_events(
+    user_token: str = Query(..., alias="user_token"),
+    timezone: Optional[str] = Query(None),
+    wait: float = Query(0),
+    if_none_match: Optional[str] = Header(None),
+):
     try:
-        # 1. Define IST explicitly
-        IST = timezone(timedelta(hours=5, minutes=30))
-        
-        # 2. Get "Now" in IST
-        now_ist = datetime.now(IST)
-        
-        # 3. FORCE START AT MIDNIGHT (The Critical Fix)
-        # We strip the time and set it to 00:00:00. This captures ALL of "Today".
-        start_of_today = now_ist.replace(hour=0, minute=0, second=0, microsecond=0)
-        
-        # 4. End Window = Start + 5 Days (Today + Next 4 Days)
-        end_window = start_of_today + timedelta(days=5)
-        
-        # 5. Format for Google API
-        # We use .isoformat() which keeps the "+05:30" offset.
-        time_min = start_of_today.isoformat()
-        time_max = end_window.isoformat()
-        
-        # 6. Call Google Calendar API Directly
-        url = "https://www.googleapis.com/calendar/v3/calendars/primary/events"
-        headers = {"Authorization": f"Bearer {user_token}"}
-        params = {
-            "timeMin": time_min,
-            "timeMax": time_max,
-            "singleEvents": "true",
-            "orderBy": "startTime"
-        }
-        
-        # Note: requests is blocking, but acceptable for this scale.
-        response = requests.get(url, headers=headers, params=params)
-        
-        if response.status_code != 200:
-            # Silently return empty list on token error instead of crashing UI
-            print(f"Google API Error: {response.text}")
+        # Same token check as /chat (cached, so polling stays cheap)
+        if not await validate_token(user_token):
             return {"upcoming": []}
-            
-        items = response.json().get("items", [])
-        
-        # 7. Format Data for Frontend
-        formatted_events = []
-        
-        for event in items:
-            # Skip cancelled events
-            if event.get("status") == "cancelled":
-                continue
-                
-            # Get Start Time
-            start_raw = event.get("start", {}).get("dateTime")
-            end_raw = event.get("end", {}).get("dateTime")
-            if not start_raw: 
-                continue # Skip all-day events
-                
-            # Parse Dates Safely
-            try:
-                # Handle "Z" (UTC) vs Offsets (+05:30)
-                # We standardize everything to IST for display
-                if "Z" in start_raw:
-                    dt_obj = datetime.fromisoformat(start_raw.replace("Z", "+00:00")).astimezone(IST)
-                    dt_end = datetime.fromisoformat(end_raw.replace("Z", "+00:00")).astimezone(IST)
-                else:
-                    dt_obj = datetime.fromisoformat(start_raw)
-                    dt_end = datetime.fromisoformat(end_raw)
-                    
-            except ValueError:
-                continue 
-
-            # Calculate "Human Readable" labels based on IST dates
-            day_diff = (dt_obj.date() - now_ist.date()).days
-            
-            # Logic: Cap at Today + 4 days (Total 5 days)
-            if day_diff > 4:
-                continue
-            
-            if day_diff == 0:
-                date_label = "Today"
-            elif day_diff == 1:
-                date_label = "Tomorrow"
-            else:
-                date_label = dt_obj.strftime("%a, %b %d") # e.g., "Mon, Jan 20"
-            
-            # Create Clean JSON Object
-            formatted_events.append({
-                "id": event.get("id"),
-                "title": event.get("summary", "No Title"),
-                "start_time": dt_obj.strftime("%I:%M %p"), # e.g. "02:00 PM"
-                "end_time": dt_end.strftime("%I:%M %p"),
-                "date_label": date_label,
-                "is_urgent": "deadline" in event.get("summary", "").lower()
-            })
-            
-        return {"upcoming": formatted_events}
+
+        etag, body = await upcoming.poll(user_token, timezone, if_none_match, wait)
+        # No ETag when Google couldn't be read: the empty list isn't the calendar's state
+        headers = {"ETag": etag, "Cache-Control": "private, no-cache"} if etag else {}
+        if body is None:
+            return Response(status_code=304, headers=headers)
+        return Response(content=body, media_type="application/json", headers=headers)
 
     except Exception as e:
         print(f"Error fetching upcoming events: {e}")
+        telemetry.record_error("upcoming", e)
         return {"upcoming": []}
 
+# --- GOOGLE PUSH NOTIFICATIONS ---
+# Target of the watch channels opened by watch.py (CALENDAR_WEBHOOK_URL).
+@app.post("/webhooks/calendar")
+async def calendar_webhook(
+    x_goog_channel_id: Optional[str] = Header(None),
+    x_goog_channel_token: Optional[str] = Header(None),
+    x_goog_resource_state: Optional[str] = Header(None),
+):
+    if not await watch.notify(x_goog_channel_id, x_goog_channel_token, x_goog_resource_state):
+        raise HTTPException(status_code=403, detail="Unknown channel")
+    return Response(status_code=200)
+
 # --- HELPERS ---
 from langchain_core.messages import HumanMessage, AIMessage
 
+def initial_state(req: ChatRequest) -> Dict[str, Any]:
+    return {
+        "messages": to_lc_messages(req.messages),
+        "user_token": req.user_token,
+        "current_time": datetime.now().isoformat(),
+        "user_timezone": req.timezone,
+        "current_action": None,
+        "pending_details": None,
+        "route": None
+    }
+
+def session_state(req: ChatRequest) -> Dict[str, Any]:
+    # Only what's new this turn; history, current_action and pending_details
+    # come from the checkpoint. The token is never stored, so it's passed every time.
+    messages = to_lc_messages(req.messages)
+    i = len(messages)
+    while i > 0 and isinstance(messages[i - 1], HumanMessage):
+        i -= 1
+    return {
+        "messages": messages[i:],
+        "user_token": req.user_token,
+        "current_time": datetime.now().isoformat(),
+        "user_timezone": req.timezone,
+        "session_id": req.session_id,
+        "route": None
+    }
+
+def graph_run(req: ChatRequest) -> Tuple[Any, Dict[str, Any], Optional[Dict[str, Any]]]:
+    # (graph, input, config) for this request: stateless, or resumed from its session
+    if not req.session_id:
+        return graph_app, initial_state(req), None
+    thread = sessions.thread_id(token_cache.user_key(req.user_token), req.session_id)
+    return persistent_app, session_state(req), {"configurable": {"thread_id": thread}}
+
 def to_lc_messages(messages):
     lc = []
     for m in messages:
@@ -186,4 +272,5 @@ def to_lc_messages(messages):
 
 if __name__ == "__main__":
     import uvicorn
-    uvicorn.run(app, host="0.0.0.0", port=8000)
+    # WEB_CONCURRENCY > 1: one process per worker, caches/sessions shared through shared_state.py
+    uvicorn.run("server:app", host="0.0.0.0", port=8000, workers=shared_state.WORKERS)
@@ -0,0 +1,366 @@
+import os
+import sqlite3
+import threading
+import time
+from typing import Any, AsyncIterator, Dict, Iterator, Optional, Sequence, Tuple
+
+from langchain_core.messages import HumanMessage
+from langchain_core.runnables import RunnableConfig
+from langgraph.checkpoint.base import (
+    WRITES_IDX_MAP,
+    BaseCheckpointSaver,
+    ChannelVersions,
+    Checkpoint,
+    CheckpointMetadata,
+    CheckpointTuple,
+    get_checkpoint_id,
+    get_checkpoint_metadata,
+)
+
+import shared_state
+
+# Conversation state per session_id, persisted in a local SQLite file so a
+# client only sends its new message and a restarted worker picks the thread
+# back up (including pending_details for half-finished bookings). Workers on
+# one host share the file; with SHARED_STATE=redis://... sessions live in
+# Redis instead (SharedCheckpointer), so any host can continue a session.
+DB_PATH = os.getenv("SESSION_DB", "sessions.db")
+SESSION_TTL = float(os.getenv("SESSION_TTL", str(7 * 24 * 3600)))   # idle sessions are deleted after this
+MAX_MESSAGES = int(os.getenv("SESSION_MAX_MESSAGES", "40"))         # older turns are compacted away
+EXPIRE_EVERY = 300.0  # seconds between expiry sweeps
+
+# Never written to disk; the caller supplies them again on every turn
+TRANSIENT_CHANNELS = ("user_token",)
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS checkpoints (
+    thread_id TEXT NOT NULL,
+    checkpoint_ns TEXT NOT NULL DEFAULT '',
+    checkpoint_id TEXT NOT NULL,
+    parent_checkpoint_id TEXT,
+    type TEXT,
+    checkpoint BLOB,
+    metadata_type TEXT,
+    metadata BLOB,
+    updated_at REAL NOT NULL,
+    PRIMARY KEY (thread_id, checkpoint_ns)
+);
+CREATE INDEX IF NOT EXISTS checkpoints_updated ON checkpoints (updated_at);
+CREATE TABLE IF NOT EXISTS writes (
+    thread_id TEXT NOT NULL,
+    checkpoint_ns TEXT NOT NULL DEFAULT '',
+    checkpoint_id TEXT NOT NULL,
+    task_id TEXT NOT NULL,
+    idx INTEGER NOT NULL,
+    channel TEXT NOT NULL,
+    type TEXT,
+    value BLOB,
+    task_path TEXT NOT NULL DEFAULT '',
+    PRIMARY KEY (thread_id, checkpoint_ns, checkpoint_id, task_id, idx)
+);
+"""
+
+def compact_messages(messages: list, limit: int = MAX_MESSAGES) -> list:
+    # Keep the newest `limit` messages, starting at a user turn
+    if len(messages) <= limit: return messages
+    tail = messages[-limit:]
+    for i, m in enumerate(tail):
+        if isinstance(m, HumanMessage): return tail[i:]
+    return tail
+
+class SqliteCheckpointer(BaseCheckpointSaver):
+    """LangGraph checkpointer on stdlib sqlite3 that keeps the latest checkpoint per thread.
+
+    Each put replaces the thread's row, so the file holds one bounded state
+    per session (messages compacted to MAX_MESSAGES) rather than a history.
+    """
+
+    def __init__(self, path: str = DB_PATH, ttl: float = SESSION_TTL, max_messages: int = MAX_MESSAGES):
+        super().__init__()
+        self.path = path
+        self.ttl = ttl
+        self.max_messages = max_messages
+        self._db: Optional[sqlite3.Connection] = None
+        self._pid = 0
+        self._lock = threading.Lock()
+        self._last_sweep = 0.0
+
+    def _conn(self) -> sqlite3.Connection:
+        # Opened on first use, not at import, and again in a forked worker.
+        # timeout: wait for another worker's write instead of failing with "database is locked"
+        if self._db is None or self._pid != os.getpid():
+            db = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None, timeout=5)
+            db.execute("PRAGMA journal_mode=WAL")
+            db.execute("PRAGMA synchronous=NORMAL")
+            db.executescript(_SCHEMA)
+            self._db, self._pid = db, os.getpid()
+        return self._db
+
+    def close(self):
+        with self._lock:
+            if self._db is not None and self._pid == os.getpid():
+                self._db.close()
+            self._db = None
+
+    # --- reads ---
+    def _tuple(self, row, db) -> CheckpointTuple:
+        thread_id, ns, checkpoint_id, parent_id, type_, blob, meta_type, meta_blob = row
+        writes = db.execute(
+            "SELECT task_id, channel, type, value FROM writes WHERE thread_id=? AND checkpoint_ns=? AND checkpoint_id=? "
+            "ORDER BY task_id, idx", (thread_id, ns, checkpoint_id)).fetchall()
+        return CheckpointTuple(
+            config={"configurable": {"thread_id": thread_id, "checkpoint_ns": ns, "checkpoint_id": checkpoint_id}},
+            checkpoint=self.serde.loads_typed((type_, blob)),
+            metadata=self.serde.loads_typed((meta_type, meta_blob)),
+            parent_config=({"configurable": {"thread_id": thread_id, "checkpoint_ns": ns, "checkpoint_id": parent_id}}
+                           if parent_id else None),
+            pending_writes=[(task_id, channel, self.serde.loads_typed((t, v))) for task_id, channel, t, v in writes],
+        )
+
+    def get_tuple(self, config: RunnableConfig) -> Optional[CheckpointTuple]:
+        thread_id = config["configurable"]["thread_id"]
+        ns = config["configurable"].get("checkpoint_ns", "")
+        with self._lock:
+            db = self._conn()
+            row = db.execute(
+                "SELECT thread_id, checkpoint_ns, checkpoint_id, parent_checkpoint_id, type, checkpoint, metadata_type, metadata "
+                "FROM checkpoints WHERE thread_id=? AND checkpoint_ns=? AND updated_at>?",
+                (thread_id, ns, time.time() - self.ttl)).fetchone()
+            if row is None: return None
+            # Only the latest checkpoint is kept; older ids are gone
+            wanted = get_checkpoint_id(config)
+            if wanted and wanted != row[2]: return None
+            return self._tuple(row, db)
+
+    def list(self, config: Optional[RunnableConfig], *, filter: Optional[Dict[str, Any]] = None,
+             before: Optional[RunnableConfig] = None, limit: Optional[int] = None) -> Iterator[CheckpointTuple]:
+        query = ("SELECT thread_id, checkpoint_ns, checkpoint_id, parent_checkpoint_id, type, checkpoint, metadata_type, metadata "
+                 "FROM checkpoints WHERE updated_at>?")
+        params: list = [time.time() - self.ttl]
+        if config:
+            query += " AND thread_id=?"
+            params.append(config["configurable"]["thread_id"])
+            if config["configurable"].get("checkpoint_ns") is not None:
+                query += " AND checkpoint_ns=?"
+                params.append(config["configurable"]["checkpoint_ns"])
+        if before and get_checkpoint_id(before):
+            query += " AND checkpoint_id<?"
+            params.append(get_checkpoint_id(before))
+        query += " ORDER BY updated_at DESC"
+        with self._lock:
+            db = self._conn()
+            found = [self._tuple(row, db) for row in db.execute(query, params).fetchall()]
+        for tup in found:
+            if filter and not all(tup.metadata.get(k) == v for k, v in filter.items()): continue
+            if limit is not None:
+                if limit <= 0: break
+                limit -= 1
+            yield tup
+
+    # --- writes ---
+    def put(self, config: RunnableConfig, checkpoint: Checkpoint, metadata: CheckpointMetadata,
+            new_versions: ChannelVersions) -> RunnableConfig:
+        thread_id = config["configurable"]["thread_id"]
+        ns = config["configurable"].get("checkpoint_ns", "")
+        values = {k: v for k, v in checkpoint.get("channel_values", {}).items() if k not in TRANSIENT_CHANNELS}
+        if isinstance(values.get("messages"), list):
+            values["messages"] = compact_messages(values["messages"], self.max_messages)
+        type_, blob = self.serde.dumps_typed({**checkpoint, "channel_values": values})
+        meta_type, meta_blob = self.serde.dumps_typed(get_checkpoint_metadata(config, metadata))
+        now = time.time()
+        with self._lock:
+            db = self._conn()
+            db.execute("BEGIN")
+            db.execute(
+                "INSERT OR REPLACE INTO checkpoints VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (thread_id, ns, checkpoint["id"], config["configurable"].get("checkpoint_id"),
+                 type_, blob, meta_type, meta_blob, now))
+            # Writes belong to the checkpoint they were made against, which was just replaced
+            db.execute("DELETE FROM writes WHERE thread_id=? AND checkpoint_ns=? AND checkpoint_id!=?",
+                       (thread_id, ns, checkpoint["id"]))
+            db.execute("COMMIT")
+        if now - self._last_sweep > EXPIRE_EVERY:
+            self.expire()
+        return {"configurable": {"thread_id": thread_id, "checkpoint_ns": ns, "checkpoint_id": checkpoint["id"]}}
+
+    def put_writes(self, config: RunnableConfig, writes: Sequence[Tuple[str, Any]], task_id: str, task_path: str = "") -> None:
+        thread_id = config["configurable"]["thread_id"]
+        ns = config["configurable"].get("checkpoint_ns", "")
+        checkpoint_id = config["configurable"]["checkpoint_id"]
+        rows = []
+        for idx, (channel, value) in enumerate(writes):
+            if channel in TRANSIENT_CHANNELS: continue
+            type_, blob = self.serde.dumps_typed(value)
+            rows.append((thread_id, ns, checkpoint_id, task_id, WRITES_IDX_MAP.get(channel, idx), channel, type_, blob, task_path))
+        if not rows: return
+        # Special channels (errors, interrupts) overwrite; regular ones are written once
+        verb = "INSERT OR REPLACE" if all(channel in WRITES_IDX_MAP for channel, _ in writes) else "INSERT OR IGNORE"
+        with self._lock:
+            self._conn().executemany(f"{verb} INTO writes VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)", rows)
+
+    def delete_thread(self, thread_id: str) -> None:
+        with self._lock:
+            db = self._conn()
+            db.execute("DELETE FROM checkpoints WHERE thread_id=?", (thread_id,))
+            db.execute("DELETE FROM writes WHERE thread_id=?", (thread_id,))
+
+    def expire(self) -> int:
+        """Delete sessions idle longer than the TTL. Returns how many were removed."""
+        cutoff = time.time() - self.ttl
+        with self._lock:
+            self._last_sweep = time.time()
+            db = self._conn()
+            stale = [r[0] for r in db.execute("SELECT DISTINCT thread_id FROM checkpoints WHERE updated_at<=?", (cutoff,))]
+            db.execute("DELETE FROM checkpoints WHERE updated_at<=?", (cutoff,))
+            db.execute("DELETE FROM writes WHERE thread_id NOT IN (SELECT thread_id FROM checkpoints)")
+        return len(stale)
+
+    def count(self) -> int:
+        with self._lock:
+            return self._conn().execute("SELECT COUNT(*) FROM checkpoints").fetchone()[0]
+
+    # SQLite can wait up to its busy timeout on another worker's write: with several workers
+    # keep that off the event loop. Alone, nothing else writes the file and the calls are short.
+    async def _call(self, fn, *args):
+        if shared_state.WORKERS <= 1: return fn(*args)
+        return await shared_state.run(fn, *args)
+
+    async def aget_tuple(self, config: RunnableConfig) -> Optional[CheckpointTuple]:
+        return await self._call(self.get_tuple, config)
+
+    async def alist(self, config: Optional[RunnableConfig], *, filter: Optional[Dict[str, Any]] = None,
+                    before: Optional[RunnableConfig] = None, limit: Optional[int] = None) -> AsyncIterator[CheckpointTuple]:
+        tuples = await self._call(lambda: list(self.list(config, filter=filter, before=before, limit=limit)))
+        for tup in tuples:
+            yield tup
+
+    async def aput(self, config: RunnableConfig, checkpoint: Checkpoint, metadata: CheckpointMetadata,
+                   new_versions: ChannelVersions) -> RunnableConfig:
+        return await self._call(self.put, config, checkpoint, metadata, new_versions)
+
+    async def aput_writes(self, config: RunnableConfig, writes: Sequence[Tuple[str, Any]], task_id: str, task_path: str = "") -> None:
+        await self._call(self.put_writes, config, writes, task_id, task_path)
+
+    async def adelete_thread(self, thread_id: str) -> None:
+        await self._call(self.delete_thread, thread_id)
+
+class SharedCheckpointer(BaseCheckpointSaver):
+    """Same policy as SqliteCheckpointer (latest checkpoint per thread, messages
+    compacted, idle sessions expired) on the shared_state backend.
+
+    One key per thread holds the checkpoint and its pending writes; the
+    backend's TTL does the expiry. list() needs a thread: there's no scan.
+    """
+
+    def __init__(self, ttl: float = SESSION_TTL, max_messages: int = MAX_MESSAGES):
+        super().__init__()
+        self.ttl = ttl
+        self.max_messages = max_messages
+
+    @staticmethod
+    def _key(config: RunnableConfig) -> str:
+        return f"session:{config['configurable']['thread_id']}:{config['configurable'].get('checkpoint_ns', '')}"
+
+    def _load(self, key: str) -> Optional[Dict[str, Any]]:
+        raw = shared_state.backend().get(key)
+        if raw is None: return None
+        type_, _, blob = raw.partition(b"\n")
+        return self.serde.loads_typed((type_.decode("utf-8"), blob))
+
+    def _save(self, key: str, record: Dict[str, Any]):
+        type_, blob = self.serde.dumps_typed(record)
+        shared_state.backend().set(key, type_.encode("utf-8") + b"\n" + blob, self.ttl)
+
+    def get_tuple(self, config: RunnableConfig) -> Optional[CheckpointTuple]:
+        record = self._load(self._key(config))
+        if record is None: return None
+        wanted = get_checkpoint_id(config)
+        if wanted and wanted != record["checkpoint"]["id"]: return None
+        thread_id, ns = config["configurable"]["thread_id"], config["configurable"].get("checkpoint_ns", "")
+        parent_id = record["parent_id"]
+        return CheckpointTuple(
+            config={"configurable": {"thread_id": thread_id, "checkpoint_ns": ns, "checkpoint_id": record["checkpoint"]["id"]}},
+            checkpoint=record["checkpoint"],
+            metadata=record["metadata"],
+            parent_config=({"configurable": {"thread_id": thread_id, "checkpoint_ns": ns, "checkpoint_id": parent_id}}
+                           if parent_id else None),
+            pending_writes=[(task_id, channel, value) for task_id, _, channel, value in
+                            sorted(record["writes"], key=lambda w: (w[0], w[1]))],
+        )
+
+    def list(self, config: Optional[RunnableConfig], *, filter: Optional[Dict[str, Any]] = None,
+             before: Optional[RunnableConfig] = None, limit: Optional[int] = None) -> Iterator[CheckpointTuple]:
+        if not config or limit == 0: return
+        tup = self.get_tuple({"configurable": {k: v for k, v in config["configurable"].items() if k != "checkpoint_id"}})
+        if tup is None: return
+        if before and get_checkpoint_id(before) and tup.checkpoint["id"] >= get_checkpoint_id(before): return
+        if filter and not all(tup.metadata.get(k) == v for k, v in filter.items()): return
+        yield tup
+
+    def put(self, config: RunnableConfig, checkpoint: Checkpoint, metadata: CheckpointMetadata,
+            new_versions: ChannelVersions) -> RunnableConfig:
+        thread_id = config["configurable"]["thread_id"]
+        ns = config["configurable"].get("checkpoint_ns", "")
+        values = {k: v for k, v in checkpoint.get("channel_values", {}).items() if k not in TRANSIENT_CHANNELS}
+        if isinstance(values.get("messages"), list):
+            values["messages"] = compact_messages(values["messages"], self.max_messages)
+        self._save(self._key(config), {
+            "checkpoint": {**checkpoint, "channel_values": values},
+            "metadata": get_checkpoint_metadata(config, metadata),
+            "parent_id": config["configurable"].get("checkpoint_id"),
+            "writes": [],   # [task_id, idx, channel, value]
+        })
+        return {"configurable": {"thread_id": thread_id, "checkpoint_ns": ns, "checkpoint_id": checkpoint["id"]}}
+
+    def put_writes(self, config: RunnableConfig, writes: Sequence[Tuple[str, Any]], task_id: str, task_path: str = "") -> None:
+        writes = [(channel, value) for channel, value in writes if channel not in TRANSIENT_CHANNELS]
+        if not writes: return
+        key = self._key(config)
+        record = self._load(key)
+        # Writes belong to the checkpoint they were made against; drop them if it was replaced
+        if record is None or record["checkpoint"]["id"] != config["configurable"]["checkpoint_id"]: return
+        # Special channels (errors, interrupts) overwrite; regular ones are written once
+        overwrite = all(channel in WRITES_IDX_MAP for channel, _ in writes)
+        slots = {(w[0], w[1]): i for i, w in enumerate(record["writes"])}
+        for idx, (channel, value) in enumerate(writes):
+            write = [task_id, WRITES_IDX_MAP.get(channel, idx), channel, value]
+            i = slots.get((task_id, write[1]))
+            if i is None: record["writes"].append(write)
+            elif overwrite: record["writes"][i] = write
+        self._save(key, record)
+
+    def delete_thread(self, thread_id: str) -> None:
+        shared_state.backend().delete(self._key({"configurable": {"thread_id": thread_id}}))
+
+    def expire(self) -> int:
+        return 0  # the backend's TTL expires sessions
+
+    def close(self):
+        shared_state.close()
+
+    # Each call is a Redis round trip (and a reconnect when the server went away): off the event loop
+    async def aget_tuple(self, config: RunnableConfig) -> Optional[CheckpointTuple]:
+        return await shared_state.run(self.get_tuple, config)
+
+    async def alist(self, config: Optional[RunnableConfig], *, filter: Optional[Dict[str, Any]] = None,
+                    before: Optional[RunnableConfig] = None, limit: Optional[int] = None) -> AsyncIterator[CheckpointTuple]:
+        tuples = await shared_state.run(lambda: list(self.list(config, filter=filter, before=before, limit=limit)))
+        for tup in tuples:
+            yield tup
+
+    async def aput(self, config: RunnableConfig, checkpoint: Checkpoint, metadata: CheckpointMetadata,
+                   new_versions: ChannelVersions) -> RunnableConfig:
+        return await shared_state.run(self.put, config, checkpoint, metadata, new_versions)
+
+    async def aput_writes(self, config: RunnableConfig, writes: Sequence[Tuple[str, Any]], task_id: str, task_path: str = "") -> None:
+        await shared_state.run(self.put_writes, config, writes, task_id, task_path)
+
+    async def adelete_thread(self, thread_id: str) -> None:
+        await shared_state.run(self.delete_thread, thread_id)
+
+# SQLite file by default (shared by the workers on one host); Redis when shared state points there
+saver = SharedCheckpointer() if shared_state.URL.startswith("redis://") else SqliteCheckpointer()
+
+def thread_id(user_key: str, session_id: str) -> str:
+    # Sessions are scoped to the user, so a leaked/guessed session_id is useless with another token
+    return f"{user_key}:{session_id}"
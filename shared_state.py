@@ -0,0 +1,258 @@
+import asyncio
+import os
+import socket
+import sqlite3
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, Optional
+from urllib.parse import urlparse
+
+import telemetry
+
+# State shared between worker processes: a small key/value store with TTLs
+# behind the token cache, LLM response cache, event cache and sessions.
+#   SHARED_STATE unset  -> off, every cache stays in-process (single worker)
+#   sqlite[:///path]     -> SQLite file, shared by the workers on one host
+#   redis://host:port/db -> any Redis-compatible server, shared across hosts
+# With WEB_CONCURRENCY > 1 it defaults to sqlite. Caches keep their in-process
+# LRU in front; this is the second level, so a miss here only costs one lookup.
+WORKERS = int(os.getenv("WEB_CONCURRENCY", "1"))
+URL = os.getenv("SHARED_STATE", "sqlite" if WORKERS > 1 else "")
+SQLITE_PATH = os.getenv("SHARED_STATE_DB", "shared_state.db")
+TIMEOUT = float(os.getenv("SHARED_STATE_TIMEOUT", "0.5"))  # seconds per Redis call
+EXPIRE_EVERY = 300.0  # seconds between sweeps of expired SQLite rows
+THREADS = int(os.getenv("SHARED_STATE_THREADS", "4"))      # for calls made from async code (see run())
+
+errors = telemetry.Count("shared_state_errors_total", "Shared state calls that failed (treated as a miss)", ("op",))
+
+class SharedStateError(Exception):
+    pass
+
+# --- SQLite ---
+class SqliteBackend:
+    """Keys in one WAL-mode SQLite file; every process opens its own connection."""
+
+    def __init__(self, path: str = SQLITE_PATH):
+        self.path = path
+        self._db: Optional[sqlite3.Connection] = None
+        self._pid = 0
+        self._lock = threading.Lock()
+        self._last_sweep = time.time()
+
+    def _conn(self) -> sqlite3.Connection:
+        # Opened on first use, and again in a forked child (connections don't survive fork)
+        if self._db is None or self._pid != os.getpid():
+            db = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None, timeout=5)
+            db.execute("PRAGMA journal_mode=WAL")
+            db.execute("PRAGMA synchronous=NORMAL")
+            db.execute("CREATE TABLE IF NOT EXISTS kv (key TEXT PRIMARY KEY, value BLOB, expires REAL)")
+            self._db, self._pid = db, os.getpid()
+        return self._db
+
+    def get(self, key: str) -> Optional[bytes]:
+        with self._lock:
+            row = self._conn().execute("SELECT value, expires FROM kv WHERE key=?", (key,)).fetchone()
+        if row is None or (row[1] is not None and row[1] <= time.time()): return None
+        return row[0] if isinstance(row[0], bytes) else str(row[0]).encode("utf-8")
+
+    def set(self, key: str, value: bytes, ttl: Optional[float] = None):
+        now = time.time()
+        with self._lock:
+            self._conn().execute("INSERT OR REPLACE INTO kv VALUES (?, ?, ?)", (key, value, now + ttl if ttl else None))
+            if now - self._last_sweep > EXPIRE_EVERY:
+                self._last_sweep = now
+                self._conn().execute("DELETE FROM kv WHERE expires<=?", (now,))
+
+    def delete(self, key: str):
+        with self._lock:
+            self._conn().execute("DELETE FROM kv WHERE key=?", (key,))
+
+    def incr(self, key: str) -> int:
+        with self._lock:
+            return self._conn().execute(
+                "INSERT INTO kv VALUES (?, 1, NULL) ON CONFLICT(key) DO UPDATE SET value=CAST(value AS INTEGER)+1 "
+                "RETURNING value", (key,)).fetchone()[0]
+
+    def close(self):
+        with self._lock:
+            if self._db is not None and self._pid == os.getpid():
+                self._db.close()
+            self._db = None
+
+# --- Redis (RESP2 over a plain socket; only the handful of commands used here) ---
+class RedisBackend:
+    def __init__(self, url: str, timeout: float = TIMEOUT):
+        parsed = urlparse(url)
+        self.host, self.port = parsed.hostname or "127.0.0.1", parsed.port or 6379
+        self.db = int(parsed.path.lstrip("/") or 0)
+        self.password = parsed.password
+        self.timeout = timeout
+        self._sock: Optional[socket.socket] = None
+        self._file = None
+        self._pid = 0
+        self._lock = threading.Lock()
+
+    def _connect(self):
+        sock = socket.create_connection((self.host, self.port), timeout=self.timeout)
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self._sock, self._file, self._pid = sock, sock.makefile("rb"), os.getpid()
+        if self.password: self._call("AUTH", self.password)
+        if self.db: self._call("SELECT", str(self.db))
+
+    @staticmethod
+    def _encode(args) -> bytes:
+        out = [b"*%d\r\n" % len(args)]
+        for a in args:
+            a = a if isinstance(a, bytes) else str(a).encode("utf-8")
+            out.append(b"$%d\r\n%s\r\n" % (len(a), a))
+        return b"".join(out)
+
+    def _read(self):
+        line = self._file.readline()
+        if not line: raise ConnectionError("connection closed")
+        kind, rest = line[:1], line[1:-2]
+        if kind == b"+": return rest
+        if kind == b"-": raise SharedStateError(rest.decode("utf-8", "replace"))
+        if kind == b":": return int(rest)
+        if kind == b"$":
+            n = int(rest)
+            if n < 0: return None
+            data = self._file.read(n + 2)
+            return data[:-2]
+        if kind == b"*":
+            n = int(rest)
+            return None if n < 0 else [self._read() for _ in range(n)]
+        raise SharedStateError(f"bad reply: {line!r}")
+
+    def _call(self, *args):
+        self._sock.sendall(self._encode(args))
+        return self._read()
+
+    def call(self, *args):
+        with self._lock:
+            for attempt in (0, 1):
+                try:
+                    if self._sock is None or self._pid != os.getpid(): self._connect()
+                    return self._call(*args)
+                except (OSError, ConnectionError) as e:
+                    # Stale connection (server restart, fork): reconnect once
+                    self._sock = None
+                    if attempt: raise SharedStateError(f"redis {self.host}:{self.port}: {e}") from e
+
+    def get(self, key: str) -> Optional[bytes]:
+        return self.call("GET", key)
+
+    def set(self, key: str, value: bytes, ttl: Optional[float] = None):
+        if ttl: self.call("SET", key, value, "PX", int(ttl * 1000))
+        else: self.call("SET", key, value)
+
+    def delete(self, key: str):
+        self.call("DEL", key)
+
+    def incr(self, key: str) -> int:
+        return self.call("INCR", key)
+
+    def close(self):
+        with self._lock:
+            if self._sock is not None and self._pid == os.getpid():
+                self._sock.close()
+            self._sock = None
+
+def connect(url: str):
+    if url.startswith("redis://"): return RedisBackend(url)
+    if url.startswith("sqlite"):
+        # sqlite:///relative.db or sqlite:////absolute.db, as in SQLAlchemy URLs
+        path = url.split("://", 1)[1][1:] if "://" in url else ""
+        return SqliteBackend(path or SQLITE_PATH)
+    raise ValueError(f"Unknown SHARED_STATE: {url}")
+
+# Built on first use, never at import, so worker boot stays cheap
+_backend = None
+_backend_lock = threading.Lock()
+
+def backend():
+    """The configured backend, or None when shared state is off."""
+    global _backend
+    if not URL: return None
+    if _backend is None:
+        with _backend_lock:
+            if _backend is None: _backend = connect(URL)
+    return _backend
+
+def enabled() -> bool:
+    return bool(URL)
+
+# --- best-effort helpers for caches: a failing store is a miss, never an error ---
+def get(key: str) -> Optional[bytes]:
+    store = backend()
+    if store is None: return None
+    try:
+        return store.get(key)
+    except Exception:
+        errors.inc("get")
+        return None
+
+def put(key: str, value: bytes, ttl: Optional[float] = None):
+    store = backend()
+    if store is None: return
+    try:
+        store.set(key, value, ttl)
+    except Exception:
+        errors.inc("set")
+
+def delete(key: str):
+    store = backend()
+    if store is None: return
+    try:
+        store.delete(key)
+    except Exception:
+        errors.inc("delete")
+
+def incr(key: str) -> Optional[int]:
+    store = backend()
+    if store is None: return None
+    try:
+        return int(store.incr(key))
+    except Exception:
+        errors.inc("incr")
+        return None
+
+# --- async code: backends block (SQLite busy timeout, Redis socket timeout + reconnect),
+# so calls from the event loop run on a few dedicated threads instead ---
+_pool: Optional[ThreadPoolExecutor] = None
+_pool_pid = 0
+
+def _executor() -> ThreadPoolExecutor:
+    global _pool, _pool_pid
+    if _pool is None or _pool_pid != os.getpid():
+        with _backend_lock:
+            if _pool is None or _pool_pid != os.getpid():
+                _pool, _pool_pid = ThreadPoolExecutor(THREADS, thread_name_prefix="shared-state"), os.getpid()
+    return _pool
+
+async def run(fn: Callable[..., Any], *args) -> Any:
+    """fn(*args) on the shared-state threads; for anything that talks to the backend
+    (or serialises a lot for it) from async code."""
+    return await asyncio.get_running_loop().run_in_executor(_executor(), fn, *args)
+
+async def aget(key: str) -> Optional[bytes]:
+    return await run(get, key) if URL else None
+
+async def aput(key: str, value: bytes, ttl: Optional[float] = None):
+    if URL: await run(put, key, value, ttl)
+
+async def adelete(key: str):
+    if URL: await run(delete, key)
+
+async def aincr(key: str) -> Optional[int]:
+    return await run(incr, key) if URL else None
+
+def close():
+    global _backend
+    if _backend is not None:
+        _backend.close()
+        _backend = None
+
+def stats() -> Dict[str, int]:
+    return {"enabled": int(enabled()), "errors": errors.total()}
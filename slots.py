@@ -0,0 +1,147 @@
+import bisect
+from collections import Counter
+from datetime import datetime, time as dtime, timedelta
+from typing import Callable, Dict, List, Optional, Tuple
+from zoneinfo import ZoneInfo
+
+import calendar_client
+import event_store
+import multi_calendar
+from calendar_client import GOOGLE_CAL_BASE
+
+# Deterministic free/busy + slot finding. Busy time is a sorted list of
+# (start_ts, end_ts) intervals; every constraint (working hours, lunch,
+# buffers, daily cap, ...) is a "mask" that returns more blocked intervals,
+# and free time is the horizon minus the union of all of them.
+Interval = Tuple[float, float]
+Mask = Callable[[float, float, List[Interval]], List[Interval]]
+
+SLOT_STEP = 15 * 60  # candidate starts snap to the quarter hour
+
+# --- interval arithmetic (inputs sorted, outputs sorted and merged) ---
+def merge(intervals: List[Interval]) -> List[Interval]:
+    out: List[Interval] = []
+    for start, end in sorted(intervals):
+        if out and start <= out[-1][1]:
+            if end > out[-1][1]: out[-1] = (out[-1][0], end)
+        else:
+            out.append((start, end))
+    return out
+
+def subtract(base: List[Interval], blocked: List[Interval]) -> List[Interval]:
+    out: List[Interval] = []
+    j = 0
+    for start, end in base:
+        cur = start
+        while j < len(blocked) and blocked[j][1] <= cur: j += 1
+        k = j
+        while k < len(blocked) and blocked[k][0] < end:
+            if blocked[k][0] > cur: out.append((cur, blocked[k][0]))
+            cur = max(cur, blocked[k][1])
+            k += 1
+        if cur < end: out.append((cur, end))
+    return out
+
+def overlapping(intervals: List[Interval], start: float, end: float) -> List[Interval]:
+    # intervals sorted by start; anything starting at/after `end` can't overlap
+    return [iv for iv in intervals[:bisect.bisect_left(intervals, (end,))] if iv[1] > start]
+
+def _days(lo: float, hi: float, tz: ZoneInfo):
+    day = datetime.fromtimestamp(lo, tz).date()
+    last = datetime.fromtimestamp(hi, tz).date()
+    while day <= last:
+        yield day
+        day += timedelta(days=1)
+
+def _at(day, clock: dtime, tz: ZoneInfo) -> float:
+    return datetime.combine(day, clock, tzinfo=tz).timestamp()
+
+# --- masks ---
+def working_hours(start: dtime, end: dtime, tz: ZoneInfo, weekdays_only: bool = True) -> Mask:
+    def mask(lo, hi, busy):
+        out = []
+        for day in _days(lo, hi, tz):
+            day_start = _at(day, dtime(0), tz)
+            next_day = _at(day + timedelta(days=1), dtime(0), tz)
+            if weekdays_only and day.weekday() >= 5:
+                out.append((day_start, next_day))
+                continue
+            out.append((day_start, _at(day, start, tz)))
+            out.append((_at(day, end, tz), next_day))
+        return out
+    return mask
+
+def daily_block(start: dtime, end: dtime, tz: ZoneInfo) -> Mask:
+    # e.g. lunch
+    def mask(lo, hi, busy):
+        return [(_at(day, start, tz), _at(day, end, tz)) for day in _days(lo, hi, tz)]
+    return mask
+
+def buffer(minutes: int) -> Mask:
+    # Keep a gap on both sides of every busy block
+    pad = minutes * 60
+    def mask(lo, hi, busy):
+        return [(start - pad, end + pad) for start, end in busy]
+    return mask
+
+def daily_cap(max_events: int, tz: ZoneInfo) -> Mask:
+    # Days that already hold max_events are off limits (burnout cap)
+    def mask(lo, hi, busy):
+        per_day = Counter(datetime.fromtimestamp(start, tz).date() for start, _ in busy)
+        return [(_at(day, dtime(0), tz), _at(day + timedelta(days=1), dtime(0), tz))
+                for day, n in per_day.items() if n >= max_events]
+    return mask
+
+def free_intervals(lo: float, hi: float, busy: List[Interval], masks: List[Mask]) -> List[Interval]:
+    blocked = list(busy)
+    for mask in masks:
+        blocked.extend(mask(lo, hi, busy))
+    return subtract([(lo, hi)], merge(blocked))
+
+def best_slots(free: List[Interval], duration: float, top_n: int = 3) -> List[Interval]:
+    """Earliest step-aligned slot in each free gap that fits, first top_n gaps."""
+    out = []
+    for start, end in free:
+        aligned = -(-start // SLOT_STEP) * SLOT_STEP
+        if aligned + duration <= end:
+            out.append((aligned, aligned + duration))
+            if len(out) >= top_n: break
+    return out
+
+# --- busy time sources ---
+async def busy_intervals(token: str, time_min: datetime, time_max: datetime, calendar_ids: Optional[List[str]] = None) -> Dict:
+    """Busy blocks for the window across calendars: {"busy": [...], "errors": {...}}.
+
+    Calendars already in the event cache are answered locally (refreshed
+    concurrently); the rest, and any whose refresh failed, share one freeBusy query.
+    """
+    calendar_ids = calendar_ids or ["primary"]
+    lo, hi = time_min.timestamp(), time_max.timestamp()
+    busy: List[Interval] = []
+    errors: Dict[str, str] = {}
+    cached = [cal for cal in calendar_ids if (store := event_store.stores.peek(token, cal)) is not None and store.sync_token]
+
+    async def refresh(cal):
+        store = event_store.stores.get(token, cal)
+        error = await store.refresh(token)
+        return {"error": error} if error else store
+
+    fresh, _ = await multi_calendar.fan_out(cached, refresh)
+    for store in fresh.values():
+        for event in store.window(lo, hi):
+            # Free-marked events ("transparency": "transparent") don't block time
+            if event.get("transparency") == "transparent": continue
+            busy.append(store.bounds_of(event["id"]))
+    remote = [cal for cal in calendar_ids if cal not in fresh]
+    if remote:
+        body = {"timeMin": time_min.isoformat(), "timeMax": time_max.isoformat(), "items": [{"id": c} for c in remote]}
+        data = await calendar_client.request("POST", f"{GOOGLE_CAL_BASE}/freeBusy", token, json_body=body)
+        if "error" in data:
+            errors.update({c: data["error"] for c in remote})
+        for cal, info in data.get("calendars", {}).items():
+            if info.get("errors"):
+                errors[cal] = str(info["errors"])
+            for block in info.get("busy", []):
+                bounds = event_store.event_bounds({"start": {"dateTime": block["start"]}, "end": {"dateTime": block["end"]}})
+                if bounds: busy.append(bounds)
+    return {"busy": sorted(busy), "errors": errors}
@@ -18,3 +18,7 @@ class AgentState(TypedDict):
     current_action: Optional[str]  # e.g., "scheduling", "deleting"
     pending_details: Optional[Dict[str, Any]]  # store partial scheduling info
 
+    # Which path produced the pending tool call: "fast_path" (rule-based, no LLM) or None (agent);
+    # "blocked" when the guardrail refused the message; "ask" when the fast path asked for a missing day/time
+    route: Optional[str]
+
@@ -0,0 +1,353 @@
+import json
+import os
+import sys
+import threading
+import time
+import uuid
+from collections import Counter
+from contextvars import ContextVar
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import httpx
+
+# Per-request tracing, latency histograms and a Prometheus text endpoint.
+# Everything is in-process and allocation-light so it can stay on in
+# production:
+#   span("name", **attrs)  times a block, feeds scheduler_span_seconds{span}
+#                          and, inside a request, that request's trace
+#   Middleware             one trace per HTTP request, logged as a JSON line
+#                          when slow (TRACE_LOG), optional stack sampling
+#   render()               /metrics body (Prometheus text format 0.0.4)
+ENABLED = os.getenv("TELEMETRY", "1") != "0"
+TRACE_LOG = os.getenv("TRACE_LOG", "slow")          # all | slow | off
+TRACE_SLOW_MS = float(os.getenv("TRACE_SLOW_MS", "2000"))
+PROFILE_SLOW_MS = float(os.getenv("PROFILE_SLOW_MS", "0"))  # > 0: sample stacks, keep them for requests this slow
+PROFILE_INTERVAL_MS = float(os.getenv("PROFILE_INTERVAL_MS", "5"))
+PROFILE_DIR = os.getenv("PROFILE_DIR", "profiles")
+MAX_SPANS = 256  # per trace; a runaway agent loop can't grow one without bound
+
+PREFIX = "scheduler_"
+BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+# --- metrics ---
+class Histogram:
+    def __init__(self, name: str, help: str, labels: Tuple[str, ...], buckets: Tuple[float, ...] = BUCKETS):
+        self.name, self.help, self.labels, self.buckets = PREFIX + name, help, labels, buckets
+        self._series: Dict[Tuple[str, ...], List[float]] = {}  # labels -> [bucket counts..., sum, count]
+        self._lock = threading.Lock()
+        _registry.append(self)
+
+    def observe(self, value: float, *labels: str):
+        i = 0
+        for bound in self.buckets:
+            if value <= bound: break
+            i += 1
+        with self._lock:
+            row = self._series.get(labels)
+            if row is None:
+                row = self._series[labels] = [0.0] * (len(self.buckets) + 2)
+            row[i] += 1
+            row[-2] += value
+            row[-1] += 1
+
+    def render(self) -> List[str]:
+        out = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            series = {k: list(v) for k, v in self._series.items()}
+        for labels, row in sorted(series.items()):
+            base = _labels(self.labels, labels)
+            running = 0
+            for bound, n in zip(self.buckets, row):
+                running += n
+                out.append(f'{self.name}_bucket{{{base}{"," if base else ""}le="{bound}"}} {running:g}')
+            out.append(f'{self.name}_bucket{{{base}{"," if base else ""}le="+Inf"}} {row[-1]:g}')
+            out.append(f"{self.name}_sum{{{base}}} {row[-2]:.6f}")
+            out.append(f"{self.name}_count{{{base}}} {row[-1]:g}")
+        return out
+
+class Count:
+    def __init__(self, name: str, help: str, labels: Tuple[str, ...]):
+        self.name, self.help, self.labels = PREFIX + name, help, labels
+        self._values: Counter = Counter()
+        self._lock = threading.Lock()
+        _registry.append(self)
+
+    def inc(self, *labels: str, amount: float = 1):
+        with self._lock:
+            self._values[labels] += amount
+
+    def total(self) -> float:
+        with self._lock:
+            return sum(self._values.values())
+
+    def render(self) -> List[str]:
+        out = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            values = dict(self._values)
+        for labels, v in sorted(values.items()):
+            out.append(f"{self.name}{{{_labels(self.labels, labels)}}} {v:g}")
+        return out
+
+def _labels(names: Tuple[str, ...], values: Tuple[str, ...]) -> str:
+    escape = lambda v: str(v).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+    return ",".join(f'{n}="{escape(v)}"' for n, v in zip(names, values))
+
+_registry: List[Any] = []
+_collectors: List[Tuple[str, Callable[[], Dict[str, Any]]]] = []
+
+def register(prefix: str, stats: Callable[[], Dict[str, Any]]):
+    """Expose an existing stats dict (token cache, LLM cache, ...) as scheduler_<prefix>_<key> gauges."""
+    _collectors.append((prefix, stats))
+
+span_seconds = Histogram("span_seconds", "Time spent in traced operations", ("span",))
+request_seconds = Histogram("http_request_seconds", "HTTP request latency (until the last body byte)", ("method", "route"))
+requests_total = Count("http_requests_total", "HTTP requests by status", ("method", "route", "status"))
+google_total = Count("google_requests_total", "Google API calls by operation and status", ("op", "status"))
+llm_tokens = Count("llm_tokens_total", "Tokens sent to / generated by the agent model", ("kind",))
+errors_total = Count("errors_total", "Exceptions caught by the endpoints (some still answer 200)", ("where", "type"))
+
+def render() -> str:
+    lines: List[str] = []
+    for metric in _registry:
+        lines.extend(metric.render())
+    for prefix, stats in _collectors:
+        try:
+            values = stats()
+        except Exception:
+            continue
+        for key, v in sorted(values.items()):
+            if isinstance(v, bool) or not isinstance(v, (int, float)): continue
+            name = PREFIX + prefix + "_" + "".join(c if c.isalnum() else "_" for c in str(key)).lower()
+            lines.append(f"# TYPE {name} gauge")
+            lines.append(f"{name} {v:g}")
+    return "\n".join(lines) + "\n"
+
+# --- traces + spans ---
+class Trace:
+    __slots__ = ("id", "method", "route", "status", "start", "spans", "samples", "thread", "error")
+
+    def __init__(self, method: str, route: str):
+        self.id = uuid.uuid4().hex[:16]
+        self.method, self.route, self.status = method, route, 0
+        self.start = time.perf_counter()
+        self.spans: List[Dict[str, Any]] = []
+        self.samples: Optional[Counter] = None
+        self.thread = threading.get_ident()
+        self.error: Optional[str] = None
+
+    def log(self, elapsed: float, profile: Optional[str] = None) -> str:
+        record = {"trace": self.id, "method": self.method, "route": self.route, "status": self.status,
+                  "ms": round(elapsed * 1000, 1), "spans": self.spans}
+        if self.error: record["error"] = self.error
+        if profile: record["profile"] = profile
+        return json.dumps(record, default=str)
+
+_trace: ContextVar[Optional[Trace]] = ContextVar("trace", default=None)
+
+def current_trace() -> Optional[Trace]:
+    return _trace.get()
+
+class span:
+    """Time a block: `with span("tool.add_event") as s: ...; s["status"] = 200`.
+
+    Attributes set on the yielded dict end up in the request's trace log.
+    """
+    __slots__ = ("name", "attrs", "t0")
+
+    def __init__(self, name: str, **attrs: Any):
+        self.name = name
+        self.attrs = attrs
+
+    def __enter__(self) -> Dict[str, Any]:
+        self.t0 = time.perf_counter()
+        return self.attrs
+
+    def __exit__(self, exc_type, exc, tb):
+        if not ENABLED: return False
+        end = time.perf_counter()
+        elapsed = end - self.t0
+        span_seconds.observe(elapsed, self.name)
+        trace = _trace.get()
+        if trace is not None and len(trace.spans) < MAX_SPANS:
+            if exc_type is not None: self.attrs["error"] = exc_type.__name__
+            trace.spans.append({"name": self.name, "at_ms": round((self.t0 - trace.start) * 1000, 2),
+                                "ms": round(elapsed * 1000, 2), **self.attrs})
+        return False
+
+def record_error(where: str, error: BaseException):
+    # Counted, and marks the request's trace so it's logged even if the endpoint answers 200
+    errors_total.inc(where, type(error).__name__)
+    trace = _trace.get()
+    if trace is not None:
+        trace.error = f"{type(error).__name__}: {error}"[:200]
+
+# --- Google HTTP calls ---
+def google_op(method: str, path: str) -> str:
+    # Bounded label: the API operation, never ids or query strings
+    if path.endswith("/tokeninfo"): return "tokeninfo"
+    if "/batch" in path: return "batch"
+    if path.endswith("/freeBusy"): return "freebusy"
+    if "/calendarList" in path: return "calendarList"
+    if "/events" in path:
+        if path.endswith("/events"):
+            return "events.list" if method == "GET" else "events.insert"
+        return {"GET": "events.get", "PATCH": "events.patch", "PUT": "events.update",
+                "DELETE": "events.delete"}.get(method, "events.other")
+    return "other"
+
+class _TimedStream(httpx.AsyncByteStream):
+    # The span ends when the body has been read (or the response closed), not at headers
+    def __init__(self, stream: httpx.AsyncByteStream, timer: span):
+        self._stream, self._timer = stream, timer
+        self._done = False
+
+    async def __aiter__(self):
+        async for chunk in self._stream:
+            yield chunk
+
+    async def aclose(self):
+        try:
+            await self._stream.aclose()
+        finally:
+            if not self._done:
+                self._done = True
+                self._timer.__exit__(None, None, None)
+
+class TracingTransport(httpx.AsyncBaseTransport):
+    """Wraps the shared client's transport: one span + counter per Google call."""
+
+    def __init__(self, inner: httpx.AsyncBaseTransport):
+        self.inner = inner
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        if not ENABLED: return await self.inner.handle_async_request(request)
+        op = google_op(request.method, request.url.path)
+        timer = span("google." + op)
+        timer.__enter__()
+        try:
+            response = await self.inner.handle_async_request(request)
+        except Exception as e:
+            google_total.inc(op, "error")
+            timer.attrs["error"] = type(e).__name__
+            timer.__exit__(None, None, None)
+            raise
+        google_total.inc(op, str(response.status_code))
+        timer.attrs["status"] = response.status_code
+        response.stream = _TimedStream(response.stream, timer)
+        return response
+
+    async def aclose(self):
+        await self.inner.aclose()
+
+# --- sampling profiler (PROFILE_SLOW_MS > 0) ---
+class Sampler:
+    """Background thread that samples the event-loop thread's stack while requests are in flight.
+
+    Every in-flight trace collects the samples taken during its lifetime, so
+    on a busy worker a slow request's profile includes its neighbours: read
+    it as "what the process was doing while this request was slow".
+    """
+
+    def __init__(self, interval: float):
+        self.interval = interval
+        self.active: Dict[str, Trace] = {}
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def add(self, trace: Trace):
+        trace.samples = Counter()
+        with self._lock:
+            self.active[trace.id] = trace
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="telemetry-sampler", daemon=True)
+                self._thread.start()
+        self._wake.set()
+
+    def remove(self, trace: Trace):
+        with self._lock:
+            self.active.pop(trace.id, None)
+
+    def _run(self):
+        while True:
+            with self._lock:
+                traces = list(self.active.values())
+            if not traces:
+                self._wake.clear()
+                self._wake.wait()
+                continue
+            frames = sys._current_frames()
+            stacks: Dict[int, str] = {}
+            for trace in traces:
+                if trace.thread not in stacks:
+                    frame = frames.get(trace.thread)
+                    stacks[trace.thread] = collapse(frame) if frame is not None else ""
+                if stacks[trace.thread]:
+                    trace.samples[stacks[trace.thread]] += 1
+            time.sleep(self.interval)
+
+def collapse(frame, limit: int = 64) -> str:
+    # "outer;...;inner" frame names, the folded format flamegraph.pl / speedscope read
+    names = []
+    while frame is not None and len(names) < limit:
+        code = frame.f_code
+        names.append(f"{os.path.basename(code.co_filename)}:{code.co_name}")
+        frame = frame.f_back
+    return ";".join(reversed(names))
+
+sampler = Sampler(PROFILE_INTERVAL_MS / 1000) if PROFILE_SLOW_MS > 0 else None
+
+def dump_profile(trace: Trace) -> Optional[str]:
+    if not trace.samples: return None
+    os.makedirs(PROFILE_DIR, exist_ok=True)
+    path = os.path.join(PROFILE_DIR, f"{trace.id}.folded")
+    with open(path, "w", encoding="utf-8") as f:
+        for stack, n in trace.samples.most_common():
+            f.write(f"{stack} {n}\n")
+    return path
+
+# --- per-request middleware ---
+class Middleware:
+    """ASGI middleware: a trace per HTTP request, timed until the last body byte.
+
+    Plain ASGI rather than @app.middleware("http") so streamed responses
+    (/chat/stream) are timed to the end and no extra task is spawned per request.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not ENABLED:
+            return await self.app(scope, receive, send)
+        trace = Trace(scope["method"], scope["path"])
+        token = _trace.set(trace)
+        if sampler is not None: sampler.add(trace)
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                trace.status = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        except Exception:
+            trace.status = trace.status or 500
+            raise
+        finally:
+            _trace.reset(token)
+            if sampler is not None: sampler.remove(trace)
+            # Route template, not the raw path, so ids/query strings don't explode the label set
+            route = scope.get("route")
+            trace.route = getattr(route, "path", None) or "unmatched"
+            self.finish(trace, time.perf_counter() - trace.start)
+
+    def finish(self, trace: Trace, elapsed: float):
+        request_seconds.observe(elapsed, trace.method, trace.route)
+        requests_total.inc(trace.method, trace.route, str(trace.status))
+        slow = elapsed * 1000 >= TRACE_SLOW_MS or trace.status >= 500 or trace.error is not None
+        profile = None
+        if sampler is not None and elapsed * 1000 >= PROFILE_SLOW_MS:
+            profile = dump_profile(trace)
+        if TRACE_LOG == "all" or (TRACE_LOG == "slow" and slow) or profile:
+            print(trace.log(elapsed, profile))
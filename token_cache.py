@@ -0,0 +1,161 @@
+import asyncio
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Optional, Tuple
+
+import shared_state
+
+# Result of one tokeninfo lookup: (is_valid, ttl_seconds, tokeninfo_payload).
+# ttl None -> use the default for that verdict, ttl 0 -> don't cache at all.
+Verdict = Tuple[bool, Optional[float], Dict[str, Any]]
+
+MAX_ENTRIES = int(os.getenv("TOKEN_CACHE_SIZE", "4096"))
+NEGATIVE_TTL = float(os.getenv("TOKEN_CACHE_NEGATIVE_TTL", "30"))
+MAX_TTL = float(os.getenv("TOKEN_CACHE_MAX_TTL", "3600"))
+EXPIRY_SKEW = 30.0  # stop trusting a token a little before Google does
+
+def token_key(token: str) -> str:
+    # Never keep raw OAuth tokens around as dict keys
+    return hashlib.sha256(token.encode("utf-8")).hexdigest()
+
+class TokenCache:
+    """Bounded LRU of tokeninfo verdicts with request coalescing.
+
+    Safe to share between threads (one lock around the LRU) and between
+    tasks (concurrent validations of the same token await a single call).
+    With shared_state on, verdicts are also published there, so a token
+    another worker validated doesn't cost this one a tokeninfo call.
+    """
+
+    def __init__(self, max_entries: int = MAX_ENTRIES, negative_ttl: float = NEGATIVE_TTL, max_ttl: float = MAX_TTL):
+        self.max_entries = max_entries
+        self.negative_ttl = negative_ttl
+        self.max_ttl = max_ttl
+        self._entries: "OrderedDict[str, Tuple[bool, float, Dict[str, Any]]]" = OrderedDict()
+        self._inflight: Dict[str, Tuple[asyncio.AbstractEventLoop, asyncio.Future]] = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        self.evictions = 0
+        self.shared_hits = 0
+
+    def _get(self, key: str, count: bool = True):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            if entry[1] <= time.monotonic():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            if count: self.hits += 1
+            return entry
+
+    def _put(self, key: str, verdict: Verdict) -> float:
+        """Cache locally; returns the TTL used (0: not cached)."""
+        valid, ttl, info = verdict
+        if ttl is None:
+            ttl = self.max_ttl if valid else self.negative_ttl
+        ttl = min(ttl, self.max_ttl)
+        if ttl <= 0:
+            return 0.0
+        with self._lock:
+            self._entries[key] = (valid, time.monotonic() + ttl, info)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+        return ttl
+
+    def info(self, token: str) -> Optional[Dict[str, Any]]:
+        """Cached tokeninfo payload for a token that validated, if any."""
+        entry = self._get(token_key(token), count=False)
+        return entry[2] if entry and entry[0] else None
+
+    async def _get_shared(self, key: str) -> Optional[bool]:
+        raw = await shared_state.aget(f"token:{key}")
+        if raw is None: return None
+        valid, expires, info = json.loads(raw)
+        # Keep the other worker's expiry, not a fresh TTL
+        self._put(key, (valid, expires - time.time(), info))
+        self.shared_hits += 1
+        return valid
+
+    def invalidate(self, token: str):
+        key = token_key(token)
+        with self._lock:
+            self._entries.pop(key, None)
+        shared_state.delete(f"token:{key}")
+
+    async def validate(self, token: str, fetch: Callable[[str], Awaitable[Verdict]]) -> bool:
+        key = token_key(token)
+        entry = self._get(key)
+        if entry is not None:
+            return entry[0]
+
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            pending = self._inflight.get(key)
+            # Futures can only be awaited on their own loop
+            if pending is not None and pending[0] is loop:
+                self.coalesced += 1
+                fut = pending[1]
+            else:
+                self.misses += 1
+                fut = None
+                owned = loop.create_future()
+                self._inflight[key] = (loop, owned)
+
+        if fut is not None:
+            return await asyncio.shield(fut)
+
+        try:
+            valid = await self._get_shared(key)
+            if valid is not None:
+                owned.set_result(valid)
+                return valid
+            verdict = await fetch(token)
+            ttl = self._put(key, verdict)
+            owned.set_result(verdict[0])
+            if ttl:
+                shared = json.dumps([verdict[0], time.time() + ttl, verdict[2]]).encode("utf-8")
+                await shared_state.aput(f"token:{key}", shared, ttl)
+            return verdict[0]
+        except asyncio.CancelledError:
+            owned.cancel()
+            raise
+        except Exception as e:
+            owned.set_exception(e)
+            # Nobody may be waiting on it; don't log "exception never retrieved"
+            owned.exception()
+            raise
+        finally:
+            with self._lock:
+                if self._inflight.get(key, (None, None))[1] is owned:
+                    del self._inflight[key]
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            size = len(self._entries)
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "coalesced": self.coalesced,
+            "evictions": self.evictions,
+            "shared_hits": self.shared_hits,
+            "size": size,
+        }
+
+cache = TokenCache()
+
+def user_key(token: str) -> str:
+    # Prefer Google's stable user id so per-user caches survive token refreshes;
+    # fall back to the token hash when tokeninfo didn't include one.
+    info = cache.info(token) or {}
+    uid = info.get("user_id") or info.get("email")
+    return f"user:{uid}" if uid else f"token:{token_key(token)[:32]}"
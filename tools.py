@@ -1,35 +1,45 @@
-import requests
-from datetime import datetime, timedelta
-from zoneinfo import ZoneInfo
+from datetime import datetime, time as dtime, timedelta
 from typing import Optional, Dict, Any
 
-# CONFIG
-DEFAULT_TZ = ZoneInfo("Asia/Calcutta")
-GOOGLE_CAL_BASE = "https://www.googleapis.com/calendar/v3"
+import bulk
+import calendar_client
+import event_store
+import multi_calendar
+import slots
+import telemetry
+import token_cache
+
+# CONFIG (lives in calendar_client so the event cache can share it)
+from calendar_client import DEFAULT_TZ, TOKENINFO_URL
 
 # ... [Keep your validate_token, _headers, _request, and _ensure_rfc3339 functions exactly as they are] ...
 # (Copy them from your previous file or the blocks below)
 
-def validate_token(token: str) -> bool:
+async def validate_token(token: str) -> bool:
     if not token or not isinstance(token, str) or len(token.strip()) == 0: return False
     if not token.startswith("ya29."): return False
+    # Cached per token hash; concurrent checks of one token share a single tokeninfo call
+    with telemetry.span("validate_token") as s:
+        s["valid"] = await token_cache.cache.validate(token, _fetch_tokeninfo)
+    return s["valid"]
+
+async def _fetch_tokeninfo(token: str):
     try:
-        test_resp = requests.get("https://www.googleapis.com/oauth2/v1/tokeninfo", params={"access_token": token}, timeout=5)
-        if test_resp.status_code == 200 and "https://www.googleapis.com/auth/calendar" in test_resp.json().get("scope", ""): return True
+        test_resp = await calendar_client.get_client().get(TOKENINFO_URL, params={"access_token": token}, timeout=5)
+        if test_resp.status_code == 200:
+            info = test_resp.json()
+            if "https://www.googleapis.com/auth/calendar" in info.get("scope", ""):
+                # Honour Google's own expiry for the positive verdict
+                ttl = float(info.get("expires_in", 0)) - token_cache.EXPIRY_SKEW
+                return True, max(ttl, 0), info
+        # Rejected token (bad, expired, missing scope): short negative entry
+        return False, None, {}
     except: pass
-    return False
+    # Network trouble is not a verdict on the token, so don't cache it
+    return False, 0, {}
 
-def _headers(token: str):
-    return {"Authorization": f"Bearer {token}", "Content-Type": "application/json"}
-
-def _request(method: str, url: str, token: str, json_body: dict = None, params: dict = None):
-    try:
-        resp = requests.request(method, url, headers=_headers(token), json=json_body, params=params)
-        if 200 <= resp.status_code < 300:
-            if resp.text: return resp.json()
-            return {"status": "success"}
-        return {"error": resp.text}
-    except Exception as e: return {"error": str(e)}
+async def _request(method: str, url: str, token: str, json_body: dict = None, params: dict = None):
+    return await calendar_client.request(method, url, token, json_body=json_body, params=params)
 
 def _ensure_rfc3339(date_str: str) -> str:
     if not date_str: return date_str
@@ -41,37 +51,38 @@ def _ensure_rfc3339(date_str: str) -> str:
         if not date_str.endswith("Z") and "+" not in date_str: return f"{date_str}Z"
         return date_str
 
+def _event_line(e: Dict[str, Any], calendar_id: str, names: Dict[str, str]) -> str:
+    start_t = e.get("start", {}).get("dateTime", "") or e.get("start", {}).get("date", "")
+    summary = e.get("summary", "Untitled")
+    if calendar_id == "primary":
+        return f"- {start_t}: {summary} (ID: {e.get('id')})"
+    # The agent needs the calendar to change an event that isn't on the primary one
+    return f"- {start_t}: {summary} [{names.get(calendar_id, calendar_id)}] (ID: {e.get('id')}, calendar_id: {calendar_id})"
+
+def _unread_note(data: Dict[str, Any]) -> str:
+    errors = data.get("errors") or {}
+    if not errors: return ""
+    return f"\n(could not read: {', '.join(data['names'].get(cal, cal) for cal in errors)})"
+
 # 1. LIST EVENTS (UPDATED: Shows IDs)
-def list_events(user_token: str, days: int = 7) -> str:
+async def list_events(user_token: str, days: int = 7, calendars: list = None) -> str:
     start = datetime.now(DEFAULT_TZ)
     end = start + timedelta(days=days)
     
-    params = {
-        "timeMin": start.isoformat(),
-        "timeMax": end.isoformat(),
-        "singleEvents": "true",
-        "orderBy": "startTime"
-    }
-    
-    data = _request("GET", f"{GOOGLE_CAL_BASE}/calendars/primary/events", user_token, params=params)
+    # Served from the per-user event cache (synced incrementally with Google),
+    # all the user's visible calendars at once, merged by start time
+    data = await multi_calendar.list_window(user_token, start, end, calendars)
     
     if "error" in data: return f"Error listing events: {data['error']}"
     
-    items = data.get("items", [])
-    if not items: return "No upcoming events found."
-    
-    result = []
-    for e in items:
-        start_t = e.get("start", {}).get("dateTime", "") or e.get("start", {}).get("date", "")
-        summary = e.get("summary", "Untitled")
-        event_id = e.get("id") # <--- CAPTURE ID
-        # RETURN ID TO THE AI
-        result.append(f"- {start_t}: {summary} (ID: {event_id})")
+    # RETURN IDS TO THE AI
+    result = [_event_line(e, cal, data["names"]) for cal, e in data["items"]]
+    if not result: return "No upcoming events found." + _unread_note(data)
     
-    return "\n".join(result)
+    return "\n".join(result) + _unread_note(data)
 
 # 2. ADD EVENT (UPDATED: Returns ID)
-def add_event(user_token: str, summary: str, start_iso: str, end_iso: str, recurrence: str = None) -> str:
+async def add_event(user_token: str, summary: str, start_iso: str, end_iso: str, recurrence: str = None, calendar_id: str = "primary") -> str:
     safe_start = _ensure_rfc3339(start_iso)
     safe_end = _ensure_rfc3339(end_iso)
 
@@ -83,60 +94,103 @@ def add_event(user_token: str, summary: str, start_iso: str, end_iso: str, recur
     if recurrence:
         body["recurrence"] = [recurrence]
     
-    data = _request("POST", f"{GOOGLE_CAL_BASE}/calendars/primary/events", user_token, json_body=body)
+    data = await _request("POST", calendar_client.events_url(calendar_id), user_token, json_body=body)
     if "error" in data: return f"Error adding event: {data['error']}"
+    await event_store.record_upsert(user_token, data, calendar_id)
     
     # <--- RETURN ID SO AI KNOWS IT IMMEDIATELY
     return f"Event created. ID: {data.get('id')} | Link: {data.get('htmlLink')}"
 
 # 3. UPDATE EVENT
-def update_event(user_token: str, event_id: str, summary: str = None, start_iso: str = None, end_iso: str = None) -> str:
+async def update_event(user_token: str, event_id: str, summary: str = None, start_iso: str = None, end_iso: str = None, calendar_id: str = "primary") -> str:
     body = {}
     if summary: body["summary"] = summary
     if start_iso: body["start"] = {"dateTime": _ensure_rfc3339(start_iso), "timeZone": str(DEFAULT_TZ)}
     if end_iso: body["end"] = {"dateTime": _ensure_rfc3339(end_iso), "timeZone": str(DEFAULT_TZ)}
     
-    data = _request("PATCH", f"{GOOGLE_CAL_BASE}/calendars/primary/events/{event_id}", user_token, json_body=body)
+    data = await _request("PATCH", f"{calendar_client.events_url(calendar_id)}/{event_id}", user_token, json_body=body)
     if "error" in data: return f"Error updating event: {data['error']}"
+    await event_store.record_upsert(user_token, data, calendar_id)
     return "Event updated successfully."
 
 # 4. DELETE EVENT
-def delete_event(user_token: str, event_id: str) -> str:
-    data = _request("DELETE", f"{GOOGLE_CAL_BASE}/calendars/primary/events/{event_id}", user_token)
+async def delete_event(user_token: str, event_id: str, calendar_id: str = "primary") -> str:
+    data = await _request("DELETE", f"{calendar_client.events_url(calendar_id)}/{event_id}", user_token)
     if "error" in data: 
         # Help the AI understand 404
         if "404" in str(data) or "Not Found" in str(data):
-            return "Error: Event not found. Please list events to get the correct ID."
+            return "Error: Event not found. Please look it up again (find_event) to get the correct ID."
         return f"Error deleting event: {data['error']}"
+    await event_store.record_delete(user_token, event_id, calendar_id)
     return "Event deleted successfully."
 
-# 5. RESCHEDULE EVENT
-def reschedule_event(user_token: str, old_event_id: str, new_summary: str, new_start_iso: str, new_end_iso: str) -> str:
-    # Delete the old event
-    delete_response = delete_event(user_token, old_event_id)
-    if "Error" in delete_response:
-        return f"Failed to reschedule: {delete_response}"
+# 5. RESCHEDULE EVENT (single conditional PATCH: keeps attendees, recurrence, description)
+async def reschedule_event(user_token: str, old_event_id: str, new_summary: str = None, new_start_iso: str = None, new_end_iso: str = None, dry_run: bool = False, calendar_id: str = "primary") -> str:
+    url = f"{calendar_client.events_url(calendar_id)}/{old_event_id}"
+
+    # Current version: from the event cache when we have it, otherwise one GET
+    current = event_store.cached_event(user_token, old_event_id, calendar_id)
+    if current is None:
+        current = await _request("GET", url, user_token, params={"fields": calendar_client.EVENT_FIELDS})
+        if "error" in current:
+            if current.get("status") == 404:
+                return "Error: Event not found. Please look it up again (find_event) to get the correct ID."
+            return f"Failed to reschedule: {current['error']}"
 
-    # Add the new event
-    add_response = add_event(user_token, new_summary, new_start_iso, new_end_iso)
-    if "Error" in add_response:
-        return f"Deleted old event but failed to create new one: {add_response}"
+    body = {}
+    if new_summary and new_summary != current.get("summary"):
+        body["summary"] = new_summary
+    if new_start_iso:
+        new_start = datetime.fromisoformat(_ensure_rfc3339(new_start_iso).replace("Z", "+00:00"))
+        if new_end_iso:
+            new_end = datetime.fromisoformat(_ensure_rfc3339(new_end_iso).replace("Z", "+00:00"))
+        else:
+            # Only a new start: keep the original duration
+            bounds = event_store.event_bounds(current)
+            new_end = new_start + timedelta(seconds=(bounds[1] - bounds[0]) if bounds else 3600)
+        body["start"] = {"dateTime": new_start.isoformat(), "timeZone": str(DEFAULT_TZ)}
+        body["end"] = {"dateTime": new_end.isoformat(), "timeZone": str(DEFAULT_TZ)}
+    elif new_end_iso:
+        body["end"] = {"dateTime": _ensure_rfc3339(new_end_iso), "timeZone": str(DEFAULT_TZ)}
+    if not body:
+        return "Nothing to change: give a new start/end time or title."
 
-    return "Event rescheduled successfully."
+    diff = []
+    if "summary" in body: diff.append(f"title '{current.get('summary', 'Untitled')}' -> '{body['summary']}'")
+    for key in ("start", "end"):
+        if key in body:
+            old = current.get(key, {}).get("dateTime") or current.get(key, {}).get("date")
+            diff.append(f"{key} {old} -> {body[key]['dateTime']}")
+    if dry_run:
+        return f"Preview (nothing saved) for {current.get('summary', 'Untitled')} (ID: {old_event_id}): " + "; ".join(diff)
+
+    # If-Match: only apply if nobody changed the event since we read it
+    headers = {"If-Match": current["etag"]} if current.get("etag") else None
+    data = await calendar_client.request("PATCH", url, user_token, json_body=body, headers=headers)
+    if "error" in data:
+        if data.get("status") == 412:
+            store = event_store.stores.peek(user_token, calendar_id)
+            if store is not None: store.invalidate()
+            return "Error: The event was changed elsewhere since it was read. List it again and retry."
+        if data.get("status") == 404:
+            return "Error: Event not found. Please look it up again (find_event) to get the correct ID."
+        return f"Failed to reschedule: {data['error']}"
+    await event_store.record_upsert(user_token, data, calendar_id)
+
+    return "Event rescheduled successfully: " + "; ".join(diff)
 
 # 6. DELETE EVENTS IN RANGE
-def delete_events_in_range(user_token: str, start_date: str, end_date: str) -> str:
+async def delete_events_in_range(user_token: str, start_date: str, end_date: str, calendar_id: str = "primary") -> str:
     valid_start = _ensure_rfc3339(start_date)
     valid_end = _ensure_rfc3339(end_date)
     
-    params = {
-        "timeMin": valid_start,
-        "timeMax": valid_end,
-        "singleEvents": "true",
-        "orderBy": "startTime"
-    }
+    try:
+        window_start = datetime.fromisoformat(valid_start.replace("Z", "+00:00"))
+        window_end = datetime.fromisoformat(valid_end.replace("Z", "+00:00"))
+    except ValueError:
+        return f"Error: Google rejected dates. Tried: {valid_start} to {valid_end}"
 
-    data = _request("GET", f"{GOOGLE_CAL_BASE}/calendars/primary/events", user_token, params=params)
+    data = await event_store.list_window(user_token, window_start, window_end, calendar_id)
 
     if "error" in data:
         if "Bad Request" in str(data):
@@ -146,9 +200,85 @@ def delete_events_in_range(user_token: str, start_date: str, end_date: str) -> s
     items = data.get("items", [])
     if not items: return "No events found in range."
 
-    count = 0
-    for event in items:
-        if delete_event(user_token, event.get("id")) == "Event deleted successfully.":
-            count += 1
-            
-    return f"Deleted {count} events."
\ No newline at end of file
+    # One bulk request per 50 events instead of one round trip each
+    results = await bulk.delete_events(user_token, [event.get("id") for event in items], calendar_id)
+    count = sum(1 for r in results if r["ok"])
+    failed = [f"{items[r['index']].get('summary', 'Untitled')} ({r['status']})" for r in results if not r["ok"]]
+
+    if failed:
+        return f"Deleted {count} events. Failed to delete {len(failed)}: {', '.join(failed[:10])}"
+    return f"Deleted {count} events."
+
+def _clock(hhmm: str):
+    hour, minute = hhmm.split(":")
+    return dtime(int(hour), int(minute))
+
+def _local(iso: str, tz) -> datetime:
+    # fromisoformat only takes a trailing "Z" from 3.11 on; a naive time is the user's wall clock
+    dt = datetime.fromisoformat(iso.strip().replace("Z", "+00:00"))
+    return dt if dt.tzinfo else dt.replace(tzinfo=tz)
+
+# 7. FIND BEST SLOT (deterministic: one freeBusy call or the event cache, no LLM guessing)
+async def find_best_slot(user_token: str, duration_minutes: int, deadline: str = None, after_time: str = None, top_n: int = 3,
+                         work_start: str = "09:00", work_end: str = "18:00", lunch: str = "13:00-14:00",
+                         buffer_minutes: int = 10, max_events_per_day: int = None, calendars: list = None, tz=None) -> str:
+    tz = tz or DEFAULT_TZ   # the user's zone: working hours, lunch and the daily cap are local wall-clock rules
+    now = datetime.now(tz)
+    try:
+        start = max(_local(after_time, tz), now) if after_time else now
+        end = _local(deadline, tz) if deadline else start + timedelta(days=7)
+    except ValueError:
+        return f"Error: could not read the dates {after_time} / {deadline}."
+    if end <= start: return "Error: the deadline is before the earliest allowed start."
+
+    calendars = calendars or list(await multi_calendar.selected(user_token))
+    data = await slots.busy_intervals(user_token, start, end, calendars)
+    if len(data["errors"]) >= len(calendars):
+        return f"Error checking availability: {'; '.join(data['errors'].values())}"
+
+    masks = [slots.working_hours(_clock(work_start), _clock(work_end), tz)]
+    if lunch:
+        lunch_start, lunch_end = lunch.split("-")
+        masks.append(slots.daily_block(_clock(lunch_start), _clock(lunch_end), tz))
+    if buffer_minutes: masks.append(slots.buffer(int(buffer_minutes)))
+    if max_events_per_day: masks.append(slots.daily_cap(int(max_events_per_day), tz))
+
+    free = slots.free_intervals(start.timestamp(), end.timestamp(), data["busy"], masks)
+    found = slots.best_slots(free, int(duration_minutes) * 60, int(top_n))
+    if not found: return "No free slot fits before the deadline within working hours."
+
+    lines = [f"- {datetime.fromtimestamp(a, tz).isoformat()} to {datetime.fromtimestamp(b, tz).isoformat()}" for a, b in found]
+    note = f" (could not read: {', '.join(data['errors'])})" if data["errors"] else ""
+    return "Best free slots:\n" + "\n".join(lines) + note
+
+# 8. CHECK AVAILABILITY
+async def check_availability(user_token: str, start_iso: str, end_iso: str, calendars: list = None, tz=None) -> str:
+    tz = tz or DEFAULT_TZ
+    try:
+        start, end = _local(start_iso, tz), _local(end_iso, tz)
+    except ValueError:
+        return f"Error: could not read the dates {start_iso} / {end_iso}."
+    calendars = calendars or list(await multi_calendar.selected(user_token))
+    data = await slots.busy_intervals(user_token, start, end, calendars)
+    if len(data["errors"]) >= len(calendars):
+        return f"Error checking availability: {'; '.join(data['errors'].values())}"
+    clashes = slots.overlapping(data["busy"], start.timestamp(), end.timestamp())
+    if not clashes: return "Free: nothing is scheduled in that window."
+    lines = [f"- {datetime.fromtimestamp(a, tz).isoformat()} to {datetime.fromtimestamp(b, tz).isoformat()}" for a, b in clashes]
+    return "Busy during:\n" + "\n".join(lines)
+
+# 9. FIND EVENT (title search on the local event copy: no listing, no Google call while it's fresh)
+async def find_event(user_token: str, query: str, start_iso: str = None, end_iso: str = None, limit: int = 5, calendars: list = None) -> str:
+    try:
+        window_start = datetime.fromisoformat(_ensure_rfc3339(start_iso).replace("Z", "+00:00")) if start_iso else None
+        window_end = datetime.fromisoformat(_ensure_rfc3339(end_iso).replace("Z", "+00:00")) if end_iso else None
+    except ValueError:
+        return f"Error: could not read the dates {start_iso} / {end_iso}."
+
+    data = await multi_calendar.find(user_token, query, window_start, window_end, int(limit), calendars)
+    if "error" in data: return f"Error searching events: {data['error']}"
+
+    result = [_event_line(e, cal, data["names"]) for cal, e in data["items"]]
+    if not result:
+        return f"No event matches '{query}'. Try other words from the title, or list_events." + _unread_note(data)
+    return "\n".join(result) + _unread_note(data)
@@ -0,0 +1,128 @@
+import asyncio
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from functools import lru_cache
+from typing import Any, Dict, List, Optional, Tuple
+from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
+
+import multi_calendar
+import token_cache
+import watch
+from calendar_client import DEFAULT_TZ
+
+# The dashboard's "next 5 days" list across the user's calendars, prepared
+# once per change. Each (timezone, day) view is built from the local event
+# copies and kept with a strong ETag (hash of the body), keyed by the
+# calendars' revisions, so a poll with a matching If-None-Match is a dict
+# lookup and a 304.
+DAYS = 5                                                         # today + the next 4
+LONG_POLL_MAX = float(os.getenv("UPCOMING_LONG_POLL_MAX", "30"))  # cap on ?wait=
+RECHECK = 5.0  # seconds between re-syncs while a long-poll waits (other workers' writes, no push)
+MAX_VIEWS = 2048
+
+stats = {"built": 0, "not_modified": 0, "long_polls": 0}
+
+_views: "OrderedDict[Tuple, Tuple[str, bytes]]" = OrderedDict()
+_lock = threading.Lock()
+
+@lru_cache(maxsize=256)
+def zone(name: Optional[str]) -> ZoneInfo:
+    try:
+        return ZoneInfo(name) if name else DEFAULT_TZ
+    except (ZoneInfoNotFoundError, ValueError):
+        return DEFAULT_TZ
+
+def build(calendars: Dict[str, Any], tz: ZoneInfo, today) -> Tuple[str, bytes]:
+    """(etag, JSON body) of the upcoming list for `today` in `tz`, from multi_calendar.sync() output."""
+    start = datetime(today.year, today.month, today.day, tzinfo=tz)
+    lo, hi = start.timestamp(), (start + timedelta(days=DAYS)).timestamp()
+    windows = {cal: (store, store.window(lo, hi)) for cal, store in calendars["stores"].items()}
+    names = calendars["names"]
+    formatted = []
+    for cal, event in multi_calendar.merge(windows):
+        # Skip cancelled and all-day events
+        if event.get("status") == "cancelled" or not event.get("start", {}).get("dateTime"):
+            continue
+        bounds = windows[cal][0].bounds_of(event["id"])
+        dt_start, dt_end = datetime.fromtimestamp(bounds[0], tz), datetime.fromtimestamp(bounds[1], tz)
+        day_diff = (dt_start.date() - today).days
+        if day_diff < 0 or day_diff >= DAYS: continue
+        if day_diff == 0: date_label = "Today"
+        elif day_diff == 1: date_label = "Tomorrow"
+        else: date_label = dt_start.strftime("%a, %b %d")  # e.g. "Mon, Jan 20"
+        summary = event.get("summary", "No Title")
+        formatted.append({
+            "id": event.get("id"),
+            "title": summary,
+            "start_time": dt_start.strftime("%I:%M %p"),  # e.g. "02:00 PM"
+            "end_time": dt_end.strftime("%I:%M %p"),
+            "date_label": date_label,
+            "is_urgent": "deadline" in summary.lower(),
+            "calendar": names.get(cal, cal),
+        })
+    payload = {"upcoming": formatted}
+    # Calendars that couldn't be read this time; the list has the rest
+    if calendars["errors"]: payload["errors"] = {names.get(cal, cal): err for cal, err in calendars["errors"].items()}
+    body = json.dumps(payload).encode("utf-8")
+    stats["built"] += 1
+    return f'"{hashlib.sha256(body).hexdigest()[:32]}"', body
+
+def view(token: str, calendars: Dict[str, Any], tz_name: Optional[str]) -> Tuple[str, bytes]:
+    tz = zone(tz_name)
+    today = datetime.now(tz).date()
+    # Revisions are unique per process (event_store), so this key changes whenever any calendar does
+    key = (token_cache.user_key(token), tz.key, today,
+           tuple((cal, store.revision) for cal, store in calendars["stores"].items()), tuple(calendars["errors"]))
+    with _lock:
+        hit = _views.get(key)
+        if hit is not None:
+            _views.move_to_end(key)
+            return hit
+    value = build(calendars, tz, today)
+    with _lock:
+        _views[key] = value
+        while len(_views) > MAX_VIEWS: _views.popitem(last=False)
+    return value
+
+async def current(token: str, tz_name: Optional[str]) -> Tuple[Optional[str], bytes, List]:
+    """(etag, body, stores) after making sure the copies are fresh; etag None if no calendar could be read."""
+    calendars = await multi_calendar.sync(token)
+    stores = list(calendars["stores"].values())
+    if not stores:
+        print(f"Google API Error: {'; '.join(calendars['errors'].values())}")
+        return None, json.dumps({"upcoming": []}).encode("utf-8"), stores
+    etag, body = view(token, calendars, tz_name)
+    return etag, body, stores
+
+def matches(etag: Optional[str], if_none_match: Optional[str]) -> bool:
+    # If-None-Match may list several tags, and weak comparison applies to GET
+    if not etag or not if_none_match: return False
+    if if_none_match.strip() == "*": return True
+    return etag in (t.strip().removeprefix("W/") for t in if_none_match.split(","))
+
+async def poll(token: str, tz_name: Optional[str], if_none_match: Optional[str], wait: float = 0) -> Tuple[Optional[str], Optional[bytes]]:
+    """(etag, body); body None means "not modified" (304).
+
+    With `wait` > 0 and a matching If-None-Match, holds the request until the
+    list changes (a write through the tools, a push notification, or a sync
+    that finds something) or `wait` seconds pass.
+    """
+    etag, body, stores = await current(token, tz_name)
+    if not matches(etag, if_none_match):
+        return etag, body
+    # A client polling with a tag will keep polling: worth push channels (no-op unless configured)
+    await asyncio.gather(*(watch.ensure(token, store) for store in stores))
+    deadline = time.monotonic() + min(max(wait, 0.0), LONG_POLL_MAX)
+    if wait > 0: stats["long_polls"] += 1
+    while (left := deadline - time.monotonic()) > 0:
+        await multi_calendar.wait_any(stores, min(left, RECHECK))
+        etag, body, stores = await current(token, tz_name)
+        if not matches(etag, if_none_match):
+            return etag, body
+    stats["not_modified"] += 1
+    return etag, None
@@ -0,0 +1,70 @@
+import hashlib
+import hmac
+import os
+import secrets
+import time
+import uuid
+from typing import Optional
+
+import calendar_client
+import event_store
+import token_cache
+from event_store import EventStore
+
+# Google push notifications (events.watch): Google POSTs to our webhook when a
+# watched calendar changes, so the event cache can trust its copy for
+# PUSH_SYNC_TTL instead of re-syncing every SYNC_TTL, and long-polls on
+# /events/upcoming wake up as soon as something changed.
+# Google only delivers to a public HTTPS address; unset = no channels.
+WEBHOOK_URL = os.getenv("CALENDAR_WEBHOOK_URL")
+CHANNEL_TTL = int(os.getenv("CALENDAR_WATCH_TTL", "3600"))    # seconds requested per channel
+RENEW_BEFORE = 60.0          # renew a channel this long before it expires
+RETRY_AFTER = 300.0          # after a failed registration, poll as usual for this long
+# Signs channel tokens, so any worker can check a notification without a lookup.
+# Set it when running several workers; the default only holds for one process.
+SECRET = (os.getenv("CALENDAR_WEBHOOK_SECRET") or secrets.token_hex(32)).encode("utf-8")
+
+stats = {"registered": 0, "failed": 0, "notifications": 0, "rejected": 0}
+
+def _sign(channel_id: str, user: str, calendar_id: str) -> str:
+    return hmac.new(SECRET, f"{channel_id}|{user}|{calendar_id}".encode("utf-8"), hashlib.sha256).hexdigest()[:32]
+
+def channel_token(channel_id: str, user: str, calendar_id: str) -> str:
+    # Echoed back by Google in X-Goog-Channel-Token (max 256 chars)
+    return f"{user}|{calendar_id}|{_sign(channel_id, user, calendar_id)}"
+
+async def ensure(token: str, store: EventStore):
+    """Open (or renew) a watch channel for this calendar if push is configured."""
+    now = time.monotonic()
+    if not WEBHOOK_URL or store.push_until - RENEW_BEFORE > now: return
+    if store.watch_retry_at > now: return
+    store.watch_retry_at = now + RETRY_AFTER   # also keeps concurrent polls from registering twice
+    user = token_cache.user_key(token)
+    channel_id = uuid.uuid4().hex
+    data = await calendar_client.request(
+        "POST", f"{calendar_client.events_url(store.calendar_id)}/watch", token,
+        json_body={"id": channel_id, "type": "web_hook", "address": WEBHOOK_URL,
+                   "token": channel_token(channel_id, user, store.calendar_id), "params": {"ttl": str(CHANNEL_TTL)}})
+    if "error" in data:
+        stats["failed"] += 1
+        print(f"Watch channel failed: {data['error']}")
+        return
+    stats["registered"] += 1
+    expires_in = int(data.get("expiration", 0)) / 1000 - time.time() if data.get("expiration") else CHANNEL_TTL
+    store.push_until = time.monotonic() + expires_in
+    store.watch_retry_at = 0.0
+
+async def notify(channel_id: Optional[str], channel_token_header: Optional[str], state: Optional[str]) -> bool:
+    """Handle one webhook delivery. False if it isn't from a channel we opened."""
+    try:
+        user, calendar_id, sig = (channel_token_header or "").rsplit("|", 2)
+    except ValueError:
+        stats["rejected"] += 1
+        return False
+    if not channel_id or not hmac.compare_digest(sig, _sign(channel_id, user, calendar_id)):
+        stats["rejected"] += 1
+        return False
+    stats["notifications"] += 1
+    # "sync" is the handshake sent when the channel opens; anything else means changes
+    if state != "sync": await event_store.mark_stale(user, calendar_id)
+    return True